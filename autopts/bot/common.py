@@ -17,6 +17,7 @@ import copy
 import datetime
 import importlib
 import logging
+import multiprocessing
 import os
 import subprocess
 import sys
@@ -27,24 +28,34 @@ import traceback
 from pathlib import Path
 from argparse import Namespace
 from autopts import client as autoptsclient
-from autopts.bot.common_features import github, report, mail, google_drive
+from autopts.bot.common_features import build_cache, github, report, mail, google_drive, log_archiver
 from autopts.client import CliParser, Client, TestCaseRunStats, init_logging
 from autopts.config import MAX_SERVER_RESTART_TIME, AUTOPTS_ROOT_DIR, generate_file_paths
-from autopts.ptsprojects.boards import get_free_device, get_tty, get_debugger_snr, release_device
-from autopts.ptsprojects.testcase_db import DATABASE_FILE
+from autopts.ptsprojects.boards import get_free_device, get_tty, get_debugger_snr, release_device, \
+    get_flash, get_build_dirs
+from autopts.ptsprojects.testcase_db import DATABASE_FILE, TestCaseTable
+from autopts.ptsprojects.workspace_index import load_test_case_index
+from autopts.pybtp.iutctl_common import BTP_LOG_TEXT
+from autopts.utils import PrefixTrie
 
 log = logging.debug
 
 
-def get_deepest_dirs(logs_tree, dst_tree, max_depth):
+def get_deepest_dirs(logs_tree, dst_tree, max_depth, archives=False):
+    """Moves directories at max_depth of logs_tree to dst_tree
+
+    archives -- move also zip files at max_depth
+    """
     def recursive(directory, depth=3):
         depth -= 1
 
         for file in os.scandir(directory):
-            if file.is_dir():
+            is_archive = archives and depth <= 0 and file.is_file() and file.name.endswith('.zip')
+            if file.is_dir() or is_archive:
                 if depth > 0:
                     recursive(file.path, depth)
                 else:
+                    os.makedirs(dst_tree, exist_ok=True)
                     dst_file = os.path.join(dst_tree, file.name)
                     try:
                         shutil.move(file.path, dst_file)
@@ -116,11 +127,28 @@ class BotConfigArgs(Namespace):
         self.cron_optim = args.get('cron_optim', False)
         self.project_repos = args.get('repos', None)
         self.test_case_limit = args.get('test_case_limit', 0)
+        self.schedule = args.get('schedule', False)
+        self.time_budget = args.get('time_budget', 0)
         self.simple_mode = args.get('simple_mode', False)
         self.server_args = args.get('server_args', None)
         self.pylink_reset = args.get('pylink_reset', False)
+        self.btp_log = args.get('btp_log', BTP_LOG_TEXT)
         self.max_server_restart_time = args.get('max_server_restart_time', MAX_SERVER_RESTART_TIME)
         self.use_backup = args.get('use_backup', False)
+        self.build_cache_dir = args.get('build_cache_dir', None)
+        self.build_cache_size = args.get('build_cache_size', build_cache.DEFAULT_MAX_SIZE)
+        # List of dicts overriding this config for each IUT and PTS pair
+        self.shards = args.get('shards', [])
+        # (index, count) of the shard run by a worker process
+        self.shard = args.get('shard', None)
+        # Compress test case logs in background as soon as a test case ends
+        self.archive_logs = args.get('archive_logs', False)
+        self.archive_compression = args.get('archive_compression', 'deflate')
+        self.archive_compresslevel = args.get('archive_compresslevel', None)
+        # Test case list created with tools/cron/cache_testcases.py, to
+        # filter test cases offline instead of asking the PTS
+        self.test_case_list_file = args.get('test_case_list_file', None)
+        self.workspace_index_file = args.get('workspace_index_file', None)
 
         if self.ykush or self.active_hub_server:
             self.usb_replug_available = True
@@ -161,6 +189,8 @@ class BotClient(Client):
                        'create': False,
                        'all_stats': None,
                        'tc_stats': None}
+        # Archives test case logs during the test run, if enabled
+        self.log_archiver = None
 
     def parse_or_find_tty(self, args):
         if args.tty_alias:
@@ -262,7 +292,31 @@ class BotClient(Client):
         if errmsg:
             return errmsg
 
-        if self.args.use_backup and os.path.exists(self.file_paths['BOT_STATE_JSON_FILE']):
+        if self.args.shards:
+            cli_ports = [tuple(shard.get('cli_port', self.args.cli_port))
+                         for shard in self.args.shards]
+            if len(set(cli_ports)) != len(cli_ports):
+                return 'Each of the shards has to use different cli_port'
+
+            if not self.args.no_build:
+                # Shards build and flash their configs in parallel
+                project_paths = [os.path.abspath(shard.get('project_path', self.args.project_path))
+                                 for shard in self.args.shards]
+                if len(set(project_paths)) != len(project_paths):
+                    return 'Each of the shards has to use different project_path, ' \
+                           'unless the build is disabled with no_build'
+
+            if self.args.use_backup:
+                return 'Resuming a terminated run with use_backup is not supported with shards'
+
+        if self.args.archive_compression not in log_archiver.COMPRESSION_METHODS:
+            return f'Unsupported archive_compression {self.args.archive_compression}, ' \
+                   f'supported: {", ".join(log_archiver.COMPRESSION_METHODS)}'
+
+        if self.args.shard:
+            # Cleanup has been done by the process that started the shards
+            pass
+        elif self.args.use_backup and os.path.exists(self.file_paths['BOT_STATE_JSON_FILE']):
             self.load_backup_of_previous_run()
         else:
             self.bot_pre_cleanup()
@@ -277,6 +331,48 @@ class BotClient(Client):
     def apply_config(self, args, config, value):
         pass
 
+    def cached_build_and_flash(self, args, board_type, overlays, build_and_flash, *build_args):
+        """Build and flash the IUT, or only flash if the same build is cached
+
+        overlays -- ordered list of (name, content) tuples of the build
+                    configuration, content is bytes
+        build_args -- arguments of build_and_flash
+        """
+        flash = get_flash(args.board_name)
+        build_dirs = get_build_dirs(args.board_name)
+        cache = None
+        key = None
+
+        if args.build_cache_dir and flash and build_dirs:
+            repos_heads = build_cache.get_repos_heads(args.project_path,
+                                                      self.bot_config.get('git'))
+            if repos_heads is None:
+                log('Sources differ from HEAD, build cache not used')
+            else:
+                cache = build_cache.BuildCache(args.build_cache_dir,
+                                               args.build_cache_size)
+                key = build_cache.make_key(repos_heads, board_type, overlays,
+                                           build_cache.get_toolchain())
+
+        if cache:
+            try:
+                if cache.restore(key, args.project_path, build_dirs):
+                    log(f'Flashing cached build {key}')
+                    flash(args.project_path, board_type, args.debugger_snr)
+                    return
+            except OSError as e:
+                logging.exception(e)
+
+        build_and_flash(*build_args)
+
+        if cache:
+            try:
+                cache.store(key, args.project_path, build_dirs,
+                            info={'board': board_type,
+                                  'overlays': [name for name, _ in overlays]})
+            except OSError as e:
+                logging.exception(e)
+
     def bot_pre_cleanup(self):
         """Perform cleanup before test run
         :return: None
@@ -294,6 +390,8 @@ class BotClient(Client):
         files_to_save = [
             self.file_paths['ALL_STATS_RESULTS_XML_FILE'],
             self.file_paths['TC_STATS_RESULTS_XML_FILE'],
+            self.file_paths['ALL_STATS_RESULTS_JSONL_FILE'],
+            self.file_paths['TC_STATS_RESULTS_JSONL_FILE'],
             self.file_paths['TEST_CASES_JSON_FILE'],
             self.file_paths['ALL_STATS_JSON_FILE'],
             self.file_paths['TC_STATS_JSON_FILE'],
@@ -303,6 +401,17 @@ class BotClient(Client):
         save_dir = self.file_paths['BOT_STATE_DIR']
         save_files(files_to_save, save_dir)
 
+    def get_test_case_source(self):
+        """Returns the offline index of the workspace if test case list file
+        is configured, otherwise the PTS
+        """
+        if not self.args.test_case_list_file:
+            return self.ptses[0]
+
+        return load_test_case_index(self.args.workspace,
+                                    self.args.test_case_list_file,
+                                    self.args.workspace_index_file)
+
     def _yield_next_config(self):
         limit_counter = 0
 
@@ -315,7 +424,20 @@ class BotClient(Client):
             run_order = self.backup['run_order']
         else:
             _run_order, _args = get_filtered_test_cases(self.iut_config, self.args,
-                                                        self.config_default, self.ptses[0])
+                                                        self.config_default,
+                                                        self.get_test_case_source())
+
+            schedule = self.args.schedule and self.test_case_database
+            if self.args.schedule and not schedule:
+                log('Scheduling requires the test case database (store)')
+
+            if schedule:
+                _run_order = self._schedule_configs(_run_order, _args)
+
+            time_left = self.args.time_budget
+            if self.args.shard:
+                # The budget is wall-clock time, the shards run in parallel
+                time_left *= self.args.shard[1]
 
             run_order = []
             test_cases = {}
@@ -329,17 +451,43 @@ class BotClient(Client):
                     log(f'No test cases for {config} config, ignored.')
                     continue
 
+                limit = 0
                 if self.args.test_case_limit:
                     limit = self.args.test_case_limit - limit_counter
                     if limit == 0:
                         log(f'Limit of test cases reached. No more test cases will be run.')
                         break
 
-                    if test_case_number > limit:
-                        _args[config].test_cases = _args[config].test_cases[:limit]
-                        test_case_number = limit
+                if schedule:
+                    if self.args.time_budget and time_left <= 0:
+                        log(f'Time budget used up. No more test cases will be run.')
+                        break
+
+                    run_count_max = _args[config].retry + 1
+                    _args[config].test_cases = autoptsclient.schedule_test_cases(
+                        _args[config].test_cases, self.test_case_database,
+                        run_count_max, limit, time_left)
+                    test_case_number = len(_args[config].test_cases)
+
+                    if test_case_number == 0:
+                        log(f'No test cases of {config} config fit in the time budget, ignored.')
+                        continue
+
+                    time_left -= self.test_case_database.estimate_session_duration(
+                        _args[config].test_cases, run_count_max)
 
-                    limit_counter += test_case_number
+                elif limit and test_case_number > limit:
+                    _args[config].test_cases = _args[config].test_cases[:limit]
+                    test_case_number = limit
+
+                limit_counter += test_case_number
+
+                if self.args.shard:
+                    _args[config].test_cases = self._get_shard_test_cases(_args[config])
+
+                    if not _args[config].test_cases:
+                        log(f'No test cases of {config} config in this shard, ignored.')
+                        continue
 
                 test_cases[config] = _args[config].test_cases
                 run_order.append(config)
@@ -351,6 +499,29 @@ class BotClient(Client):
         for config in run_order:
             yield config, _args[config]
 
+    def _schedule_configs(self, run_order, args_per_config):
+        """Order configs by the number of test cases that failed last time"""
+        def failures(config):
+            config_args = args_per_config.get(config)
+            if config_args is None:
+                return 0
+
+            results = self.test_case_database.get_results(config_args.test_cases)
+            return sum(1 for result in results.values() if result != 'PASS')
+
+        return sorted(run_order, key=failures, reverse=True)
+
+    def _get_shard_test_cases(self, config_args):
+        """Returns the part of config test cases run by this shard"""
+        index, count = self.args.shard
+        durations = None
+
+        if self.test_case_database:
+            durations = self.test_case_database.estimate_test_case_durations(
+                config_args.test_cases, config_args.retry + 1)
+
+        return autoptsclient.shard_test_cases(config_args.test_cases, count, durations)[index]
+
     def _backup_tc_stats(self, config=None, test_case=None, stats=None, **kwargs):
         if not self.backup or not stats:
             return
@@ -359,11 +530,20 @@ class BotClient(Client):
         stats.pending_test_case = test_case
         stats.save_to_backup(self.file_paths['TC_STATS_JSON_FILE'])
 
+    def _make_log_archiver(self):
+        return log_archiver.LogArchiver(self.args.archive_compression,
+                                        self.args.archive_compresslevel)
+
+    def _archive_tc_logs(self, log_dir=None, **kwargs):
+        if self.log_archiver:
+            self.log_archiver.submit(log_dir)
+
     def _merge_stats(self, all_stats, stats):
         all_stats.merge(stats)
 
-        if os.path.exists(stats.xml_results):
-            os.remove(stats.xml_results)
+        for file in (stats.xml_results, stats.journal):
+            if file and os.path.exists(file):
+                os.remove(file)
 
         if os.path.exists(self.file_paths['TC_STATS_JSON_FILE']):
             os.remove(self.file_paths['TC_STATS_JSON_FILE'])
@@ -379,7 +559,10 @@ class BotClient(Client):
             if self.args.use_backup:
                 all_stats.save_to_backup(self.file_paths['ALL_STATS_JSON_FILE'])
 
-        projects = self.ptses[0].get_project_list()
+        projects = self.get_test_case_source().get_project_list()
+
+        if self.args.archive_logs:
+            self.log_archiver = self._make_log_archiver()
 
         for config, config_args in self._yield_next_config():
             try:
@@ -402,6 +585,7 @@ class BotClient(Client):
                                                      stats,
                                                      config=config,
                                                      pre_test_case_fn=self._backup_tc_stats,
+                                                     post_test_case_fn=self._archive_tc_logs,
                                                      file_paths=copy.deepcopy(self.file_paths))
 
             except BuildAndFlashException:
@@ -420,6 +604,12 @@ class BotClient(Client):
 
         # End of bot run - all test cases completed
 
+        if self.log_archiver:
+            self.log_archiver.shutdown()
+            self.log_archiver = None
+
+        all_stats.write_xml()
+
         if all_stats.num_test_cases == 0:
             print(f'\nNo test cases were run. Please verify your config.\n')
             return all_stats
@@ -454,6 +644,8 @@ class BotClient(Client):
         except BaseException as e:
             log(f'Failed to generate some stats, {e}.')
 
+        all_stats.write_xml()
+
         return all_stats
 
     def start(self, args=None):
@@ -534,6 +726,13 @@ class BotClient(Client):
                                     self.file_paths['TMP_DIR'],
                                     self.file_paths['PTS_XMLS_DIR'])
 
+        # Indexed once for all the reports and the mail
+        report_data['report_model'] = report.ReportModel(report_data['tc_results'],
+                                                         report_data['regressions'],
+                                                         report_data['progresses'],
+                                                         report_data['descriptions'],
+                                                         report_data['pts_xml_folder'])
+
         report.make_report_xlsx(self.file_paths['REPORT_XLSX_FILE'],
                                 report_data['tc_results'],
                                 report_data['status_count'],
@@ -541,14 +740,16 @@ class BotClient(Client):
                                 report_data['progresses'],
                                 report_data['descriptions'],
                                 report_data['pts_xml_folder'],
-                                report_data['errata'])
+                                report_data['errata'],
+                                model=report_data['report_model'])
 
         report.make_report_txt(self.file_paths['REPORT_TXT_FILE'],
                                report_data['tc_results'],
                                report_data['regressions'],
                                report_data['progresses'],
                                report_data['repo_status'],
-                               report_data['errata'])
+                               report_data['errata'],
+                               model=report_data['report_model'])
 
         if 'githubdrive' in self.bot_config or 'gdrive' in self.bot_config:
             self.make_report_folder(report_data)
@@ -567,14 +768,172 @@ class BotClient(Client):
         print("Done")
 
     def run_tests(self):
+        if self.args.shards:
+            return self.run_shards()
+
         # Entry point of the simple client layer
         return super().start()
 
+    def _make_shard_config(self, index, tty_file, debugger_snr):
+        """Returns bot config of a shard worker process"""
+        shard_tmp_dir = os.path.join(self.file_paths['TMP_DIR'], f'shard_{index}')
+        os.makedirs(shard_tmp_dir, exist_ok=True)
+
+        auto_pts = copy.deepcopy(self.bot_config['auto_pts'])
+        del auto_pts['shards']
+        auto_pts.update(self.args.shards[index])
+        auto_pts['shard'] = [index, len(self.args.shards)]
+        # Resuming a terminated run is not supported with shards
+        auto_pts['use_backup'] = False
+
+        if tty_file or debugger_snr:
+            auto_pts['tty_file'] = tty_file
+            auto_pts['debugger_snr'] = debugger_snr
+
+        if self.args.store:
+            # Each shard updates its own copy of the database, merged
+            # back to the database_file by merge_shard_database().
+            shard_db_file = os.path.join(shard_tmp_dir, os.path.basename(DATABASE_FILE))
+            if os.path.exists(self.args.database_file):
+                shutil.copy(self.args.database_file, shard_db_file)
+            auto_pts['database_file'] = shard_db_file
+
+        file_paths = {'TMP_DIR': shard_tmp_dir,
+                      'IUT_LOGS_DIR': self.file_paths['IUT_LOGS_DIR']}
+        if self.file_paths.get('BOT_LOG_FILE'):
+            file_paths['BOT_LOG_FILE'] = os.path.join(
+                shard_tmp_dir, os.path.basename(self.file_paths['BOT_LOG_FILE']))
+
+        shard_config = dict(self.bot_config)
+        shard_config['auto_pts'] = auto_pts
+        shard_config['file_paths'] = file_paths
+
+        return shard_config
+
+    def merge_shard_database(self, shard_args, test_cases):
+        """Copy statistics of the test cases run by a shard to database_file"""
+        if not os.path.exists(shard_args.database_file):
+            return
+
+        table_name = self.store_tag + str(getattr(shard_args, 'board_name', self.args.board_name))
+
+        shard_db = TestCaseTable(table_name, shard_args.database_file)
+        statistics = shard_db.get_statistics(test_cases)
+        shard_db.close()
+
+        db = TestCaseTable(table_name, self.args.database_file)
+        db.set_statistics(statistics)
+        db.close()
+
+    def run_shards(self):
+        """Run the test cases partitioned between shards, each with its own
+        IUT and PTS servers, in worker processes and merge their results.
+        """
+        shard_count = len(self.args.shards)
+        module_path = sys.modules[type(self).__module__].__file__
+        ctx = multiprocessing.get_context('spawn')
+        # (tty_file, debugger_snr, acquired_device) of each shard, the
+        # acquired device is taken from the pool and released when the
+        # shard ends.
+        devices = []
+
+        for index, overrides in enumerate(self.args.shards):
+            tty_file = debugger_snr = acquired_device = None
+
+            if not any(key in overrides for key in ('tty_file', 'tty_alias', 'debugger_snr')):
+                if index == 0 or not self.args.tty_file:
+                    # The device found for this config, none with QEMU
+                    # or native IUT
+                    tty_file, debugger_snr = self.args.tty_file, self.args.debugger_snr
+                else:
+                    tty_file, debugger_snr = get_free_device(self.args.board_name)
+                    acquired_device = tty_file
+
+                    if tty_file is None:
+                        # Otherwise the shard would run on the board of
+                        # shard 0
+                        for _, _, device in devices:
+                            release_device(device)
+                        raise RuntimeError(f'No free {self.args.board_name} device '
+                                           f'found for shard {index}')
+
+            devices.append((tty_file, debugger_snr, acquired_device))
+
+        shards = []
+
+        for index, (tty_file, debugger_snr, acquired_device) in enumerate(devices):
+            shard_config = self._make_shard_config(index, tty_file, debugger_snr)
+            shard_args = self.parse_config(shard_config['auto_pts'])
+
+            worker = ctx.Process(target=run_shard, name=f'shard_{index}',
+                                 args=(module_path, type(self).__name__, shard_config))
+            worker.start()
+            log(f'Shard {index}/{shard_count} started, pid {worker.pid}')
+
+            shards.append((worker, shard_config, shard_args, acquired_device))
+
+        all_stats = TestCaseRunStats([], [], 0, xml_results_file=self.file_paths['ALL_STATS_RESULTS_XML_FILE'])
+        servers = []
+
+        try:
+            for index, (worker, shard_config, shard_args, acquired_device) in enumerate(shards):
+                worker.join()
+                # The device pool is per process, the worker cannot release it
+                release_device(acquired_device)
+                if worker.exitcode != 0:
+                    log(f'Shard {index} exited with code {worker.exitcode}')
+
+                for server in zip(shard_args.ip_addr, shard_args.srv_port):
+                    if server not in servers:
+                        servers.append(server)
+
+                shard_tmp_dir = shard_config['file_paths']['TMP_DIR']
+                backup_file = os.path.join(shard_tmp_dir, os.path.basename(
+                    self.file_paths['ALL_STATS_JSON_FILE']))
+
+                if os.path.exists(backup_file):
+                    stats = TestCaseRunStats.load_from_backup(backup_file)
+                else:
+                    # The shard has not completed, take what was journaled
+                    stats = TestCaseRunStats([], [], 0, xml_results_file=os.path.join(
+                        shard_tmp_dir, os.path.basename(self.file_paths['ALL_STATS_RESULTS_XML_FILE'])))
+
+                all_stats.merge(stats)
+                all_stats.pts_ver = all_stats.pts_ver or stats.pts_ver
+                all_stats.platform = all_stats.platform or stats.platform
+                all_stats.system_version = all_stats.system_version or stats.system_version
+
+                if self.args.store:
+                    self.merge_shard_database(shard_args, list(stats.get_results().keys()))
+        finally:
+            for worker, _, _, acquired_device in shards:
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+
+                release_device(acquired_device)
+
+        # Pull the logs of all the PTS servers used by the shards
+        self.args.ip_addr = [ip_addr for ip_addr, _ in servers]
+        self.args.srv_port = [srv_port for _, srv_port in servers]
+
+        all_stats.write_xml()
+
+        if all_stats.num_test_cases == 0:
+            print(f'\nNo test cases were run. Please verify your config.\n')
+            return all_stats
+
+        print(f'\nFinal Bot Summary:\n')
+        all_stats.print_summary()
+
+        return all_stats
+
     def make_readme_md(self, readme_md_path, report_data):
         """Creates README.md for Github logging repo
         """
         readme_file = readme_md_path
-        profile_summary = report.ascii_profile_summary(report_data['tc_results'])
+        profile_summary = report.ascii_profile_summary(report_data['tc_results'],
+                                                       report_data.get('report_model'))
 
         Path(os.path.dirname(readme_file)).mkdir(parents=True, exist_ok=True)
 
@@ -629,7 +988,8 @@ class BotClient(Client):
 
         iut_logs_new = os.path.join(self.file_paths['REPORT_DIR'], 'iut_logs')
         pts_logs_new = os.path.join(self.file_paths['REPORT_DIR'], 'pts_logs')
-        get_deepest_dirs(self.file_paths['IUT_LOGS_DIR'], iut_logs_new, 3)
+        # Test case logs archived during the test run are zip files
+        get_deepest_dirs(self.file_paths['IUT_LOGS_DIR'], iut_logs_new, 3, archives=True)
         get_deepest_dirs(report_data['pts_logs_folder'], pts_logs_new, 3)
 
         self.generate_attachments(report_data, attachments)
@@ -687,7 +1047,8 @@ class BotClient(Client):
         gdrive_config = self.bot_config['gdrive']
 
         log(f'Archiving the report folder ...')
-        report.archive_testcases(self.file_paths['REPORT_DIR'], depth=2)
+        report.archive_testcases(self.file_paths['REPORT_DIR'], depth=2,
+                                 archiver=self._make_log_archiver())
 
         log(f'Connecting to GDrive ...')
         drive = google_drive.Drive(gdrive_config)
@@ -707,7 +1068,8 @@ class BotClient(Client):
         mail_ctx = {'project_name': report_data['project_name'],
                     'repos_info': report_data['repo_status'],
                     'summary': [mail.status_dict2summary_html(report_data['status_count'])],
-                    'profile_summary': mail.html_profile_summary(report_data['tc_results']),
+                    'profile_summary': mail.html_profile_summary(report_data['tc_results'],
+                                                                 report_data.get('report_model')),
                     'log_url': [],
                     'board': self.bot_config['auto_pts']['board'],
                     'platform': report_data['platform'],
@@ -809,7 +1171,7 @@ def get_filtered_test_cases(iut_config, bot_args, config_default, pts):
     _args[config_default].excluded = []
     _args[config_default].test_cases = []
 
-    # Ask the PTS about test cases available in the workspace
+    # Ask the PTS, or its offline index, about test cases available in the workspace
     filtered_test_cases = autoptsclient.get_test_cases(pts, included, excluded)
 
     # Save the iut_config key run order.
@@ -821,27 +1183,20 @@ def get_filtered_test_cases(iut_config, bot_args, config_default, pts):
         distribution_order.remove(config_default)
         distribution_order.append(config_default)
 
-    # Distribute test cases among .conf files
-    remaining_test_cases = copy.deepcopy(filtered_test_cases)
-    for config in distribution_order:
-        value = iut_config[config]
-
-        # Merge .confs without 'test_cases' into the default one
-        if 'test_cases' not in value:
-            # The 'test_cases' can be skipped only in the default config.
-            # It means: Run all remaining after distribution test cases
-            # with the default config.
-            continue
+    # Merge .confs without 'test_cases' into the default one.
+    # The 'test_cases' can be skipped only in the default config.
+    # It means: Run all remaining after distribution test cases
+    # with the default config.
+    config_prefixes = {config: iut_config[config]['test_cases']
+                       for config in distribution_order
+                       if 'test_cases' in iut_config[config]}
 
+    # Distribute test cases among .conf files
+    selected, filtered_test_cases = distribute_test_cases(filtered_test_cases,
+                                                          config_prefixes)
+    for config, test_cases in selected.items():
         _args[config] = copy.deepcopy(_args[config_default])
-
-        for prefix in value['test_cases']:
-            for tc in filtered_test_cases:
-                if tc.startswith(prefix):
-                    _args[config].test_cases.append(tc)
-                    remaining_test_cases.remove(tc)
-
-            filtered_test_cases = copy.deepcopy(remaining_test_cases)
+        _args[config].test_cases = test_cases
 
     # Remaining test cases will be run with the default .conf file
     # if default .conf doesn't have already defined test cases
@@ -853,6 +1208,42 @@ def get_filtered_test_cases(iut_config, bot_args, config_default, pts):
     return run_order, _args
 
 
+def distribute_test_cases(test_cases, config_prefixes):
+    """Assign each test case to the first config with a matching prefix
+
+    config_prefixes -- dict of config name to list of test case name
+                       prefixes, in distribution order
+
+    Test cases of a config are ordered by its first matching prefix, then
+    by the order in test_cases. Done in a single pass over test_cases.
+
+    Returns dict of config name to its test cases, and list of the
+    test cases not matching any config.
+    """
+    trie = PrefixTrie()
+    buckets = {}
+
+    for rank, (config, prefixes) in enumerate(config_prefixes.items()):
+        buckets[config] = [[] for _ in prefixes]
+        for i, prefix in enumerate(prefixes):
+            trie.insert(prefix, (rank, config, i))
+
+    remaining = []
+    for tc in test_cases:
+        matches = trie.matches(tc)
+        if not matches:
+            remaining.append(tc)
+            continue
+
+        _, config, i = min(matches)
+        buckets[config][i].append(tc)
+
+    selected = {config: [tc for bucket in config_buckets for tc in bucket]
+                for config, config_buckets in buckets.items()}
+
+    return selected, remaining
+
+
 def sort_and_reduce_prefixes(prefixes):
     sorted_prefixes = sorted(prefixes, key=len)
     final_prefixes = []
@@ -887,16 +1278,17 @@ def get_tc_res_data(tc_results, test_groups):
     """Gets test results from repord_data['tc_results']and returns
      dictionary containing profile name as key, TestGroup object as value
      e.g. test_groups = {'ASCS' = TestGroup()}"""
-    for tc, res in list(tc_results.items()):
-        result = res[0]
+    for tc, res in tc_results.items():
         profile = tc.split('/')[0]
-        if profile not in test_groups.keys():
-            test_groups[profile] = TestGroup()
-        if result == 'PASS':
-            test_groups[profile].passed += 1
+        test_group = test_groups.get(profile)
+        if test_group is None:
+            test_group = test_groups[profile] = TestGroup()
+
+        if res[0] == 'PASS':
+            test_group.passed += 1
         else:
-            test_groups[profile].failed += 1
-        test_groups[profile].total += 1
+            test_group.failed += 1
+        test_group.total += 1
 
     return test_groups
 
@@ -981,6 +1373,24 @@ def get_absolute_module_path(config_path):
     return None
 
 
+def run_shard(module_path, class_name, bot_config):
+    """Entry point of a shard worker process
+
+    module_path -- path to the bot module with the BotClient class
+    class_name -- name of the BotClient class in the module
+    bot_config -- bot config of the shard
+    """
+    module = load_module_from_path(module_path)
+    bot_client = getattr(module, class_name)()
+
+    errmsg = bot_client.parse_config_and_args(bot_config)
+    if errmsg:
+        sys.exit(errmsg)
+
+    stats = bot_client.run_tests()
+    stats.save_to_backup(bot_client.file_paths['ALL_STATS_JSON_FILE'])
+
+
 def load_module_from_path(cfg):
     config_path = get_absolute_module_path(cfg)
     if not os.path.isfile(config_path):
@@ -0,0 +1,207 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Cache of IUT build artifacts, keyed by the content the build depends on
+
+An entry is identified by a hash of the source repositories HEADs, board,
+ordered overlays contents and toolchain environment. If the key is
+already cached, the build directories are restored and only flashed.
+Least recently used entries are evicted when the cache outgrows its size.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import git
+
+log = logging.debug
+
+DEFAULT_MAX_SIZE = 10 * 1024 ** 3
+META_FILE = 'meta.json'
+ARTIFACTS_DIR = 'artifacts'
+
+# Environment variables selecting the toolchain used by the builds
+TOOLCHAIN_ENV_VARS = ['ZEPHYR_TOOLCHAIN_VARIANT', 'ZEPHYR_SDK_INSTALL_DIR',
+                      'GNUARMEMB_TOOLCHAIN_PATH', 'ZEPHYR_BASE']
+
+
+def get_repo_head(repo_path):
+    """Returns HEAD commit SHA, or None if HEAD does not describe the sources,
+    i.e. tracked files are modified
+    """
+    try:
+        repo = git.Repo(repo_path, search_parent_directories=True)
+        if repo.is_dirty(untracked_files=False):
+            return None
+
+        return repo.head.commit.hexsha
+    except (git.exc.GitError, ValueError) as e:
+        log("Cannot read HEAD of %s: %r", repo_path, e)
+        return None
+
+
+def get_repos_heads(project_path, git_config=None):
+    """Returns dict of repo name to HEAD commit SHA, or None if any of
+    the repositories cannot be used to identify a build
+
+    git_config -- 'git' section of bot config, project_path repo if None
+    """
+    repos = {}
+
+    if git_config:
+        for name, conf in git_config.items():
+            if os.path.isabs(conf['path']):
+                repos[name] = conf['path']
+            else:
+                repos[name] = os.path.join(project_path, conf['path'])
+    else:
+        repos['project'] = project_path
+
+    heads = {}
+    for name, repo_path in repos.items():
+        head = get_repo_head(repo_path)
+        if head is None:
+            return None
+
+        heads[name] = head
+
+    return heads
+
+
+def get_toolchain():
+    return {name: os.environ.get(name) for name in TOOLCHAIN_ENV_VARS}
+
+
+def make_key(repos_heads, board, overlays, toolchain):
+    """Compute cache key
+
+    overlays -- ordered list of (name, content) tuples, content is bytes
+    """
+    key = hashlib.sha256()
+    key.update(json.dumps({'repos': repos_heads,
+                           'board': board,
+                           'toolchain': toolchain},
+                          sort_keys=True).encode())
+
+    for name, content in overlays:
+        key.update(b'\0' + name.encode() + b'\0')
+        key.update(hashlib.sha256(content).digest())
+
+    return key.hexdigest()
+
+
+def _dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            file_path = os.path.join(root, name)
+            if not os.path.islink(file_path):
+                size += os.path.getsize(file_path)
+
+    return size
+
+
+class BuildCache:
+    def __init__(self, cache_dir, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _meta_file(self, key):
+        return os.path.join(self._entry_dir(key), META_FILE)
+
+    def contains(self, key):
+        return os.path.exists(self._meta_file(key))
+
+    def restore(self, key, project_path, build_dirs):
+        """Replace build_dirs in project_path with the cached ones
+
+        Returns True on cache hit.
+        """
+        if not self.contains(key):
+            return False
+
+        artifacts = os.path.join(self._entry_dir(key), ARTIFACTS_DIR)
+
+        for i, build_dir in enumerate(build_dirs):
+            dst = os.path.join(project_path, build_dir)
+            shutil.rmtree(dst, ignore_errors=True)
+            shutil.copytree(os.path.join(artifacts, str(i)), dst, symlinks=True)
+
+        # Last use time for LRU eviction
+        os.utime(self._meta_file(key))
+        log("Build cache hit %s", key)
+
+        return True
+
+    def store(self, key, project_path, build_dirs, info=None):
+        """Copy build_dirs of project_path to the cache"""
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+
+        try:
+            for i, build_dir in enumerate(build_dirs):
+                shutil.copytree(os.path.join(project_path, build_dir),
+                                os.path.join(tmp_dir, ARTIFACTS_DIR, str(i)),
+                                symlinks=True)
+
+            meta = {'build_dirs': build_dirs,
+                    'size': _dir_size(tmp_dir),
+                    'info': info}
+
+            with open(os.path.join(tmp_dir, META_FILE), 'w') as f:
+                json.dump(meta, f, indent=4)
+
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            os.replace(tmp_dir, self._entry_dir(key))
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        log("Build cache stored %s", key)
+        self.evict()
+
+    def _entries(self):
+        entries = []
+
+        for key in os.listdir(self.cache_dir):
+            meta_file = self._meta_file(key)
+            try:
+                with open(meta_file, 'r') as f:
+                    size = json.load(f)['size']
+                entries.append((os.path.getmtime(meta_file), size, key))
+            except (OSError, ValueError, KeyError):
+                continue
+
+        return entries
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_size"""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, key in entries:
+            if total <= self.max_size:
+                break
+
+            log("Build cache evicting %s", key)
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            total -= size
@@ -0,0 +1,139 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Archiving of test case log directories during the test run
+
+Each test case log directory is compressed into a zip file next to it as
+soon as the test case finishes, in a background thread pool, so the logs
+are ready to be uploaded when the run ends.
+"""
+
+import logging
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+log = logging.debug
+
+DEFAULT_WORKERS = 2
+
+COMPRESSION_METHODS = {
+    'stored': zipfile.ZIP_STORED,
+    'deflate': zipfile.ZIP_DEFLATED,
+    'bzip2': zipfile.ZIP_BZIP2,
+    'lzma': zipfile.ZIP_LZMA,
+}
+
+# Python 3.14+
+if hasattr(zipfile, 'ZIP_ZSTANDARD'):
+    COMPRESSION_METHODS['zstd'] = zipfile.ZIP_ZSTANDARD
+
+
+def get_compression(name):
+    """Returns zipfile compression constant of the compression method name"""
+    try:
+        return COMPRESSION_METHODS[name]
+    except KeyError:
+        raise ValueError(f'Unsupported compression method {name}, '
+                         f'supported: {", ".join(COMPRESSION_METHODS)}') from None
+
+
+def archive_dir(dir_path, compression=zipfile.ZIP_STORED, compresslevel=None):
+    """Archive directory recursively into <dir_path>.zip
+
+    The paths in the archive start with the directory name.
+    :return: newly created zip file path
+    """
+    zip_file_path = os.path.join(os.path.dirname(dir_path),
+                                 os.path.basename(dir_path) + '.zip')
+    tmp_file_path = zip_file_path + '.tmp'
+    base_dir = os.path.join(dir_path, os.path.pardir)
+
+    try:
+        with zipfile.ZipFile(tmp_file_path, 'w', compression=compression,
+                             compresslevel=compresslevel, allowZip64=True) as zf:
+            for root, dirs, files in os.walk(dir_path):
+                for file_or_dir in files + dirs:
+                    file_path = os.path.join(root, file_or_dir)
+                    zf.write(file_path, os.path.relpath(file_path, base_dir))
+    except BaseException:
+        if os.path.exists(tmp_file_path):
+            os.remove(tmp_file_path)
+        raise
+
+    # Incomplete archives are never left under the final name
+    os.replace(tmp_file_path, zip_file_path)
+
+    return zip_file_path
+
+
+class LogArchiver:
+    """Compresses test case log directories in background threads
+
+    A directory is removed once its archive is complete.
+    """
+
+    def __init__(self, compression='deflate', compresslevel=None,
+                 workers=DEFAULT_WORKERS):
+        self.compression = get_compression(compression)
+        self.compresslevel = compresslevel
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix='LogArchiver')
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _archive(self, dir_path):
+        zip_file_path = archive_dir(dir_path, self.compression, self.compresslevel)
+        shutil.rmtree(dir_path, ignore_errors=True)
+        log(f'Archived {dir_path}')
+
+        return zip_file_path
+
+    def submit(self, dir_path):
+        """Archive the directory in background, if not submitted already"""
+        if not dir_path or not os.path.isdir(dir_path):
+            return
+
+        dir_path = os.path.abspath(dir_path)
+
+        with self._lock:
+            if dir_path in self._futures:
+                return
+
+            self._futures[dir_path] = self._executor.submit(self._archive, dir_path)
+
+    def wait(self):
+        """Wait for the submitted directories to be archived
+
+        Directories that failed to be archived are left in place.
+        :return: list of archive paths
+        """
+        with self._lock:
+            futures = dict(self._futures)
+
+        archives = []
+        for dir_path, future in futures.items():
+            try:
+                archives.append(future.result())
+            except BaseException as e:
+                logging.exception(f'Failed to archive {dir_path}: {e}')
+
+        return archives
+
+    def shutdown(self):
+        self.wait()
+        self._executor.shutdown()
@@ -15,7 +15,7 @@
 import os
 import mimetypes
 import smtplib
-import autopts.bot.common as common
+from autopts.bot.common_features import report
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
@@ -70,13 +70,14 @@ def status_dict2summary_html(status_dict):
     return summary
 
 
-def html_profile_summary(tc_results):
-    """Creates HTML formatted table with summarized profile results"""
-    test_groups = {}
-    common.get_tc_res_data(tc_results, test_groups)
+def html_profile_summary(tc_results, model=None):
+    """Creates HTML formatted table with summarized profile results
 
-    for tg in test_groups.values():
-        tg.get_pass_rate()
+    model -- report.ReportModel of tc_results, to not count them again
+    """
+    if model is None:
+        model = report.ReportModel(tc_results)
+    test_groups = model.test_groups
 
     table_rows = ""
     for suite, stats in test_groups.items():
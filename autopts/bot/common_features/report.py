@@ -17,8 +17,11 @@ import logging
 import os
 import re
 import datetime
+import tempfile
+import xmlrpc.client
 import zipfile
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from xmlrpc.client import ServerProxy
 
@@ -26,7 +29,7 @@ import git
 import yaml
 import xlsxwriter
 
-from autopts.bot.common_features import github
+from autopts.bot.common_features import github, log_archiver
 from autopts.bot import common
 from autopts.client import PtsServer
 from autopts.config import AUTOPTS_ROOT_DIR
@@ -65,11 +68,66 @@ def make_repo_status(repos_info):
     return ', '.join(status_list)
 
 
+def get_xml_case_name(test_case):
+    """Returns name of the test case as used in the PTS XML log file names"""
+    return test_case.replace('/', '_').replace('-', '_')
+
+
+def index_xmls(xmls):
+    """Returns dict of test case name, as returned by get_xml_case_name(),
+    to the name of its XML log file in xmls directory
+    """
+    xml_files = {}
+
+    try:
+        entries = list(os.scandir(xmls))
+    except FileNotFoundError:
+        log("No XMLs found")
+        return xml_files
+
+    for entry in entries:
+        try:
+            test_name, _ = split_xml_filename(entry.name)
+        except ValueError:
+            continue
+
+        xml_files.setdefault(f'{test_name}_C', entry.name)
+
+    return xml_files
+
+
+class ReportModel:
+    """Test case results indexed once, shared by the report
+    writers, so each of them stays linear in the number of test cases.
+    """
+
+    def __init__(self, tc_results, regressions=(), progresses=(),
+                 descriptions=None, xmls=None):
+        self.tc_results = tc_results
+        self.regressions = set(regressions)
+        self.progresses = set(progresses)
+        self.descriptions = descriptions or {}
+        self.xml_files = index_xmls(xmls) if xmls else {}
+        # Profile name -> TestGroup
+        self.test_groups = common.get_tc_res_data(tc_results, {})
+        self.status_count = {}
+
+        for res in tc_results.values():
+            self.status_count[res[0]] = self.status_count.get(res[0], 0) + 1
+
+        for test_group in self.test_groups.values():
+            test_group.get_pass_rate()
+
+    def find_xml(self, test_case):
+        """Returns name of the XML log file of the test case or ''"""
+        return self.xml_files.get(get_xml_case_name(test_case), '')
+
+
 # ****************************************************************************
 # .xlsx spreadsheet file
 # ****************************************************************************
 def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_list,
-                     progresses_list, descriptions, xmls, errata):
+                     progresses_list, descriptions, xmls, errata, model=None):
     """Creates excel file containing test cases results and summary pie chart
     :param results_dict: dictionary with test cases results
     :param status_dict: status dictionary, where key is status and value is
@@ -77,26 +135,14 @@ def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_li
     :param regressions_list: list of regressions found
     :param progresses_list: list of regressions found
     :param descriptions: test cases
+    :param model: ReportModel of the results, built from the other
+    parameters if None
     :return:
     """
 
-    try:
-        xml_list = list(os.scandir(xmls))
-    except FileNotFoundError as e:
-        log("No XMLs found")
-        xml_list = None
-    matched_xml = ''
-
-    def find_xml_by_case(case):
-        if xml_list is None:
-            return
-        nonlocal matched_xml
-        matched_xml = ''
-        to_match = case.replace('/', '_').replace('-', '_')
-        for xml in xml_list:
-            if to_match in xml.name:
-                matched_xml = xml.name
-                break
+    if model is None:
+        model = ReportModel(results_dict, regressions_list, progresses_list,
+                            descriptions, xmls)
 
     header = "AutoPTS Report: " \
              "{}".format(datetime.datetime.now().strftime("%Y-%m-%d %H:%M"))
@@ -115,11 +161,10 @@ def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_li
     row = 3
     col = 0
 
-    for k, v in list(results_dict.items()):
+    for k, v in model.tc_results.items():
         worksheet.write(row, col, k)
         if v[0] == 'PASS':
-            find_xml_by_case(k)
-            worksheet.write(row, col + 2, matched_xml)
+            worksheet.write(row, col + 2, model.find_xml(k))
         if v[0] == 'PASS' and int(v[1]) > 1:
             v = '{} ({})'.format(v[0], v[1])
         else:
@@ -127,11 +172,11 @@ def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_li
         if k in errata:
             v += ' - ERRATA ' + errata[k]
         worksheet.write(row, col + 1, v)
-        if k in list(descriptions.keys()):
-            worksheet.write(row, col + 3, descriptions[k])
-        if k in regressions_list:
+        if k in model.descriptions:
+            worksheet.write(row, col + 3, model.descriptions[k])
+        if k in model.regressions:
             worksheet.write(row, col + 4, "REGRESSION")
-        if k in progresses_list:
+        if k in model.progresses:
             worksheet.write(row, col + 4, "PROGRESS")
         row += 1
 
@@ -148,7 +193,7 @@ def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_li
     # Total TCS
     row = end_row + 2
     col = summary_col
-    total_count = len(results_dict)
+    total_count = len(model.tc_results)
     worksheet.write(row, col, "Total")
     worksheet.write(row, col + 1, "{}".format(total_count))
     worksheet.write(row + 1, col, "PassRate", bold)
@@ -175,27 +220,32 @@ def make_report_xlsx(report_xlsx_path, results_dict, status_dict, regressions_li
 # .txt result file
 # ****************************************************************************
 def make_report_txt(report_txt_path, results_dict, regressions_list,
-                    progresses_list, repo_status, errata):
+                    progresses_list, repo_status, errata, model=None):
     """Creates txt file containing test cases results
     :param results_dict: dictionary with test cases results
     :param regressions_list: list of regressions found
     :param progresses_list: list of regressions found
     :param repo_status: information about current commit from all
     configured repositories
+    :param model: ReportModel of the results, built from the other
+    parameters if None
     :return: txt file path
     """
 
+    if model is None:
+        model = ReportModel(results_dict, regressions_list, progresses_list)
+
     f = open(report_txt_path, "w")
 
     f.write(f"{repo_status}, autopts={get_autopts_version()}\n")
-    for tc, result in list(results_dict.items()):
+    for tc, result in model.tc_results.items():
         res = result[0]
         if result[0] == 'PASS':
             if int(result[1]) > 1:
                 res = '{} ({})'.format(res, result[1])
-            if tc in progresses_list:
+            if tc in model.progresses:
                 res = '{} - PROGRESS '.format(res)
-        elif tc in regressions_list:
+        elif tc in model.regressions:
             res = '{} - REGRESSION '.format(res)
 
         result = res
@@ -239,13 +289,12 @@ def make_report_diff(old_report_txt, report_diff_txt_path, results,
 
     deleted_cases = []
     old_test_cases = []
-    test_cases = list(results.keys())
 
     if os.path.exists(old_report_txt):
         old_test_cases = report_parse_test_cases(old_report_txt)
 
     for tc in old_test_cases:
-        if tc not in test_cases:
+        if tc not in results:
             deleted_cases.append(tc)
 
     f.write(f"Regressions:\n")
@@ -305,24 +354,20 @@ def github_push_report(report_folder, log_git_conf, commit_msg):
     return 'https://github.com/{}/{}/tree/{}'.format(repo_owner, repo_name, head_sha), dst_folder
 
 
-def archive_recursive(dir_path):
+def archive_recursive(dir_path, compression=zipfile.ZIP_STORED, compresslevel=None):
     """Archive directory recursively
     :return: newly created zip file path
     """
-    zip_file_path = os.path.join(os.path.dirname(dir_path),
-                                 os.path.basename(dir_path) + '.zip')
-    with zipfile.ZipFile(zip_file_path, 'w', allowZip64=True) as zf:
-        for root, dirs, files in os.walk(dir_path):
-            for file_or_dir in files + dirs:
-                zf.write(
-                    os.path.join(root, file_or_dir),
-                    os.path.relpath(os.path.join(root, file_or_dir),
-                                    os.path.join(dir_path, os.path.pardir)))
+    return log_archiver.archive_dir(dir_path, compression, compresslevel)
 
-    return zip_file_path
 
+def archive_testcases(dir_path, depth=3, archiver=None):
+    """Archive each directory at the depth. Test case log directories
+    archived during the test run are zip files already and are skipped.
 
-def archive_testcases(dir_path, depth=3):
+    archiver -- log_archiver.LogArchiver to archive the directories in
+                parallel, serially if None
+    """
     def recursive(directory, depth):
         depth -= 1
         for f in os.scandir(directory):
@@ -331,10 +376,18 @@ def archive_testcases(dir_path, depth=3):
                     recursive(os.path.join(directory, f.name), depth)
                 else:
                     filepath = os.path.relpath(os.path.join(directory, f.name))
+                    if archiver:
+                        archiver.submit(filepath)
+                        continue
+
                     archive_recursive(filepath)
                     shutil.rmtree(filepath)
 
     recursive(dir_path, depth)
+
+    if archiver:
+        archiver.wait()
+
     return dir_path
 
 
@@ -363,8 +416,39 @@ def copy_server_log_file(tmp_dir, pts, ports):
         logging.exception(e)
 
 
+# Files that stay in the server workspace after the logs are pulled
+WORKSPACE_KEEP_EXT = ['.pts', '.pqw6', '.xlsx', '.gitignore', '.bls']
+PASS_VERDICT = b'Final Verdict:PASS'
+LOGS_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def copy_and_find(src, dst, pattern, chunk_size=LOGS_CHUNK_SIZE):
+    """Copies file object src to dst in chunks.
+
+    Returns True if pattern was found in the copied data.
+    """
+    found = False
+    tail = b''
+
+    while True:
+        chunk = src.read(chunk_size)
+        if not chunk:
+            return found
+
+        dst.write(chunk)
+
+        if not found:
+            # Keep the end of the previous chunk to match across chunks
+            found = pattern in tail + chunk
+            tail = chunk[-(len(pattern) - 1):]
+
+
 def pull_server_logs(args, tmp_dir, xml_folder):
     """Copy Bluetooth Protocol Viewer logs from auto-pts servers.
+
+    Servers are handled in parallel. Each server packs its workspace
+    tree into a single archive that is pulled in chunks, so the memory
+    usage does not depend on the size of the logs.
     :param args: args
     """
 
@@ -381,13 +465,29 @@ def pull_server_logs(args, tmp_dir, xml_folder):
     shutil.rmtree(xml_folder, ignore_errors=True)
     Path(xml_folder).mkdir(parents=True, exist_ok=True)
 
-    def _pull_logs(_pts):
-        last_xml = ('', '')
+    def _save_pass_xml(file_path, last_xml):
+        # Include PTS .xml logs of test cases with PASS verdict
+        # into a separate "XMLs" folder. Those will have reference
+        # entries in report.xlsx
+        (test_name, timestamp) = split_xml_filename(file_path)
+        if test_name in last_xml['path']:
+            # When single test passes multiple times
+            # (e.g. when 'stress-test' parameter is used)
+            # include only the latest one in report.
+            if timestamp <= last_xml['timestamp']:
+                return
+            os.remove(last_xml['path'])
+
+        xml_file_path = os.path.join(xml_folder, os.path.basename(file_path))
+        shutil.copy(file_path, xml_file_path)
+        last_xml['path'] = xml_file_path
+        last_xml['timestamp'] = timestamp
+
+    def _pull_logs_legacy(_pts):
+        """Pulls the workspace file by file, for servers without archiving"""
+        last_xml = {'path': '', 'timestamp': ''}
         file_list = _pts.list_workspace_tree(workspace_dir)
 
-        if args.cron_optim:
-            _pts.shutdown_pts_bpv()
-
         if len(file_list) == 0:
             return
 
@@ -396,12 +496,10 @@ def pull_server_logs(args, tmp_dir, xml_folder):
 
         while len(file_list) > 0:
             file_path = file_list.pop(0)
-            xml_file_path = file_path
             try:
                 file_bin = _pts.copy_file(file_path)
 
-                if not any(file_path.endswith(ext) for ext in
-                           ['.pts', '.pqw6', '.xlsx', '.gitignore', '.bls']):
+                if not any(file_path.endswith(ext) for ext in WORKSPACE_KEEP_EXT):
                     _pts.delete_file(file_path)
 
                 if file_bin is None:
@@ -416,33 +514,76 @@ def pull_server_logs(args, tmp_dir, xml_folder):
                 with open(file_path, 'wb') as handle:
                     handle.write(file_bin.data)
 
-                # Include PTS .xml logs of test cases with PASS verdict
-                # into a separate "XMLs" folder. Those will have reference
-                # entries in report.xlsx
-                if file_path.endswith('.xml') and not 'tc_log' in file_path \
-                        and b'Final Verdict:PASS' in file_bin.data:
-                    (test_name, timestamp) = split_xml_filename(file_path)
-                    if test_name in last_xml[0]:
-                        # When single test passes multiple times
-                        # (e.g. when 'stress-test' parameter is used)
-                        # include only the latest one in report.
-                        if timestamp <= last_xml[1]:
-                            continue
-                        os.remove(last_xml[0])
-                    xml_file_path = \
-                        '/'.join([xml_folder,
-                                  xml_file_path[
-                                  xml_file_path.rfind('\\') + 1:]
-                                 .replace('\\', '/')])
-                    Path(os.path.dirname(xml_file_path)).mkdir(
-                        parents=True,
-                        exist_ok=True)
-                    with open(xml_file_path, 'wb') as handle:
-                        handle.write(file_bin.data)
-                    last_xml = (xml_file_path, timestamp)
+                if file_path.endswith('.xml') and 'tc_log' not in file_path \
+                        and PASS_VERDICT in file_bin.data:
+                    _save_pass_xml(file_path, last_xml)
             except BaseException as e:
                 logging.exception(e)
 
+    def _pull_logs(_pts):
+        if args.cron_optim:
+            _pts.shutdown_pts_bpv()
+
+        try:
+            archive_path = _pts.archive_workspace_tree(workspace_dir)
+        except xmlrpc.client.Fault as e:
+            log(f'Archiving not supported by the server, pulling file by file: {e}')
+            _pull_logs_legacy(_pts)
+            return
+
+        local_archive = tempfile.NamedTemporaryFile(suffix='.zip', delete=False)
+        try:
+            with local_archive:
+                offset = 0
+                while True:
+                    chunk = _pts.read_file_chunk(archive_path, offset, LOGS_CHUNK_SIZE).data
+                    if not chunk:
+                        break
+
+                    local_archive.write(chunk)
+                    offset += len(chunk)
+
+            with zipfile.ZipFile(local_archive.name) as archive:
+                if archive.testzip() is not None:
+                    raise zipfile.BadZipFile(f'Corrupted logs archive {archive_path}')
+        except BaseException:
+            # The workspace logs stay on the server for the next pull
+            _pts.delete_file(archive_path)
+            os.remove(local_archive.name)
+            raise
+
+        _pts.delete_archived_workspace_tree(archive_path, workspace_dir, WORKSPACE_KEEP_EXT)
+
+        last_xml = {'path': '', 'timestamp': ''}
+        try:
+            with zipfile.ZipFile(local_archive.name) as archive:
+                for info in archive.infolist():
+                    if info.is_dir():
+                        continue
+
+                    try:
+                        file_path = os.path.join(logs_folder, info.filename)
+                        Path(os.path.dirname(file_path)).mkdir(parents=True, exist_ok=True)
+
+                        with archive.open(info) as src, open(file_path, 'wb') as dst:
+                            passed = copy_and_find(src, dst, PASS_VERDICT)
+
+                        if passed and file_path.endswith('.xml') and 'tc_log' not in file_path:
+                            _save_pass_xml(file_path, last_xml)
+                    except BaseException as e:
+                        logging.exception(e)
+        finally:
+            os.remove(local_archive.name)
+
+    def _pull_server(addr, ports):
+        try:
+            with ServerProxy(f"http://{addr}:{ports[0]}/",
+                             allow_none=True) as proxy:
+                _pull_logs(proxy)
+                copy_server_log_file(tmp_dir, proxy, ports)
+        except BaseException as e:
+            logging.exception(e)
+
     if args.server_args:
         # Logs available locally
         _pull_logs(PtsServer)
@@ -458,22 +599,19 @@ def pull_server_logs(args, tmp_dir, xml_folder):
             else:
                 servers[address] = [port]
 
-        for addr in servers:
-            with ServerProxy(f"http://{addr}:{servers[addr][0]}/",
-                             allow_none=True) as proxy:
-                _pull_logs(proxy)
-                copy_server_log_file(tmp_dir, proxy, servers[addr])
+        if servers:
+            with ThreadPoolExecutor(max_workers=len(servers)) as executor:
+                for addr in servers:
+                    executor.submit(_pull_server, addr, servers[addr])
 
     return logs_folder, xml_folder
 
 
-def ascii_profile_summary(tc_results):
+def ascii_profile_summary(tc_results, model=None):
     """Creates ASCII formatted table with summarized profile results"""
-    test_groups = {}
-    common.get_tc_res_data(tc_results, test_groups)
-
-    for tg in test_groups.values():
-        tg.get_pass_rate()
+    if model is None:
+        model = ReportModel(tc_results)
+    test_groups = model.test_groups
 
     header = "|  Suite  | Total | Pass | Fail | Pass Rate|"
     separator = "|---------|-------|------|------|----------|"
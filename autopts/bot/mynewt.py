@@ -14,6 +14,7 @@
 # more details.
 #
 import importlib
+import json
 import logging
 import os
 import subprocess
@@ -123,8 +124,11 @@ class MynewtBotClient(bot.common.BotClient):
             build_and_flash = get_build_and_flash(args.board_name)
             board_type = get_board_type(args.board_name)
 
+            overlays_content = [('syscfg', json.dumps(overlay).encode())]
+
             try:
-                build_and_flash(args.project_path, board_type, overlay, args.debugger_snr)
+                self.cached_build_and_flash(args, board_type, overlays_content, build_and_flash,
+                                            args.project_path, board_type, overlay, args.debugger_snr)
             except BaseException as e:
                 traceback.print_exception(e)
                 report.make_error_txt('Build and flash step failed', self.file_paths['ERROR_TXT_FILE'])
@@ -90,6 +90,7 @@ class ZephyrBotConfigArgs(BotConfigArgs):
         super().__init__(args)
         self.board_name = args['board']
         self.tty_file = args.get('tty_file', None)
+        self.persistent_iut = args.get('persistent_iut', False)
 
 
 class ZephyrBotCliParser(bot.common.BotCliParser):
@@ -131,12 +132,25 @@ class ZephyrBotClient(BotClient):
         log("TTY path: %s" % args.tty_file)
 
         if not args.no_build:
+            iut = get_iut()
+            if iut:
+                # The IUT session kept by persistent_iut must not stay
+                # attached to the board while it is flashed
+                iut.stop()
+
             build_and_flash = get_build_and_flash(args.board_name)
             board_type = get_board_type(args.board_name)
 
+            tester_dir = os.path.join(args.project_path, "tests", "bluetooth", "tester")
+            overlays_content = []
+            for name in configs:
+                path = os.path.join(tester_dir, name)
+                overlays_content.append((name, Path(path).read_bytes() if os.path.exists(path) else b''))
+
             try:
-                build_and_flash(args.project_path, board_type, args.debugger_snr,
-                                overlays, args.project_repos)
+                self.cached_build_and_flash(args, board_type, overlays_content, build_and_flash,
+                                            args.project_path, board_type, args.debugger_snr,
+                                            overlays, args.project_repos)
 
                 flush_serial(args.tty_file)
             except BaseException as e:
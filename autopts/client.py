@@ -20,6 +20,7 @@
 import copy
 import datetime
 import errno
+import functools
 import json
 import logging
 import os
@@ -48,7 +49,7 @@ from autopts.ptsprojects.testcase import PTSCallback, TestCaseLT1, TestCaseLT2,
 from autopts.ptsprojects.testcase_db import TestCaseTable
 from autopts.pybtp import btp, defs
 from autopts.pybtp.types import BTPError, SynchError, MissingWIDError
-from autopts.utils import InterruptableThread, ResultWithFlag, CounterWithFlag, set_global_end, \
+from autopts.utils import InterruptableThread, ResultWithFlag, CounterWithFlag, PrefixTrie, set_global_end, \
     raise_on_global_end, RunEnd, get_global_end, have_admin_rights, ykush_replug_usb, active_hub_server_replug_usb
 from cliparser import CliParser
 
@@ -59,6 +60,12 @@ RUNNING_TEST_CASE = {}
 autoprojects = None
 TEST_CASE_TIMEOUT_MS = 300000  # milliseconds
 
+# Worker threads of each client callback server
+CALLBACK_SERVER_WORKERS = 4
+# PTS log callbacks are written in batches of this size, or this often
+LOG_BATCH_SIZE = 64
+LOG_BATCH_INTERVAL = 0.2  # seconds
+
 # To test autopts client locally:
 # Envrinment variable AUTO_PTS_LOCAL must be set for FakeProxy to
 # be used. When FakeProxy is used autoptsserver on Windows will
@@ -71,8 +78,26 @@ def logger_log(self, *args, **kwargs):
         self.original_log(*args, **kwargs)
 
 
+class PixitError(Exception):
+    pass
+
+
 class PtsServerProxy(xmlrpc.client.ServerProxy):
-    """Client to remote autoptsserver"""
+    """Client to remote autoptsserver
+
+    The set_pixit and update_pixit_param calls are not sent right away.
+    They are queued and sent in bulk on flush_pixits(), so setting
+    a profile's PIXITs costs a single round-trip. The callers flush once
+    the PIXITs are set, anything left is flushed before a test case is run.
+    Errors of the queued calls raise PixitError.
+    """
+
+    # Coalesced methods and their bulk counterparts in PyPTS
+    BULK_METHODS = {
+        'set_pixit': 'set_pixits_bulk',
+        'update_pixit_param': 'update_pixit_params_bulk',
+    }
+
     def __init__(self, server_address, server_port):
         super().__init__(uri=f"http://{server_address}:{server_port}/",
                          allow_none=True, transport=None,
@@ -82,6 +107,44 @@ class PtsServerProxy(xmlrpc.client.ServerProxy):
         self.info = f"{server_address}:{server_port}"
         self.callback_thread = None
         self.callback = None
+        self._pending_pixits = []
+        self._pending_pixits_lock = threading.Lock()
+
+    def _queue_pixit(self, method_name, project_name, param_name, param_value):
+        with self._pending_pixits_lock:
+            self._pending_pixits.append((method_name, (project_name, param_name, param_value)))
+
+    def set_pixit(self, project_name, param_name, param_value):
+        self._queue_pixit('set_pixit', project_name, param_name, param_value)
+
+    def update_pixit_param(self, project_name, param_name, new_param_value):
+        self._queue_pixit('update_pixit_param', project_name, param_name, new_param_value)
+
+    def run_test_case(self, project_name, test_case_name):
+        # The test case runs with the PIXITs set before it
+        self.flush_pixits()
+        return super().__getattr__('run_test_case')(project_name, test_case_name)
+
+    def flush_pixits(self):
+        """Sends queued PIXIT calls, one bulk call per run of the same method"""
+        with self._pending_pixits_lock:
+            pending = self._pending_pixits
+            self._pending_pixits = []
+
+        while pending:
+            method_name = pending[0][0]
+            batch = []
+            while pending and pending[0][0] == method_name:
+                batch.append(pending.pop(0)[1])
+
+            bulk_method = super().__getattr__(self.BULK_METHODS[method_name])
+            try:
+                bulk_method(batch)
+            except xmlrpc.client.Fault as e:
+                pixits = ', '.join(f'{project_name} {param_name}={param_value}'
+                                   for project_name, param_name, param_value in batch)
+                raise PixitError(f'{method_name} of {pixits} failed on {self.info}: '
+                                 f'{e.faultString}') from e
 
     @staticmethod
     def factory_get_instance(_id, server_address, server_port,
@@ -185,6 +248,11 @@ class ClientCallback(PTSCallback):
         self.exception = queue.Queue()
         self._results = {}
         self._callbacks = {}
+        self._log_batch = []
+        self._log_batch_lock = threading.Lock()
+        # Keeps the batches in order if flushed by several threads
+        self._log_flush_lock = threading.Lock()
+        self.log_flush_time = time.monotonic()
         # Long methods run asynchronously
         for method in ['start_pts', 'restart_pts', 'recover_pts', 'run_test_case']:
             self._results[method] = ResultWithFlag()
@@ -225,13 +293,36 @@ class ClientCallback(PTSCallback):
 
         test_case_name - To be identified by client in case of multiple pts
                          usage.
+
+        The log is written with the next batch, see flush_logs().
         """
 
-        logger = logging.getLogger("{}.{}".format(self.__class__.__name__,
-                                                  self.log.__name__))
-        logger.info("%s %s %s %s %s", ptstypes.PTS_LOGTYPE_STRING[log_type],
-                    logtype_string, log_time, test_case_name,
-                    log_message)
+        with self._log_batch_lock:
+            self._log_batch.append((log_type, logtype_string, log_time,
+                                    test_case_name, log_message))
+            batch_full = len(self._log_batch) >= LOG_BATCH_SIZE
+
+        if batch_full:
+            self.flush_logs()
+
+    def flush_logs(self):
+        """Write the batched PTS logs in a single log record"""
+        with self._log_flush_lock:
+            with self._log_batch_lock:
+                batch = self._log_batch
+                self._log_batch = []
+
+            self.log_flush_time = time.monotonic()
+            if not batch:
+                return
+
+            logger = logging.getLogger("{}.{}".format(self.__class__.__name__,
+                                                      self.log.__name__))
+            logger.info("\n".join(
+                "%s %s %s %s %s" % (ptstypes.PTS_LOGTYPE_STRING[log_type],
+                                    logtype_string, log_time, test_case_name,
+                                    log_message)
+                for log_type, logtype_string, log_time, test_case_name, log_message in batch))
 
     def on_implicit_send(self, project_name, wid, test_case_name, description,
                          style):
@@ -250,6 +341,9 @@ class ClientCallback(PTSCallback):
         };
         """
 
+        # Logs that came before the WID first
+        self.flush_logs()
+
         logger = logging.getLogger("{}.{}".format(
             self.__class__.__name__, self.on_implicit_send.__name__))
 
@@ -291,6 +385,7 @@ class ClientCallback(PTSCallback):
         Result of a ptscontrol method that was called asynchronously
         and has to be awaited.
         """
+        self.flush_logs()
         log(f"{self.__class__.__name__}, {self.set_result.__name__},"
             f" {method_name}, {result}")
 
@@ -315,6 +410,8 @@ class ClientCallback(PTSCallback):
         return result
 
     def cleanup(self):
+        self.flush_logs()
+
         while not self.exception.empty():
             self.exception.get_nowait()
             self.exception.task_done()
@@ -327,11 +424,89 @@ class ClientCallback(PTSCallback):
             self._results[key] = ResultWithFlag()
 
 
+class PoolXMLRPCServer(SimpleXMLRPCServer):
+    """XML-RPC server handling requests in a bounded pool of worker threads
+
+    Requests are read and parsed by the workers in order of arrival. Calls
+    of PRIORITY_METHODS are dispatched as soon as they are parsed. While
+    one of them runs, the other parsed calls wait to be dispatched and the
+    workers do not read new requests, so the priority call does not share
+    the CPU with a flood of log callbacks.
+    """
+
+    PRIORITY_METHODS = ('on_implicit_send', 'set_result')
+    # Bounds the wait for priority calls, in case one of them waits for
+    # another call
+    PRIORITY_WAIT_TIMEOUT = 1.0  # seconds
+    request_queue_size = 64
+
+    def __init__(self, addr, workers=CALLBACK_SERVER_WORKERS, **kwargs):
+        super().__init__(addr, **kwargs)
+        self._requests = queue.Queue()
+        self._priority_cond = threading.Condition()
+        self._priority_calls = 0
+        self._workers = []
+
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, daemon=True,
+                                      name=f'{threading.current_thread().name}-worker{i}')
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        self._requests.put((request, client_address))
+
+    def _wait_priority_calls(self):
+        with self._priority_cond:
+            self._priority_cond.wait_for(lambda: not self._priority_calls,
+                                         self.PRIORITY_WAIT_TIMEOUT)
+
+    def _dispatch(self, method, params):
+        # Called by the worker once the request is parsed
+        if method not in self.PRIORITY_METHODS:
+            self._wait_priority_calls()
+            return super()._dispatch(method, params)
+
+        with self._priority_cond:
+            self._priority_calls += 1
+
+        try:
+            return super()._dispatch(method, params)
+        finally:
+            with self._priority_cond:
+                self._priority_calls -= 1
+                self._priority_cond.notify_all()
+
+    def _work(self):
+        while True:
+            request, client_address = self._requests.get()
+            if request is None:
+                return
+
+            self._wait_priority_calls()
+
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+
+        for _ in self._workers:
+            self._requests.put((None, None))
+
+        for worker in self._workers:
+            worker.join()
+
+
 class ClientCallbackServer(threading.Thread):
     """Thread for XML-RPC callback server
 
-    To prevent SimpleXMLRPCServer blocking whole app it is started in a thread
-
+    To prevent the XML-RPC server blocking whole app it is started in
+    a thread. The callbacks are handled by a pool of worker threads.
     """
 
     def __init__(self, port, name):
@@ -350,16 +525,19 @@ class ClientCallbackServer(threading.Thread):
 
         log("Client callback serving on port %s ...", self.port)
 
-        self.server = SimpleXMLRPCServer(("", self.port),
-                                         allow_none=True, logRequests=False)
+        self.server = PoolXMLRPCServer(("", self.port),
+                                       allow_none=True, logRequests=False)
         self.server.register_instance(self.callback)
         self.server.register_introspection_functions()
-        self.server.timeout = 1.0
+        self.server.timeout = LOG_BATCH_INTERVAL
 
         try:
             while not self.end and not get_global_end():
                 try:
                     self.server.handle_request()
+
+                    if time.monotonic() - self.callback.log_flush_time > LOG_BATCH_INTERVAL:
+                        self.callback.flush_logs()
                 except Exception as e:
                     logging.exception(e)
         except BaseException as e2:
@@ -367,6 +545,7 @@ class ClientCallbackServer(threading.Thread):
         finally:
             log("Client callback finishing...")
             self.server.server_close()
+            self.callback.flush_logs()
 
     def stop(self):
         log("%s.%s", self.__class__.__name__, self.stop.__name__)
@@ -481,6 +660,9 @@ def init_pts_thread_entry(proxy, args, exceptions, finish_count):
             log("Set bd_addr PIXIT: %s for project: %s", args.bd_addr, project_name)
             proxy.update_pixit_param(project_name, "TSPX_bd_addr_iut", args.bd_addr)
 
+        if isinstance(proxy, PtsServerProxy):
+            proxy.flush_pixits()
+
     proxy.enable_maximum_logging(args.enable_max_logs)
 
 
@@ -556,7 +738,20 @@ def get_result_color(status):
     return "white"
 
 
+def get_journal_file(xml_results_file):
+    """Returns path of the JSON lines journal of the results XML file"""
+    return os.path.splitext(xml_results_file)[0] + '.jsonl'
+
+
 class TestCaseRunStats:
+    """Test case results of a test run
+
+    Results are kept in memory, indexed by test case name. Each change
+    is appended to a JSON lines journal, so the results can be restored
+    with load_from_backup() after the test run was terminated. The
+    results XML file is generated with write_xml().
+    """
+
     def __init__(self, projects, test_cases, retry_count, db=None,
                  xml_results_file=None):
         self.pts_ver = ''
@@ -571,22 +766,73 @@ class TestCaseRunStats:
         self.margin = 3
         self.index = 0
         self.xml_results = xml_results_file
+        self.journal = get_journal_file(xml_results_file) if xml_results_file else None
         self.db = db
         self.est_duration = 0
+        # Test case name -> expected duration in seconds
+        self.est_durations = {}
         self.pending_config = None
         self.pending_test_case = None
         self.test_run_completed = False
         self.session_log_dir = None
+        # Test case name -> attributes of the test_case XML element
+        self._results = {}
 
-        if self.xml_results and not os.path.exists(self.xml_results):
-            os.makedirs(dirname(self.xml_results), exist_ok=True)
-            root = ElementTree.Element("results")
-            tree = ElementTree.ElementTree(root)
-            tree.write(self.xml_results)
+        self._load_results()
 
         if self.db:
-            self.est_duration = db.estimate_session_duration(test_cases,
-                                                             self.run_count_max)
+            self.est_durations = db.estimate_test_case_durations(test_cases,
+                                                                 self.run_count_max)
+            self.est_duration = sum(self.est_durations[tc] for tc in test_cases)
+
+    def estimate_remaining_duration(self, test_cases):
+        """Returns expected duration of test_cases still to be run"""
+        return sum(self.est_durations.get(tc, 0) for tc in test_cases)
+
+    def _load_results(self):
+        self._results = {}
+
+        if self.journal and os.path.exists(self.journal):
+            with open(self.journal, 'r') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+
+                    try:
+                        tc = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Last line may be incomplete if the run was killed
+                        log(f'Skipping corrupted journal entry: {line}')
+                        continue
+
+                    self._results[tc['name']] = tc
+
+        elif self.xml_results and os.path.exists(self.xml_results):
+            # Results saved without journal
+            root = ElementTree.parse(self.xml_results).getroot()
+            for tc_xml in root.findall("./test_case"):
+                self._results.setdefault(tc_xml.attrib["name"], dict(tc_xml.attrib))
+
+    def _append_to_journal(self, test_cases):
+        if not self.journal:
+            return
+
+        os.makedirs(dirname(self.journal), exist_ok=True)
+        with open(self.journal, 'a') as f:
+            f.writelines(json.dumps(tc) + '\n' for tc in test_cases)
+
+    def write_xml(self):
+        """Writes the results to the XML file"""
+        if not self.xml_results:
+            return
+
+        os.makedirs(dirname(self.xml_results), exist_ok=True)
+        root = ElementTree.Element("results")
+        for tc in self._results.values():
+            ElementTree.SubElement(root, 'test_case', tc)
+
+        ElementTree.ElementTree(root).write(self.xml_results)
 
     def save_to_backup(self, filename):
         data_to_save = {}
@@ -603,6 +849,9 @@ class TestCaseRunStats:
             data = json.load(f)
             stats = TestCaseRunStats([], [], 0, None)
             stats.__dict__.update(data)
+            if stats.xml_results and not stats.journal:
+                stats.journal = get_journal_file(stats.xml_results)
+            stats._load_results()
             return stats
 
     def merge(self, stats2):
@@ -611,126 +860,90 @@ class TestCaseRunStats:
         self.max_project_name = max(self.max_project_name, stats2.max_project_name)
         self.max_test_case_name = max(self.max_test_case_name, stats2.max_test_case_name)
         self.est_duration = self.est_duration + stats2.est_duration
+        self.est_durations.update(stats2.est_durations)
         self.pending_config = stats2.pending_config
         self.pending_test_case = stats2.pending_test_case
         self.session_log_dir = stats2.session_log_dir
 
-        stats2_tree = ElementTree.parse(stats2.xml_results)
-        root2 = stats2_tree.getroot()
+        merged = [dict(tc) for tc in stats2._results.values()]
+        for tc in merged:
+            self._results[tc['name']] = tc
 
-        self_tree = ElementTree.parse(self.xml_results)
-        root1 = self_tree.getroot()
-        root1.extend(root2)
-        self_tree.write(self.xml_results)
+        self._append_to_journal(merged)
 
     def update(self, test_case_name, duration, status, description=''):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
-        elem = root.find("./test_case[@name='%s']" % test_case_name)
-        if elem is None:
-            elem = ElementTree.SubElement(root, 'test_case')
-            elem.attrib["new"] = '0'
+        tc = self._results.get(test_case_name)
+        if tc is None:
+            tc = {'new': '0'}
 
             status_previous = None
             if self.db:
                 status_previous = self.db.get_result(test_case_name)
                 if status_previous is None:
-                    elem.attrib["new"] = '1'
+                    tc["new"] = '1'
 
-            elem.attrib["project"] = test_case_name.split('/')[0]
-            elem.attrib["name"] = test_case_name
-            elem.attrib["duration"] = str(duration)
-            elem.attrib["status"] = ""
-            elem.attrib["status_previous"] = str(status_previous)
-            elem.attrib["description"] = description
+            tc["project"] = test_case_name.split('/')[0]
+            tc["name"] = test_case_name
+            tc["duration"] = str(duration)
+            tc["status"] = ""
+            tc["status_previous"] = str(status_previous)
+            tc["description"] = description
 
             run_count = 0
+            self._results[test_case_name] = tc
         else:
-            run_count = int(elem.attrib["run_count"])
+            run_count = int(tc["run_count"])
 
-        elem.attrib["status"] = status
+        tc["status"] = status
 
-        regression = bool(elem.attrib["status"] != "PASS" and elem.attrib["status_previous"] == "PASS")
-        progress = bool(elem.attrib["status"] == "PASS" and elem.attrib["status_previous"] != "PASS" \
-                        and elem.attrib["status_previous"] != "None")
+        regression = bool(tc["status"] != "PASS" and tc["status_previous"] == "PASS")
+        progress = bool(tc["status"] == "PASS" and tc["status_previous"] != "PASS"
+                        and tc["status_previous"] != "None")
 
-        elem.attrib["regression"] = str(regression)
-        elem.attrib["progress"] = str(progress)
-        elem.attrib["run_count"] = str(run_count + 1)
+        tc["regression"] = str(regression)
+        tc["progress"] = str(progress)
+        tc["run_count"] = str(run_count + 1)
 
-        tree.write(self.xml_results)
+        self._append_to_journal([tc])
 
         return regression, progress
 
     def update_descriptions(self, descriptions):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
+        updated = []
 
-        for tc in descriptions.keys():
-            elem = root.find("./test_case[@name='%s']" % tc)
-            if elem is None:
+        for name, description in descriptions.items():
+            tc = self._results.get(name)
+            if tc is None:
                 continue
 
-            elem.attrib["description"] = descriptions[tc]
+            tc["description"] = description
+            updated.append(tc)
 
-        tree.write(self.xml_results)
+        self._append_to_journal(updated)
 
     def get_descriptions(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
-        descriptions = {}
-
-        for tc_xml in root.findall("./test_case"):
-            descriptions[tc_xml.attrib["name"]] = tc_xml.attrib["description"]
-
-        return descriptions
+        return {name: tc["description"] for name, tc in self._results.items()}
 
     def get_results(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
-        results = {}
-
-        for tc_xml in root.findall("./test_case"):
-            results[tc_xml.attrib["name"]] = \
-                (tc_xml.attrib["status"], tc_xml.attrib["run_count"])
-
-        return results
+        return {name: (tc["status"], tc["run_count"]) for name, tc in self._results.items()}
 
     def get_regressions(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-        tcs_xml = root.findall("./test_case[@regression='True']")
-
-        return [tc_xml.attrib["name"] for tc_xml in tcs_xml]
+        return [name for name, tc in self._results.items() if tc["regression"] == 'True']
 
     def get_progresses(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-        tcs_xml = root.findall("./test_case[@progress='True']")
-
-        return [tc_xml.attrib["name"] for tc_xml in tcs_xml]
+        return [name for name, tc in self._results.items() if tc["progress"] == 'True']
 
     def get_new_cases(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-        tcs_xml = root.findall("./test_case[@new='1']")
-
-        return [tc_xml.attrib["name"] for tc_xml in tcs_xml]
+        return [name for name, tc in self._results.items() if tc["new"] == '1']
 
     def get_status_count(self):
-        tree = ElementTree.parse(self.xml_results)
-        root = tree.getroot()
-
         status_dict = {}
 
-        for test_case_xml in root.findall("./test_case"):
-            if test_case_xml.attrib["status"] not in status_dict:
-                status_dict[test_case_xml.attrib["status"]] = 0
+        for tc in self._results.values():
+            if tc["status"] not in status_dict:
+                status_dict[tc["status"]] = 0
 
-            status_dict[test_case_xml.attrib["status"]] += 1
+            status_dict[tc["status"]] += 1
 
         return status_dict
 
@@ -965,6 +1178,9 @@ class LTThread(InterruptableThread):
             RUNNING_TEST_CASE[test_case.name] = test_case
             test_case.state = "PRE_RUN"
             test_case.pre_run()
+            if isinstance(pts, PtsServerProxy):
+                # PIXITs set by the test case commands
+                pts.flush_pixits()
             test_case.status = "RUNNING"
             test_case.state = "RUNNING"
             self.interrupt_lock.release()
@@ -1064,20 +1280,24 @@ class LTThread(InterruptableThread):
             self.cancel_sync_points()
 
 
-@run_test_case_wrapper
-def run_test_case(ptses, test_case_instances, test_case_name, stats,
-                  session_log_dir, exceptions, timeout):
-    def test_case_lookup_name(name, test_case_class):
-        """Return 'test_case_class' instance if found or None otherwise"""
-        if test_case_instances is None:
-            return None
+def lookup_test_case(test_case_instances, name, test_case_class=TestCaseLT1):
+    """Return 'test_case_class' instance if found or None otherwise"""
+    if test_case_instances is None:
+        return None
 
-        for tc in test_case_instances:
-            if tc.name == name and isinstance(tc, test_case_class):
-                return tc
+    if isinstance(test_case_instances, TestCases):
+        return test_case_instances.lookup(name, test_case_class)
 
-        return None
+    for tc in test_case_instances:
+        if tc.name == name and isinstance(tc, test_case_class):
+            return tc
 
+    return None
+
+
+@run_test_case_wrapper
+def run_test_case(ptses, test_case_instances, test_case_name, stats,
+                  session_log_dir, exceptions, timeout):
     logger = logging.getLogger()
 
     format_template = ("%(asctime)s %(threadName)s %(name)s %(levelname)s %(filename)-25s "
@@ -1089,7 +1309,7 @@ def run_test_case(ptses, test_case_instances, test_case_name, stats,
     tc_name = test_case_name
 
     for i, tc_class in enumerate([TestCaseLT1, TestCaseLT2, TestCaseLT3], 2):
-        test_case_lt = test_case_lookup_name(tc_name, tc_class)
+        test_case_lt = lookup_test_case(test_case_instances, tc_name, tc_class)
         if test_case_lt is None:
             log(f'The {tc_name} test case enabled in workspace, but the profile not implemented!')
             return 'NOT_IMPLEMENTED'
@@ -1168,7 +1388,14 @@ def run_test_case(ptses, test_case_instances, test_case_name, stats,
         if superguard_timeout:
             test_case_lts[0].status = 'SUPERGUARD TIMEOUT'
 
+    # Write the remaining PTS logs to the test case log
+    for pts in ptses:
+        callback = getattr(pts, 'callback', None)
+        if isinstance(callback, ClientCallback):
+            callback.flush_logs()
+
     logger.removeHandler(file_handler)
+    file_handler.close()
 
     for test_case_lt in test_case_lts:
         if test_case_lt.status != "PASS":
@@ -1185,25 +1412,37 @@ test_case_blacklist = [
 ]
 
 
-def run_or_not(test_case_name, test_cases, excluded):
-    for entry in test_case_blacklist:
-        if entry in test_case_name:
-            return False
+class TestCaseFilter:
+    """Test case name filter of included and excluded name prefixes
 
-    if excluded:
-        for n in excluded:
-            if test_case_name.startswith(n):
+    Tries of the prefixes are built once, so checking a test case costs
+    a walk over its name instead of startswith() with every prefix.
+    """
+
+    def __init__(self, test_cases, excluded):
+        self.included = PrefixTrie(test_cases or ())
+        self.excluded = PrefixTrie(excluded or ())
+
+    def __call__(self, test_case_name):
+        for entry in test_case_blacklist:
+            if entry in test_case_name:
                 return False
 
-    if test_cases:
-        for n in test_cases:
-            if test_case_name.startswith(n):
-                return True
+        if self.excluded.has_prefix_of(test_case_name):
+            return False
+
+        # Empty test_cases means "run them all"
+        return not self.included or self.included.has_prefix_of(test_case_name)
 
-        return False
 
-    # Empty test_cases means "run them all"
-    return True
+@functools.lru_cache(maxsize=16)
+def _get_test_case_filter(test_cases, excluded):
+    return TestCaseFilter(test_cases, excluded)
+
+
+def run_or_not(test_case_name, test_cases, excluded):
+    return _get_test_case_filter(tuple(test_cases or ()),
+                                 tuple(excluded or ()))(test_case_name)
 
 
 def get_test_cases(pts, test_cases, excluded):
@@ -1216,16 +1455,98 @@ def get_test_cases(pts, test_cases, excluded):
     """
 
     projects = pts.get_project_list()
+    test_case_filter = TestCaseFilter(test_cases, excluded)
 
     _test_cases = []
 
     for project in projects:
         _test_case_list = pts.get_test_case_list(project)
-        _test_cases += [tc for tc in _test_case_list if run_or_not(tc, test_cases, excluded)]
+        _test_cases += [tc for tc in _test_case_list if test_case_filter(tc)]
 
     return _test_cases
 
 
+def schedule_test_cases(test_cases, db, run_count_max, limit=0, time_budget=0):
+    """Select and order test cases by their history in the test case database
+
+    Test cases that failed last time run first, then the ones never run,
+    then the ones that passed, each group shortest first. With limit or
+    time_budget (seconds) set, as many test cases as fit are selected in
+    that order.
+
+    Returns list of test cases to run.
+    """
+    last_results = db.get_results(test_cases)
+    durations = db.estimate_test_case_durations(test_cases, run_count_max)
+
+    def priority(test_case):
+        last_result = last_results.get(test_case)
+        if last_result is None:
+            group = 1
+        elif last_result != 'PASS':
+            group = 0
+        else:
+            group = 2
+
+        return group, durations.get(test_case, 0)
+
+    scheduled = []
+    total_duration = 0
+
+    for test_case in sorted(test_cases, key=priority):
+        if limit and len(scheduled) == limit:
+            break
+
+        duration = durations.get(test_case, 0)
+        if time_budget and total_duration + duration > time_budget:
+            log(f'{test_case} does not fit in the time budget, skipped')
+            continue
+
+        scheduled.append(test_case)
+        total_duration += duration
+
+    return scheduled
+
+
+def shard_test_cases(test_cases, shard_count, durations=None):
+    """Partition test cases into shards of similar expected duration
+
+    The longest test cases are assigned first, each to the least loaded
+    shard. Test cases without a known duration count as 1 second. The
+    partition is deterministic and each shard keeps the order of
+    test_cases, so it can be computed independently by every shard.
+
+    durations -- dict of test case name to expected duration
+
+    Returns list of shard_count lists of test cases.
+    """
+    durations = durations or {}
+    order = {test_case: i for i, test_case in enumerate(test_cases)}
+    loads = [0] * shard_count
+    shards = [[] for _ in range(shard_count)]
+
+    def weight(test_case):
+        return durations.get(test_case) or 1
+
+    for test_case in sorted(test_cases, key=lambda tc: (-weight(tc), order[tc])):
+        shard = loads.index(min(loads))
+        shards[shard].append(test_case)
+        loads[shard] += weight(test_case)
+
+    return [sorted(shard, key=order.get) for shard in shards]
+
+
+def report_predicted_completion(stats, remaining_test_cases, verbose):
+    remaining = stats.estimate_remaining_duration(remaining_test_cases)
+    completion = datetime.datetime.now() + datetime.timedelta(seconds=remaining)
+    msg = f"Predicted completion at {completion.strftime('%H:%M:%S')}, " \
+          f"remaining: {datetime.timedelta(seconds=round(remaining))}"
+
+    log(msg)
+    if verbose:
+        print(msg)
+
+
 def run_test_cases(ptses, test_case_instances, args, stats, **kwargs):
     """Runs a list of test cases"""
     session_log_dir = stats.session_log_dir
@@ -1246,6 +1567,7 @@ def run_test_cases(ptses, test_case_instances, args, stats, **kwargs):
     retry_config = getattr(args, 'retry_config', None)
     repeat_until_failed = getattr(args, 'repeat_until_fail', False)
     pre_test_case_fn = kwargs.get('pre_test_case_fn', None)
+    post_test_case_fn = kwargs.get('post_test_case_fn', None)
     exceptions = queue.Queue()
 
     approx = ''
@@ -1253,7 +1575,7 @@ def run_test_cases(ptses, test_case_instances, args, stats, **kwargs):
         approx = f" in approximately: " + str(datetime.timedelta(seconds=stats.est_duration))
     print(f"Number of test cases to run: {stats.num_test_cases}{approx}")
 
-    for test_case in test_cases:
+    for i, test_case in enumerate(test_cases):
         stats.run_count = 0
         test_retry_count = None
 
@@ -1271,6 +1593,12 @@ def run_test_cases(ptses, test_case_instances, args, stats, **kwargs):
 
             raise_on_global_end()
 
+            if post_test_case_fn:
+                test_case_lt1 = lookup_test_case(test_case_instances, test_case)
+                post_test_case_fn(test_case=test_case, stats=stats, status=status,
+                                  log_dir=getattr(test_case_lt1, 'log_dir', None),
+                                  **kwargs)
+
             exeption_msg = ''
             while not exceptions.empty():
                 try:
@@ -1303,6 +1631,11 @@ def run_test_cases(ptses, test_case_instances, args, stats, **kwargs):
 
         stats.index += 1
 
+        if stats.est_durations:
+            report_predicted_completion(stats, test_cases[i + 1:],
+                                        getattr(args, 'schedule', False))
+
+    stats.write_xml()
     stats.print_summary()
 
     return stats
@@ -1425,6 +1758,7 @@ class Client:
         self.cleanup()
 
         if self.args.store:
+            self.test_case_database.close()
             shutil.move(self.file_paths['TEST_CASE_DB_FILE'], self.args.database_file)
 
         print("\nBye!")
@@ -1452,10 +1786,22 @@ class Client:
                                               self.args.test_cases,
                                               self.args.excluded)
 
+        if self.args.schedule:
+            if self.test_case_database:
+                self.args.test_cases = schedule_test_cases(self.args.test_cases,
+                                                           self.test_case_database,
+                                                           self.args.retry + 1,
+                                                           self.args.test_case_limit,
+                                                           self.args.time_budget)
+            else:
+                log('Scheduling requires the test case database (--store)')
+
         projects = self.ptses[0].get_project_list()
 
-        if os.path.exists(self.file_paths['TC_STATS_RESULTS_XML_FILE']):
-            os.remove(self.file_paths['TC_STATS_RESULTS_XML_FILE'])
+        for file in (self.file_paths['TC_STATS_RESULTS_XML_FILE'],
+                     self.file_paths['TC_STATS_RESULTS_JSONL_FILE']):
+            if os.path.exists(file):
+                os.remove(file)
 
         stats = TestCaseRunStats(projects, self.args.test_cases,
                                  self.args.retry, self.test_case_database,
@@ -1607,13 +1953,74 @@ def setup_project_pixits(ptses):
         if mod is not None:
             mod.set_pixits(ptses)
 
+    # Send PIXITs queued by PtsServerProxy, one call per PTS instance
+    for pts in ptses:
+        if isinstance(pts, PtsServerProxy):
+            pts.flush_pixits()
+
 
-def setup_test_cases(ptses):
-    test_cases = []
+class TestCases:
+    """Test case instances of the workspace profiles
 
-    for profile in _get_profiles(ptses):
+    Test cases of a profile are constructed on the first lookup of one of
+    them, so a run of a few test cases does not construct all of them.
+    Instances are indexed by (name, class).
+    """
+
+    def __init__(self, ptses):
+        self.ptses = ptses
+        self._profiles = _get_profiles(ptses)
+        self._constructed = set()
+        # (name, class or base class) -> first instance of that name
+        self._index = {}
+        self._test_cases = []
+
+    def _construct(self, profile):
         mod = getattr(autoprojects, profile, None)
         if mod is not None:
-            test_cases += mod.test_cases(ptses)
+            # On failure the profile is constructed again on next lookup
+            test_cases = mod.test_cases(self.ptses)
+
+            for tc in test_cases:
+                self._test_cases.append(tc)
+                for test_case_class in type(tc).__mro__:
+                    self._index.setdefault((tc.name, test_case_class), tc)
+
+        self._constructed.add(profile)
+
+    def _construct_all(self):
+        for profile in sorted(self._profiles - self._constructed):
+            self._construct(profile)
 
-    return test_cases
+    def lookup(self, name, test_case_class):
+        """Return 'test_case_class' instance if found or None otherwise"""
+        key = (name, test_case_class)
+        if key in self._index:
+            return self._index[key]
+
+        prefix = name.split('/')[0].lower()
+        if prefix in self._profiles and prefix not in self._constructed:
+            self._construct(prefix)
+            if key in self._index:
+                return self._index[key]
+
+        # Test cases are usually constructed by the profile of their name
+        # prefix, look only in the profiles with a matching name if not
+        # found there. Misses are common for LT2 and LT3 lookups.
+        for profile in sorted(self._profiles - self._constructed):
+            if profile.startswith(prefix) or prefix.startswith(profile):
+                self._construct(profile)
+
+        return self._index.get(key)
+
+    def __iter__(self):
+        self._construct_all()
+        return iter(self._test_cases)
+
+    def __len__(self):
+        self._construct_all()
+        return len(self._test_cases)
+
+
+def setup_test_cases(ptses):
+    return TestCases(ptses)
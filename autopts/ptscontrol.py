@@ -964,6 +964,32 @@ class PyPTS:
 
             raise Exception(e) from e
 
+    def set_pics_bulk(self, pics):
+        """Set many PICS with a single call
+
+        pics -- list of (project_name, entry_name, bool_value)
+        """
+        for project_name, entry_name, bool_value in pics:
+            self.set_pics(project_name, entry_name, bool_value)
+
+    def set_pixits_bulk(self, pixits):
+        """Set many PIXITs with a single call
+
+        Saves a round-trip per PIXIT when called over XMLRPC.
+
+        pixits -- list of (project_name, param_name, param_value)
+        """
+        for project_name, param_name, param_value in pixits:
+            self.set_pixit(project_name, param_name, param_value)
+
+    def update_pixit_params_bulk(self, pixits):
+        """Update many PIXITs with a single call
+
+        pixits -- list of (project_name, param_name, new_param_value)
+        """
+        for project_name, param_name, new_param_value in pixits:
+            self.update_pixit_param(project_name, param_name, new_param_value)
+
     def enable_maximum_logging(self, enable):
         """Enables/disables the maximum logging."""
 
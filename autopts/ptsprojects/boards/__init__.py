@@ -113,6 +113,30 @@ def get_build_and_flash(board_name):
         return None
 
 
+def get_flash(board_name):
+    """Returns flash function of the board, flashing already built images
+
+    Only returned if defined next to build_and_flash, so boards reusing
+    another board module but building differently are not flashed wrong.
+    """
+    board_mod = importlib.import_module(__package__ + '.' + board_name)
+
+    flash = getattr(board_mod, 'flash', None)
+    build_and_flash = getattr(board_mod, 'build_and_flash', None)
+    if flash is None or build_and_flash is None or \
+            flash.__module__ != build_and_flash.__module__:
+        return None
+
+    return flash
+
+
+def get_build_dirs(board_name):
+    """Returns directories with build artifacts, relative to project path"""
+    board_mod = importlib.import_module(__package__ + '.' + board_name)
+
+    return getattr(board_mod, 'build_dirs', None)
+
+
 def get_board_type(board_name):
     board_mod = importlib.import_module(__package__ + '.' + board_name)
 
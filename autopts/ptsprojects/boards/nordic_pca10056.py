@@ -20,6 +20,9 @@ from autopts.bot.common import check_call
 supported_projects = ['mynewt']
 board_type = 'nordic_pca10056'
 
+# Build artifacts and targets used by newt load, relative to project_path
+build_dirs = ['bin', 'targets/bttester', f'targets/{board_type}_boot']
+
 
 def reset_cmd(iutctl):
     """Return reset command for nRF52 DUT
@@ -80,6 +83,15 @@ def build_and_flash(project_path, board, overlay=None, debugger_snr=None):
                cwd=project_path)
     check_call('newt create-image -2 bttester timestamp'.split(), cwd=project_path)
 
+    flash(project_path, board, debugger_snr)
+
+
+def flash(project_path, board, debugger_snr=None):
+    """Flash already built Mynewt binary
+    :param project_path: Mynewt source path
+    :param board: IUT
+    :param debugger_snr: JLink serial number
+    """
     load_boot_cmd = f'newt load {board}_boot'.split()
     load_app_cmd = 'newt load bttester'.split()
     if debugger_snr:
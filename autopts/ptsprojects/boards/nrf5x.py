@@ -21,6 +21,9 @@ from autopts.bot.common import check_call
 
 supported_projects = ['zephyr']
 
+# Build artifacts, relative to zephyr_wd
+build_dirs = [os.path.join('tests', 'bluetooth', 'tester', 'build')]
+
 
 def reset_cmd(iutctl):
     """Return reset command for nRF5x DUT
@@ -51,5 +54,16 @@ def build_and_flash(zephyr_wd, board, debugger_snr, conf_file=None, *args):
         cmd.extend(('--', f'-DEXTRA_CONF_FILE=\'{conf_file}\''))
 
     check_call(cmd, cwd=tester_dir)
+    flash(zephyr_wd, board, debugger_snr)
+
+
+def flash(zephyr_wd, board, debugger_snr, *args):
+    """Flash already built Zephyr binary
+    :param zephyr_wd: Zephyr source path
+    :param board: IUT
+    :param debugger_snr serial number
+    """
+    tester_dir = os.path.join(zephyr_wd, "tests", "bluetooth", "tester")
+
     check_call(['west', 'flash', '--skip-rebuild', '--recover',
                 '-i', debugger_snr], cwd=tester_dir)
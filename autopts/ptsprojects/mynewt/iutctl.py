@@ -58,6 +58,7 @@ class MynewtCtl:
         self.test_case = None
         self.iut_log_file = None
         self.gdb = args.gdb
+        self.btp_log = args.btp_log
 
         if self.debugger_snr:
             self.btp_address = BTP_ADDRESS + self.debugger_snr
@@ -75,7 +76,7 @@ class MynewtCtl:
 
         self.flush_serial()
 
-        self.socket_srv = BTPSocketSrv(test_case.log_dir)
+        self.socket_srv = BTPSocketSrv(test_case.log_dir, self.btp_log)
         self.socket_srv.open(self.btp_address)
         self.btp_socket = BTPWorker(self.socket_srv)
 
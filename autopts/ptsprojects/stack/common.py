@@ -13,8 +13,11 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
-from threading import Lock, Event, Timer
-from time import sleep
+from collections import deque
+from collections.abc import MutableSequence
+from itertools import islice
+from threading import Condition, Lock
+from time import monotonic, sleep
 
 from autopts.utils import raise_on_global_end
 
@@ -38,58 +41,275 @@ class WildCard:
         return True
 
 
-def timeout_cb(flag):
-    flag.clear()
+# Max time a waiter sleeps before rechecking the global end flag
+EVENT_WAIT_INTERVAL = 1.0
+# Max time wait_for_event() sleeps before rechecking state that is not
+# updated by BTP event handlers
+STATE_POLL_INTERVAL = 0.1
 
+_event_cond = Condition()
 
-def wait_for_queue_event(event_queue, test, timeout, remove):
-    flag = Event()
-    flag.set()
 
-    t = Timer(timeout, timeout_cb, [flag])
-    t.name = f'QEventTimer{t.name}'
-    t.start()
+def notify_event():
+    """Wake up all wait_for_event() callers to re-evaluate their tests"""
+    with _event_cond:
+        _event_cond.notify_all()
 
-    while flag.is_set():
+
+def _match(test, ev):
+    if isinstance(ev, tuple):
+        return test(*ev)
+
+    return test(ev)
+
+
+class EventQueue(MutableSequence):
+    """Thread-safe store of received BTP events
+
+    Adding an event wakes up waiters immediately. If key is given,
+    events are also indexed by key(event), e.g. (addr_type, addr) or
+    ase_id, so that waiters for a given key skip unrelated events.
+    If maxlen is given, the queue works as a ring buffer and the oldest
+    events are dropped, counted in dropped.
+
+    The events are kept in a deque, every way of changing the queue goes
+    through the methods below, so the index and the waiters are kept in
+    sync with the content.
+    """
+
+    def __init__(self, key=None, maxlen=None):
+        self._events = deque()
+        self._cond = Condition()
+        self._key = key
+        self._index = {}
+        # Bumped when events are removed or moved, so waiters know to
+        # rescan from the start
+        self._generation = 0
+        self._maxlen = maxlen
+        self.dropped = 0
+
+    @property
+    def maxlen(self):
+        return self._maxlen
+
+    @maxlen.setter
+    def maxlen(self, maxlen):
+        with self._cond:
+            self._maxlen = maxlen
+            self._drop_oldest(0)
+
+    def _event_key(self, ev):
+        if isinstance(ev, tuple):
+            return self._key(*ev)
+
+        return self._key(ev)
+
+    def _add_index(self, ev):
+        if self._key:
+            self._index.setdefault(self._event_key(ev), []).append(ev)
+
+    def _unindex(self, ev):
+        if not self._key:
+            return
+
+        key = self._event_key(ev)
+        bucket = self._index[key]
+        bucket.remove(ev)
+        if not bucket:
+            del self._index[key]
+
+    def _drop_oldest(self, room):
+        """Drop oldest events, so that room more events fit"""
+        if self._maxlen is None:
+            return
+
+        while self._events and len(self._events) + room > self._maxlen:
+            self._unindex(self._events.popleft())
+            self.dropped += 1
+
+    def append(self, ev):
+        with self._cond:
+            self._drop_oldest(1)
+            self._events.append(ev)
+            self._add_index(ev)
+            self._cond.notify_all()
+
+        notify_event()
+
+    def extend(self, events):
+        for ev in events:
+            self.append(ev)
+
+    def insert(self, i, ev):
+        with self._cond:
+            self._drop_oldest(1)
+            self._events.insert(i, ev)
+            self._add_index(ev)
+            self._generation += 1
+            self._cond.notify_all()
+
+        notify_event()
+
+    def __setitem__(self, i, ev):
+        if isinstance(i, slice):
+            raise TypeError('EventQueue does not support slice assignment')
+
+        with self._cond:
+            self._unindex(self._events[i])
+            self._events[i] = ev
+            self._add_index(ev)
+            self._generation += 1
+            self._cond.notify_all()
+
+        notify_event()
+
+    def __delitem__(self, i):
+        if isinstance(i, slice):
+            raise TypeError('EventQueue does not support slice deletion')
+
+        with self._cond:
+            self._unindex(self._events[i])
+            del self._events[i]
+            self._generation += 1
+
+    def __getitem__(self, i):
+        with self._cond:
+            if isinstance(i, slice):
+                return list(self._events)[i]
+
+            return self._events[i]
+
+    def __len__(self):
+        return len(self._events)
+
+    def __iter__(self):
+        # Snapshot, the queue may change while the caller iterates
+        with self._cond:
+            return iter(list(self._events))
+
+    def __eq__(self, other):
+        if isinstance(other, EventQueue):
+            other = list(other)
+        return list(self) == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'EventQueue({list(self._events)!r})'
+
+    def pop(self, i=-1):
+        with self._cond:
+            ev = self._events[i]
+            del self[i]
+
+            return ev
+
+    def remove(self, ev):
+        with self._cond:
+            self._events.remove(ev)
+            self._unindex(ev)
+            self._generation += 1
+
+    def clear(self):
+        with self._cond:
+            self._events.clear()
+            self._index.clear()
+            self._generation += 1
+
+    def get_by_key(self, key):
+        """Return a list of events indexed under key"""
+        with self._cond:
+            return list(self._index.get(key, ()))
+
+    def wait(self, test, timeout, remove=False, key=None):
+        """Wait for the first event that passes test
+
+        test -- predicate called with the unpacked event tuple, or with
+                the event itself if it is not a tuple
+        key -- restrict the search to events indexed under this key
+        Returns the event or None on timeout.
+        """
+        deadline = monotonic() + timeout
+        checked = 0
+        generation = self._generation
+        dropped = self.dropped
+
+        with self._cond:
+            while True:
+                raise_on_global_end()
+
+                if key is not None and self._key:
+                    candidates = self._index.get(key, [])
+                    # Buckets are small, always rescan them
+                    checked = 0
+                else:
+                    candidates = self._events
+                    # Events dropped from the head shift the unchecked ones
+                    checked = max(0, checked - (self.dropped - dropped))
+
+                dropped = self.dropped
+
+                if generation != self._generation:
+                    generation = self._generation
+                    checked = 0
+
+                for ev in islice(candidates, checked, None):
+                    if _match(test, ev):
+                        if ev and remove:
+                            self.remove(ev)
+
+                        return ev
+
+                checked = len(candidates)
+
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+
+                self._cond.wait(min(remaining, EVENT_WAIT_INTERVAL))
+
+
+def wait_for_queue_event(event_queue, test, timeout, remove, key=None):
+    if isinstance(event_queue, EventQueue):
+        return event_queue.wait(test, timeout, remove, key)
+
+    # Plain lists are not notified on append, poll them
+    deadline = monotonic() + timeout
+
+    while True:
         raise_on_global_end()
 
         for ev in event_queue:
-            if isinstance(ev, tuple):
-                result = test(*ev)
-            else:
-                result = test(ev)
-
-            if result:
-                t.cancel()
+            if _match(test, ev):
                 if ev and remove:
                     event_queue.remove(ev)
 
                 return ev
 
-            # TODO: Use wait() and notify() from threading.Condition
-            #  instead of sleep()
-            sleep(0.5)
+        if monotonic() >= deadline:
+            return None
 
-    return None
+        sleep(STATE_POLL_INTERVAL)
 
 
 def wait_for_event(timeout, test, *args, **kwargs):
     if test(*args, **kwargs):
         return True
 
-    flag = Event()
-    flag.set()
+    deadline = monotonic() + timeout
 
-    t = Timer(timeout, timeout_cb, [flag])
-    t.name = f'EventTimer{t.name}'
-    t.start()
+    with _event_cond:
+        while True:
+            raise_on_global_end()
 
-    while flag.is_set():
-        raise_on_global_end()
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
 
-        result = test(*args, **kwargs)
-        if result:
-            t.cancel()
-            return result
+            # Most of the stack state is updated by BTP event handlers,
+            # which call notify_event() when done. The rest is polled.
+            _event_cond.wait(min(remaining, STATE_POLL_INTERVAL))
 
-    return False
+            result = test(*args, **kwargs)
+            if result:
+                return result
@@ -13,9 +13,27 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
+# Default capacity of the stream received queues, one event per SDU.
+# Older events are dropped.
+STREAM_RECEIVED_QUEUE_LEN = 256
+
+
+class StreamStats:
+    """Number of received SDUs and their payload bytes"""
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+
+    def update(self, data):
+        self.count += 1
+        self.bytes += len(data)
+
+    def __repr__(self):
+        return f'StreamStats(count={self.count}, bytes={self.bytes})'
+
 
 class BAP:
     class Peer:
@@ -28,21 +46,31 @@ class BAP:
         self.broadcast_id = 0x1000000  # Invalid Broadcast ID
         self.broadcast_code = ''
         self.event_queues = {
-            defs.BTP_BAP_EV_DISCOVERY_COMPLETED: [],
-            defs.BTP_BAP_EV_CODEC_CAP_FOUND: [],
-            defs.BTP_BAP_EV_ASE_FOUND: [],
-            defs.BTP_BAP_EV_STREAM_RECEIVED: [],
-            defs.BTP_BAP_EV_BAA_FOUND: [],
-            defs.BTP_BAP_EV_BIS_FOUND: [],
-            defs.BTP_BAP_EV_BIS_SYNCED: [],
-            defs.BTP_BAP_EV_BIS_STREAM_RECEIVED: [],
-            defs.BTP_BAP_EV_SCAN_DELEGATOR_FOUND: [],
-            defs.BTP_BAP_EV_BROADCAST_RECEIVE_STATE: [],
-            defs.BTP_BAP_EV_PA_SYNC_REQ: [],
+            defs.BTP_BAP_EV_DISCOVERY_COMPLETED: EventQueue(),
+            defs.BTP_BAP_EV_CODEC_CAP_FOUND: EventQueue(),
+            defs.BTP_BAP_EV_ASE_FOUND: EventQueue(),
+            defs.BTP_BAP_EV_STREAM_RECEIVED: EventQueue(
+                key=lambda addr_type, addr, ase_id, *_: (addr_type, addr, ase_id),
+                maxlen=STREAM_RECEIVED_QUEUE_LEN),
+            defs.BTP_BAP_EV_BAA_FOUND: EventQueue(),
+            defs.BTP_BAP_EV_BIS_FOUND: EventQueue(),
+            defs.BTP_BAP_EV_BIS_SYNCED: EventQueue(),
+            defs.BTP_BAP_EV_BIS_STREAM_RECEIVED: EventQueue(
+                key=lambda ev: (ev['broadcast_id'], ev['bis_id']),
+                maxlen=STREAM_RECEIVED_QUEUE_LEN),
+            defs.BTP_BAP_EV_SCAN_DELEGATOR_FOUND: EventQueue(),
+            defs.BTP_BAP_EV_BROADCAST_RECEIVE_STATE: EventQueue(),
+            defs.BTP_BAP_EV_PA_SYNC_REQ: EventQueue(),
         }
         self.event_handlers = {
             defs.BTP_BAP_EV_DISCOVERY_COMPLETED: self._ev_discovery_completed,
+            defs.BTP_BAP_EV_STREAM_RECEIVED: self._ev_stream_received,
+            defs.BTP_BAP_EV_BIS_STREAM_RECEIVED: self._ev_bis_stream_received,
         }
+        # (addr_type, addr, ase_id) -> StreamStats
+        self.stream_stats = {}
+        # (broadcast_id, bis_id) -> StreamStats
+        self.bis_stream_stats = {}
 
     def get_peer(self, addr_type, addr):
         key = (addr_type, addr)
@@ -55,9 +83,25 @@ class BAP:
     def set_broadcast_code(self, broadcast_code):
         self.broadcast_code = broadcast_code
 
+    def set_event_queue_len(self, event_type, maxlen):
+        """Set capacity of the event queue, None for unbounded"""
+        self.event_queues[event_type].maxlen = maxlen
+
+    def get_dropped_events(self, event_type):
+        return self.event_queues[event_type].dropped
+
+    def get_stream_stats(self, addr_type, addr, ase_id):
+        return self.stream_stats.get((addr_type, addr, ase_id), StreamStats())
+
+    def get_bis_stream_stats(self, broadcast_id, bis_id):
+        return self.bis_stream_stats.get((broadcast_id, bis_id), StreamStats())
+
     def event_received(self, event_type, event_data_tuple):
         if event_type in self.event_handlers:
-            self.event_handlers[event_type](*event_data_tuple)
+            if isinstance(event_data_tuple, tuple):
+                self.event_handlers[event_type](*event_data_tuple)
+            else:
+                self.event_handlers[event_type](event_data_tuple)
 
         self.event_queues[event_type].append(event_data_tuple)
 
@@ -87,7 +131,7 @@ class BAP:
             self.event_queues[defs.BTP_BAP_EV_STREAM_RECEIVED],
             lambda _addr_type, _addr, _ase_id, *_:
                 (addr_type, addr, ase_id) == (_addr_type, _addr, _ase_id),
-            timeout, remove)
+            timeout, remove, key=(addr_type, addr, ase_id))
 
     def wait_baa_found_ev(self, addr_type, addr, timeout, remove=True):
         return wait_for_queue_event(
@@ -111,7 +155,7 @@ class BAP:
         return wait_for_queue_event(
             self.event_queues[defs.BTP_BAP_EV_BIS_STREAM_RECEIVED],
             lambda ev: (broadcast_id, bis_id) == (ev['broadcast_id'], ev['bis_id']),
-            timeout, remove)
+            timeout, remove, key=(broadcast_id, bis_id))
 
     def wait_scan_delegator_found_ev(self, addr_type, addr, timeout, remove=False):
         return wait_for_queue_event(
@@ -141,3 +185,11 @@ class BAP:
     def _ev_discovery_completed(self, addr_type, addr, status):
         peer = self.get_peer(addr_type, addr)
         peer.discovery_completed = (status == defs.BTP_STATUS_SUCCESS)
+
+    def _ev_stream_received(self, addr_type, addr, ase_id, data):
+        key = (addr_type, addr, ase_id)
+        self.stream_stats.setdefault(key, StreamStats()).update(data)
+
+    def _ev_bis_stream_received(self, ev):
+        key = (ev['broadcast_id'], ev['bis_id'])
+        self.bis_stream_stats.setdefault(key, StreamStats()).update(ev['bid_data'])
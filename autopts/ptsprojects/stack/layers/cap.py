@@ -12,16 +12,16 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
 
 class CAP:
     def __init__(self):
         self.event_queues = {
-            defs.BTP_CAP_EV_DISCOVERY_COMPLETED: [],
-            defs.BTP_CAP_EV_UNICAST_START_COMPLETED: [],
-            defs.BTP_CAP_EV_UNICAST_STOP_COMPLETED: [],
+            defs.BTP_CAP_EV_DISCOVERY_COMPLETED: EventQueue(),
+            defs.BTP_CAP_EV_UNICAST_START_COMPLETED: EventQueue(),
+            defs.BTP_CAP_EV_UNICAST_STOP_COMPLETED: EventQueue(),
         }
 
     def event_received(self, event_type, event_data_tuple):
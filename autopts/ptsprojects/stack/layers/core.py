@@ -13,14 +13,14 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
 
 class CORE:
     def __init__(self):
         self.event_queues = {
-            defs.BTP_CORE_EV_IUT_READY: [],
+            defs.BTP_CORE_EV_IUT_READY: EventQueue(),
         }
 
     def event_received(self, event_type, event_data_tuple):
@@ -13,7 +13,7 @@
 # more details.
 #
 
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
 
@@ -22,9 +22,9 @@ class CSIP:
         self.member_cnt = 0
         self.wid_cnt = 0
         self.event_queues = {
-            defs.BTP_CSIP_EV_DISCOVERED: [],
-            defs.BTP_CSIP_EV_SIRK: [],
-            defs.BTP_CSIP_EV_LOCK: []
+            defs.BTP_CSIP_EV_DISCOVERED: EventQueue(),
+            defs.BTP_CSIP_EV_SIRK: EventQueue(),
+            defs.BTP_CSIP_EV_LOCK: EventQueue(),
         }
 
     def event_received(self, event_type, event_data):
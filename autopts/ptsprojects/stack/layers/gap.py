@@ -13,11 +13,135 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
+import binascii
 import logging
+from collections import OrderedDict
+from threading import Lock
 
 from autopts.ptsprojects.stack.common import Property, wait_for_event
 from autopts.pybtp.types import AdType, IOCap, Addr
 
+# Default limits of the discovery results, the oldest entries are dropped
+FOUND_DEVICES_MAX = 1024
+FOUND_DEVICE_REPORTS_MAX = 16
+
+
+def parse_eir_data(eir):
+    data = {}
+
+    eir_len = len(eir)
+    i = 0
+    while i + 1 < eir_len:
+        data_len = eir[i]
+        data_type = eir[i+1]
+        data[data_type] = eir[i+2:i+data_len+1]
+        i += 1 + data_len
+
+    return data
+
+
+class AdvReport:
+    """Advertising report with EIR parsed once, at event time"""
+    def __init__(self, rssi, flags, eir):
+        self.rssi = rssi
+        self.flags = flags
+        self.eir = eir
+        self.eir_hex = binascii.hexlify(eir).decode().upper()
+        self.ad = parse_eir_data(eir)
+
+        # 16-bit UUIDs in little endian, as in EIR
+        self.uuids = set()
+        for ad_type in (AdType.uuid16_some, AdType.uuid16_all):
+            uuid_list = self.ad.get(ad_type, b'')
+            self.uuids.update(bytes(uuid_list[i:i + 2])
+                              for i in range(0, len(uuid_list) - 1, 2))
+
+
+class FoundDevice:
+    def __init__(self, addr_type, addr):
+        self.addr_type = addr_type
+        self.addr = addr
+        # EIR -> AdvReport, reports with the same EIR are deduplicated
+        self.reports = OrderedDict()
+
+    def __repr__(self):
+        return "FoundDevice(%r, %r, %d reports)" % (self.addr_type, self.addr,
+                                                   len(self.reports))
+
+
+class FoundDevices:
+    """Discovery results indexed by (addr_type, addr)
+
+    Reports with the EIR already seen for a device only refresh RSSI and
+    flags. Both the number of devices and the number of distinct reports
+    per device are limited, the least recently reported are dropped.
+    """
+    def __init__(self, max_devices=FOUND_DEVICES_MAX,
+                 max_reports=FOUND_DEVICE_REPORTS_MAX):
+        self.max_devices = max_devices
+        self.max_reports = max_reports
+        self.dropped = 0
+        self._devices = OrderedDict()
+        self._lock = Lock()
+
+    def add(self, addr_type, addr, rssi, flags, eir):
+        key = (addr_type, addr)
+        eir = bytes(eir)
+
+        with self._lock:
+            device = self._devices.get(key)
+            if device is None:
+                device = FoundDevice(addr_type, addr)
+                self._devices[key] = device
+            else:
+                self._devices.move_to_end(key)
+
+            report = device.reports.get(eir)
+            if report is None:
+                device.reports[eir] = AdvReport(rssi, flags, eir)
+            else:
+                report.rssi = rssi
+                report.flags = flags
+                device.reports.move_to_end(eir)
+
+            while len(device.reports) > self.max_reports:
+                device.reports.popitem(last=False)
+                self.dropped += 1
+
+            while len(self._devices) > self.max_devices:
+                self._devices.popitem(last=False)
+                self.dropped += 1
+
+        return device
+
+    def get(self, addr_type, addr):
+        with self._lock:
+            return self._devices.get((addr_type, addr))
+
+    def get_reports(self, addr_type=None, addr=None):
+        """Returns snapshot of the reports of one or all devices"""
+        with self._lock:
+            if addr is not None:
+                device = self._devices.get((addr_type, addr))
+                devices = [device] if device else []
+            else:
+                devices = self._devices.values()
+
+            return [report for device in devices
+                    for report in device.reports.values()]
+
+    def clear(self):
+        with self._lock:
+            self._devices.clear()
+            self.dropped = 0
+
+    def __len__(self):
+        return len(self._devices)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._devices.values()))
+
 
 class ConnParams:
     def __init__(self, conn_itvl_min, conn_itvl_max, conn_latency, supervision_timeout):
@@ -90,7 +214,7 @@ class Gap:
             "type": None,
         })
         self.discoverying = Property(False)
-        self.found_devices = Property([])  # List of found devices
+        self.found_devices = Property(FoundDevices())
 
         self.passkey = Property(None)
         self.conn_params = Property(None)
@@ -207,7 +331,7 @@ class Gap:
 
     def reset_discovery(self):
         self.discoverying.data = True
-        self.found_devices.data = []
+        self.found_devices.data.clear()
 
     def set_passkey(self, passkey):
         self.passkey.data = passkey
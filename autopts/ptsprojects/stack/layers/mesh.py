@@ -14,7 +14,165 @@
 # more details.
 #
 import logging
-from autopts.ptsprojects.stack.common import Property, wait_for_event
+from array import array
+from collections import namedtuple
+from threading import Condition
+from time import monotonic
+
+from autopts.ptsprojects.stack.common import Property, wait_for_event, notify_event, EVENT_WAIT_INTERVAL
+from autopts.utils import raise_on_global_end
+
+MESH_PDU_NET = 0
+MESH_PDU_MODEL = 1
+
+# Max number of PDUs kept by MeshPduCapture, the oldest are dropped
+MESH_PDU_CAPTURE_MAXLEN = 8192
+
+# seq -- number of the PDU in the capture, counted from 0
+# payload -- raw bytes of the transport PDU or access payload
+MeshPdu = namedtuple('MeshPdu', 'seq timestamp kind ttl ctl src dst payload')
+
+
+class MeshPduCapture:
+    """Received mesh network and model PDUs
+
+    The header fields are kept in typed arrays and the payloads in one
+    bytearray, so the capture stays small over a long test case. Model
+    PDUs have ttl and ctl set to 0.
+    """
+
+    _fields = ('kind', 'ttl', 'ctl', 'src', 'dst')
+
+    def __init__(self, maxlen=MESH_PDU_CAPTURE_MAXLEN):
+        self._cond = Condition()
+        self.maxlen = maxlen
+        # seq of the first PDU kept
+        self._first_seq = 0
+        self._timestamp = array('d')
+        self._kind = array('B')
+        self._ttl = array('B')
+        self._ctl = array('B')
+        self._src = array('H')
+        self._dst = array('H')
+        # Offset of the payload in self._payloads, it ends where the next
+        # one starts
+        self._offset = array('L')
+        self._payloads = bytearray()
+
+    def __len__(self):
+        return len(self._kind)
+
+    @property
+    def next_seq(self):
+        """seq the next received PDU gets, to wait only for newer PDUs"""
+        with self._cond:
+            return self._first_seq + len(self._kind)
+
+    def _drop(self, count):
+        base = self._offset[count] if count < len(self._offset) else len(self._payloads)
+
+        for name in ('_timestamp', '_kind', '_ttl', '_ctl', '_src', '_dst'):
+            column = getattr(self, name)
+            del column[:count]
+
+        self._offset = array('L', (offset - base for offset in self._offset[count:]))
+        del self._payloads[:base]
+        self._first_seq += count
+
+    def add(self, kind, src, dst, payload, ttl=0, ctl=0):
+        with self._cond:
+            if len(self._kind) >= self.maxlen:
+                # Drop the older half, so the columns are not shifted on
+                # every PDU
+                self._drop(max(1, self.maxlen // 2))
+
+            self._timestamp.append(monotonic())
+            self._kind.append(kind)
+            self._ttl.append(ttl)
+            self._ctl.append(ctl)
+            self._src.append(src)
+            self._dst.append(dst)
+            self._offset.append(len(self._payloads))
+            self._payloads.extend(payload)
+
+            self._cond.notify_all()
+
+        notify_event()
+
+    def clear(self):
+        with self._cond:
+            self._drop(len(self._kind))
+
+    def _get(self, i):
+        end = self._offset[i + 1] if i + 1 < len(self._offset) else len(self._payloads)
+
+        return MeshPdu(self._first_seq + i, self._timestamp[i], self._kind[i],
+                       self._ttl[i], self._ctl[i], self._src[i], self._dst[i],
+                       bytes(self._payloads[self._offset[i]:end]))
+
+    def _find(self, start, predicate, fields):
+        columns = [(getattr(self, '_' + name), value) for name, value in fields.items()]
+
+        for i in range(start, len(self._kind)):
+            if not all(column[i] == value for column, value in columns):
+                continue
+
+            pdu = self._get(i)
+            if predicate is None or predicate(pdu):
+                return pdu
+
+        return None
+
+    def _check_fields(self, fields):
+        for name in fields:
+            if name not in self._fields:
+                raise TypeError(f'Unknown mesh PDU field {name}')
+
+    def find(self, since=0, predicate=None, **fields):
+        """Returns list of captured PDUs matching the fields and predicate
+
+        since -- seq of the first PDU to check
+        fields -- values of kind, ttl, ctl, src and dst to match
+        """
+        self._check_fields(fields)
+        pdus = []
+
+        with self._cond:
+            i = max(since - self._first_seq, 0)
+            while True:
+                pdu = self._find(i, predicate, fields)
+                if pdu is None:
+                    return pdus
+
+                pdus.append(pdu)
+                i = pdu.seq - self._first_seq + 1
+
+    def wait(self, timeout, since=0, predicate=None, **fields):
+        """Wait for the first PDU matching the fields and predicate
+
+        The PDUs already captured since the seq are checked first.
+        Returns the MeshPdu or None on timeout.
+        """
+        self._check_fields(fields)
+        deadline = monotonic() + timeout
+
+        with self._cond:
+            while True:
+                raise_on_global_end()
+
+                start = max(since - self._first_seq, 0)
+                pdu = self._find(start, predicate, fields)
+                if pdu is not None:
+                    return pdu
+
+                # Checked PDUs are skipped after wake up
+                since = self._first_seq + len(self._kind)
+
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return None
+
+                self._cond.wait(min(remaining, EVENT_WAIT_INTERVAL))
 
 
 class Mesh:
@@ -76,6 +234,12 @@ class Mesh:
         self.model_recv_ev_store = Property(False)
         # model_recv_ev_data (src, dst, payload)
         self.model_recv_ev_data = Property(None)
+        # All network and model PDUs received in the test case
+        self.pdu_capture = MeshPduCapture()
+        # seq of the first network PDU received since mesh_store_net_data()
+        self.net_data_seq = 0
+        # seq of the first model PDU not consumed by wait_for_model_added_op()
+        self.model_op_seq = 0
         self.incomp_timer_exp = Property(False)
         self.friendship = Property(False)
         self.lpn = Property(False)
@@ -167,18 +331,23 @@ class Mesh:
         return wait_for_event(timeout, lambda: uuid in self.nodes_added.data)
 
     def wait_for_model_added_op(self, timeout, op):
-        if self.model_recv_ev_data.data is not None and \
-               self.model_recv_ev_data.data[2][0:4] == op:
-            self.model_recv_ev_data.data = (0, 0, b'')
-            return True
+        """Wait for a model message with the opcode, each message is
+        consumed by one call
 
-        if wait_for_event(timeout,
-                          lambda: self.model_recv_ev_data.data is not None and
-                          self.model_recv_ev_data.data[2][0:4] == op):
-            self.model_recv_ev_data.data = (0, 0, b'')
-            return True
+        op -- hexlified first two bytes of the access payload, e.g. b'b72b'
+        """
+        op = bytes.fromhex(op.decode() if isinstance(op, bytes) else op)
 
-        return False
+        pdu = self.pdu_capture.wait(timeout, since=self.model_op_seq,
+                                    predicate=lambda pdu: pdu.payload[:2] == op,
+                                    kind=MESH_PDU_MODEL)
+        if pdu is None:
+            return False
+
+        self.model_op_seq = pdu.seq + 1
+        self.model_recv_ev_data.data = (0, 0, b'')
+
+        return True
 
     def set_iut_provisioner(self, _is_prov):
         self.iut_is_provisioner = _is_prov
@@ -13,16 +13,16 @@
 # FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
 # more details.
 #
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
 
 class VOCS:
     def __init__(self):
         self.event_queues = {
-            defs.BTP_VOCS_EV_OFFSET: [],
-            defs.BTP_VOCS_EV_AUDIO_LOC: [],
-            defs.BTP_VOCS_EV_PROCEDURE: []
+            defs.BTP_VOCS_EV_OFFSET: EventQueue(),
+            defs.BTP_VOCS_EV_AUDIO_LOC: EventQueue(),
+            defs.BTP_VOCS_EV_PROCEDURE: EventQueue(),
         }
 
     def event_received(self, event_type, event_data_tuple):
@@ -1,32 +1,57 @@
 import sqlite3
+import threading
 
 DATABASE_FILE = 'TestCase.db'
 
+# Keep bulk queries below SQLITE_MAX_VARIABLE_NUMBER of older sqlite builds
+MAX_QUERY_PARAMS = 500
+
 
 class TestCaseTable:
     def __init__(self, name, database_file=DATABASE_FILE):
         self.database_file = database_file
-        self._open()
         self.name = name
+        self.conn = None
+        self.cursor = None
+        self._lock = threading.RLock()
 
-        self.cursor.execute(
-            "CREATE TABLE IF NOT EXISTS {} (name TEXT, duration REAL, "
-            "count INTEGER, result TEXT);".format(self.name))
-        self.conn.commit()
-
-        self._close()
+        with self._lock:
+            self._open()
+            self.cursor.execute(
+                "CREATE TABLE IF NOT EXISTS {} (name TEXT, duration REAL, "
+                "count INTEGER, result TEXT);".format(self.name))
+            self.cursor.execute(
+                "CREATE INDEX IF NOT EXISTS {0}_name_idx ON {0} (name);".format(self.name))
+            self.conn.commit()
 
     def _open(self):
-        self.conn = sqlite3.connect(self.database_file)
+        """Open the connection once and keep it for the lifetime of the table"""
+        if self.conn:
+            return
+
+        # The connection is shared between the client threads, access is
+        # serialized with self._lock.
+        self.conn = sqlite3.connect(self.database_file, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
         self.cursor = self.conn.cursor()
 
-    def _close(self):
-        self.cursor.close()
-        self.conn.close()
+    def close(self):
+        """Checkpoint the WAL into the database file and close the connection.
 
-    def update_statistics(self, test_case_name, duration, result):
-        self._open()
+        Has to be called before the database file is moved or copied. The
+        connection is reopened on the next access.
+        """
+        with self._lock:
+            if not self.conn:
+                return
 
+            self.cursor.close()
+            self.conn.close()
+            self.cursor = None
+            self.conn = None
+
+    def _update_statistics(self, test_case_name, duration, result):
         self.cursor.execute(
             "SELECT duration, count FROM {} "
             "WHERE name=:name;".format(self.name), {"name": test_case_name})
@@ -35,8 +60,6 @@ class TestCaseTable:
             self.cursor.execute(
                 "INSERT INTO {} VALUES(?, ?, ?, ?);".format(self.name),
                 (test_case_name, duration, 1, result))
-            self.conn.commit()
-            self._close()
             return
 
         (mean, count) = row[0]
@@ -53,57 +76,139 @@ class TestCaseTable:
                                                    "count": count,
                                                    "name": test_case_name,
                                                    "result": result})
-        self.conn.commit()
-        self._close()
 
-    def get_mean_duration(self, test_case_name):
-        self._open()
+    def update_statistics(self, test_case_name, duration, result):
+        with self._lock:
+            self._open()
+            self._update_statistics(test_case_name, duration, result)
+            self.conn.commit()
 
-        self.cursor.execute(
-            "SELECT duration FROM {} "
-            "WHERE name=:name;".format(self.name), {"name": test_case_name})
-        row = self.cursor.fetchone()
-        self._close()
+    def update_statistics_bulk(self, updates):
+        """Update statistics of many test cases in a single transaction
+
+        updates -- iterable of (test_case_name, duration, result) tuples
+        """
+        with self._lock:
+            self._open()
+            for test_case_name, duration, result in updates:
+                self._update_statistics(test_case_name, duration, result)
+            self.conn.commit()
+
+    def _get_column(self, column, test_case_name):
+        with self._lock:
+            self._open()
+            self.cursor.execute(
+                "SELECT {} FROM {} "
+                "WHERE name=:name;".format(column, self.name), {"name": test_case_name})
+            row = self.cursor.fetchone()
 
         if row is not None:
             return row[0]
 
         return None
 
+    def _get_rows_bulk(self, columns, test_cases_names):
+        rows = {}
+        names = list(dict.fromkeys(test_cases_names))
+
+        with self._lock:
+            self._open()
+            for i in range(0, len(names), MAX_QUERY_PARAMS):
+                chunk = names[i:i + MAX_QUERY_PARAMS]
+                self.cursor.execute(
+                    "SELECT name, {} FROM {} WHERE name IN ({});".format(
+                        columns, self.name, ','.join('?' * len(chunk))), chunk)
+
+                for name, *row in self.cursor.fetchall():
+                    # Same as fetchone() for a single name, first row wins
+                    rows.setdefault(name, tuple(row))
+
+        return rows
+
+    def _get_column_bulk(self, column, test_cases_names):
+        rows = self._get_rows_bulk(column, test_cases_names)
+
+        return {name: row[0] for name, row in rows.items()}
+
+    def get_statistics(self, test_cases_names):
+        """Returns dict of test case name to (duration, count, result).
+
+        Test cases without statistics are omitted.
+        """
+        return self._get_rows_bulk('duration, count, result', test_cases_names)
+
+    def set_statistics(self, statistics):
+        """Overwrite statistics of test cases, e.g. with the ones from
+        a copy of the database updated by another test run.
+
+        statistics -- dict of test case name to (duration, count, result)
+        """
+        with self._lock:
+            self._open()
+            for test_case_name, (duration, count, result) in statistics.items():
+                self.cursor.execute(
+                    "DELETE FROM {} WHERE name=:name;".format(self.name),
+                    {"name": test_case_name})
+                self.cursor.execute(
+                    "INSERT INTO {} VALUES(?, ?, ?, ?);".format(self.name),
+                    (test_case_name, duration, count, result))
+            self.conn.commit()
+
+    def get_mean_duration(self, test_case_name):
+        return self._get_column('duration', test_case_name)
+
     def get_result(self, test_case_name):
-        self._open()
+        return self._get_column('result', test_case_name)
 
-        self.cursor.execute(
-            "SELECT result FROM {} "
-            "WHERE name=:name".format(self.name), {"name": test_case_name})
-        row = self.cursor.fetchone()
-        self._close()
+    def get_mean_durations(self, test_cases_names):
+        """Returns dict of test case name to mean duration.
 
-        if row is not None:
-            return row[0]
+        Test cases without statistics are omitted.
+        """
+        return self._get_column_bulk('duration', test_cases_names)
 
-        return None
+    def get_results(self, test_cases_names):
+        """Returns dict of test case name to the last result.
 
-    def estimate_session_duration(self, test_cases_names, run_count_max):
-        duration = 0
-        count_unknown = 0
-        num_test_cases = len(test_cases_names)
+        Test cases without statistics are omitted.
+        """
+        return self._get_column_bulk('result', test_cases_names)
+
+    def estimate_test_case_durations(self, test_cases_names, run_count_max):
+        """Returns dict of test case name to expected duration, retries included.
+
+        Test cases without statistics are assumed to take the mean of the
+        known ones.
+        """
+        durations = {}
+        unknown = []
+
+        last_results = self.get_results(test_cases_names)
+        mean_durations = self.get_mean_durations(test_cases_names)
 
         for test_case_name in test_cases_names:
             expected_run_count = 1
 
             # Assume worst case scenario
-            last_result = self.get_result(test_case_name)
+            last_result = last_results.get(test_case_name)
             if last_result and last_result != 'PASS':
                 expected_run_count = run_count_max
 
-            mean_time = self.get_mean_duration(test_case_name)
+            mean_time = mean_durations.get(test_case_name)
             if mean_time is None:
-                count_unknown += 1
+                unknown.append(test_case_name)
             else:
-                duration += mean_time * expected_run_count
+                durations[test_case_name] = mean_time * expected_run_count
 
-        if (num_test_cases - count_unknown) != 0:
-            duration += count_unknown * duration // (num_test_cases - count_unknown)
+        known_count = len(durations)
+        mean_duration = sum(durations.values()) / known_count if known_count else 0
+
+        for test_case_name in unknown:
+            durations[test_case_name] = mean_duration
+
+        return durations
+
+    def estimate_session_duration(self, test_cases_names, run_count_max):
+        durations = self.estimate_test_case_durations(test_cases_names, run_count_max)
 
-        return duration
+        return sum(durations.get(name, 0) for name in test_cases_names)
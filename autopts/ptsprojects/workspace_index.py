@@ -0,0 +1,263 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Offline index of PTS workspaces
+
+Lists the projects of .pqw6 workspace or .pts project files without PTS.
+The files are parsed with iterparse and the elements are dropped as soon
+as they are read, so big workspaces are indexed in constant memory.
+
+The list of active test cases is computed by PTS from the PICS and is not
+stored in the workspace. It is taken from a test case list file created
+with tools/cron/cache_testcases.py, YAML or JSON dict of project name to
+list of test case names.
+
+The index is cached in memory, and optionally in a JSON file, keyed by
+modification time and size of the source files.
+
+WorkspaceIndex has get_project_list() and get_test_case_list() like the
+PTS proxy, so it can be passed to client.get_test_cases(). The bot uses it
+instead of the PTS with the test_case_list_file option.
+"""
+
+import json
+import logging
+import os
+import threading
+import xml.etree.ElementTree as ET
+
+from autopts.utils import get_own_workspaces
+
+log = logging.debug
+
+CACHE_VERSION = 2
+
+# Source file path -> (stamp, WorkspaceIndex)
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def _parse_pqw6(path, projects):
+    """Parse PTS 6+ workspace: WORKSPACE_INFORMATION/PROJECTS_INFORMATION/
+    PROJECT_INFORMATION
+    """
+    name = None
+
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'PROJECT_INFORMATION':
+                projects.append(elem.get('NAME'))
+            elif elem.tag == 'WORKSPACE_INFORMATION':
+                name = elem.get('NAME')
+        elif elem.tag in ('Row', 'PICS', 'PIXIT', 'PROJECT_INFORMATION'):
+            elem.clear()
+
+    return name
+
+
+def _parse_pts(path, projects):
+    """Parse PTS project file: project/pics/profile, with the project and
+    profile names in the name elements
+    """
+    name = None
+    in_profile = False
+    profile_name = None
+
+    for event, elem in ET.iterparse(path, events=('start', 'end')):
+        tag = elem.tag
+
+        if event == 'start':
+            if tag == 'profile':
+                in_profile = True
+                profile_name = None
+            continue
+
+        if tag == 'name':
+            if not in_profile:
+                name = elem.text
+            elif profile_name is None:
+                profile_name = (elem.text or '').strip()
+                projects.append(profile_name)
+        elif tag == 'item':
+            elem.clear()
+        elif tag == 'profile':
+            in_profile = False
+            elem.clear()
+
+    return name
+
+
+def parse_workspace(path):
+    """Parse .pqw6 workspace or .pts project file
+
+    :return: dict with workspace name and list of project names
+    """
+    projects = []
+
+    if os.path.splitext(path)[1].lower() == '.pts':
+        name = _parse_pts(path, projects)
+    else:
+        name = _parse_pqw6(path, projects)
+
+    return {'name': name or os.path.splitext(os.path.basename(path))[0],
+            'projects': list(dict.fromkeys(projects))}
+
+
+def parse_test_cases_file(path):
+    """Parse test case list file, dict of project name to test case names"""
+    with open(path, 'r') as f:
+        if os.path.splitext(path)[1].lower() == '.json':
+            test_cases = json.load(f)
+        else:
+            import yaml
+            test_cases = yaml.safe_load(f)
+
+    return {project: list(tcs or []) for project, tcs in (test_cases or {}).items()}
+
+
+class WorkspaceIndex:
+    def __init__(self, name, projects, test_cases=None):
+        self.name = name
+        self.projects = projects
+        self.test_cases = test_cases
+
+    def get_project_list(self):
+        """Returns projects of the workspace, followed by projects known
+        only from the test case list
+        """
+        projects = list(self.projects)
+        if self.test_cases:
+            projects += [p for p in self.test_cases if p not in self.projects]
+
+        return tuple(projects)
+
+    def get_test_case_list(self, project_name):
+        """Returns active test cases of the project, empty if the index
+        was built without test case list
+        """
+        if not self.test_cases:
+            return ()
+
+        return tuple(self.test_cases.get(project_name, ()))
+
+    def to_dict(self):
+        return {'name': self.name, 'projects': self.projects,
+                'test_cases': self.test_cases}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['projects'], data.get('test_cases'))
+
+
+def _file_stamp(path):
+    if not path:
+        return None
+
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def resolve_workspace(workspace):
+    """Returns path of workspace file, workspace can be a name of auto-pts
+    own workspace
+    """
+    if os.path.isfile(workspace):
+        return workspace
+
+    own_workspaces = get_own_workspaces()
+    if workspace in own_workspaces:
+        return own_workspaces[workspace]
+
+    raise FileNotFoundError(f'Workspace {workspace} not found')
+
+
+def _load_cache_file(cache_file, stamp):
+    try:
+        with open(cache_file, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if data.get('version') != CACHE_VERSION or data.get('stamp') != stamp:
+        return None
+
+    return WorkspaceIndex.from_dict(data['index'])
+
+
+def _store_cache_file(cache_file, stamp, index):
+    tmp_file = cache_file + '.tmp'
+
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': CACHE_VERSION, 'stamp': stamp,
+                       'index': index.to_dict()}, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        log(f'Failed to store workspace index {cache_file}: {e}')
+
+
+def load_workspace_index(workspace, test_cases_file=None, cache_file=None):
+    """Returns WorkspaceIndex of the workspace, parsed again only if the
+    workspace or test case list file changed
+
+    workspace -- path to .pqw6/.pts file or name of auto-pts own workspace,
+                 None to index only the test case list
+    test_cases_file -- test case list file, see parse_test_cases_file()
+    cache_file -- JSON file to keep the index between runs
+    """
+    path = os.path.abspath(resolve_workspace(workspace)) if workspace else None
+    if test_cases_file:
+        test_cases_file = os.path.abspath(test_cases_file)
+
+    key = (path, test_cases_file)
+    stamp = {'workspace': _file_stamp(path),
+             'test_cases': _file_stamp(test_cases_file)}
+
+    with _index_cache_lock:
+        cached = _index_cache.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+    index = _load_cache_file(cache_file, stamp) if cache_file else None
+
+    if index is None:
+        log(f'Indexing workspace {path}, test cases {test_cases_file}')
+        if path:
+            workspace_info = parse_workspace(path)
+        else:
+            workspace_info = {'name': None, 'projects': []}
+        test_cases = parse_test_cases_file(test_cases_file) if test_cases_file else None
+        index = WorkspaceIndex(workspace_info['name'], workspace_info['projects'],
+                               test_cases)
+
+        if cache_file:
+            _store_cache_file(cache_file, stamp, index)
+
+    with _index_cache_lock:
+        _index_cache[key] = (stamp, index)
+
+    return index
+
+
+def load_test_case_index(workspace, test_cases_file, cache_file=None):
+    """Like load_workspace_index(), but the workspace may exist only on the
+    remote PTS machine, then the test case list file alone is indexed
+    """
+    try:
+        path = resolve_workspace(workspace) if workspace else None
+    except FileNotFoundError:
+        path = None
+
+    return load_workspace_index(path, test_cases_file, cache_file)
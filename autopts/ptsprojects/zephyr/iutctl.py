@@ -40,23 +40,32 @@ SERIAL_BAUDRATE = 115200
 CLI_SUPPORT = ['tty', 'hci', 'qemu']
 
 
-def get_qemu_cmd(kernel_image):
+def get_qemu_cmd(kernel_image, btp_address=BTP_ADDRESS):
     """Returns qemu command to start Zephyr
 
-    kernel_image -- Path to Zephyr kernel image"""
+    kernel_image -- Path to Zephyr kernel image
+    btp_address -- Path of the BTP socket"""
 
     qemu_cmd = ("%s -cpu cortex-m3 -machine lm3s6965evb -nographic "
                 "-serial mon:stdio "
                 "-serial unix:%s "
                 "-serial unix:/tmp/bt-server-bredr "
                 "-kernel %s" %
-                (QEMU_BIN, BTP_ADDRESS, kernel_image))
+                (QEMU_BIN, btp_address, kernel_image))
 
     return qemu_cmd
 
 
 class ZephyrCtl:
-    """Zephyr OS Control Class"""
+    """Zephyr OS Control Class
+
+    With persistent_iut the BTP socket, RX worker and socat of a board are
+    kept between test cases. The IUT state is reset by board reset over
+    the kept transport, and everything is started again only if the
+    session is broken. QEMU and native IUTs have no reset, only their
+    process is restarted and accepted on the kept BTP socket, so the boot
+    time of the IUT remains. Boards without reset are restarted as before.
+    """
 
     def __init__(self, args):
         """Constructor."""
@@ -72,6 +81,7 @@ class ZephyrCtl:
         self.hci = args.hci
         self.native = None
         self.gdb = args.gdb
+        self.btp_log = args.btp_log
         self.is_running = False
 
         if self.tty_file and args.board_name:  # DUT is a hardware board, not QEMU
@@ -81,6 +91,15 @@ class ZephyrCtl:
         else:  # DUT is QEMU or a board that won't be reset
             self.board = None
 
+        # Only the board reset or a new IUT process clears the whole IUT
+        # state
+        self.persistent_iut = args.persistent_iut and not self.gdb and \
+            (self.board is not None or not self.tty_file)
+        if args.persistent_iut and not self.persistent_iut:
+            logging.warning('persistent_iut requires a board with reset, QEMU '
+                            'or native IUT, the IUT will be restarted for each '
+                            'test case')
+
         self.qemu_process = None
         self.native_process = None
         self.socat_process = None
@@ -98,11 +117,24 @@ class ZephyrCtl:
         else:
             self.btp_address = BTP_ADDRESS
 
+        shard = getattr(args, 'shard', None)
+        if shard:
+            # Shards run in parallel on the same host, QEMU and native
+            # IUTs would bind the same socket
+            self.btp_address += f'-shard{shard[0]}'
+
     def start(self, test_case):
         """Starts the Zephyr OS"""
 
         log("%s.%s", self.__class__, self.start.__name__)
 
+        if self.persistent_iut and self.is_running:
+            if self.resume_session(test_case):
+                return
+
+            # Start again with a new transport
+            self.stop()
+
         self.is_running = True
         self.test_case = test_case
 
@@ -111,7 +143,7 @@ class ZephyrCtl:
         # partial or whole IUT ready event. Flush serial to ignore it.
         self.flush_serial()
 
-        self.socket_srv = BTPSocketSrv(test_case.log_dir)
+        self.socket_srv = BTPSocketSrv(test_case.log_dir, self.btp_log)
         self.socket_srv.open(self.btp_address)
         self.btp_socket = BTPWorker(self.socket_srv)
 
@@ -137,8 +169,16 @@ class ZephyrCtl:
                                                   shell=False,
                                                   stdout=subprocess.DEVNULL,
                                                   stderr=subprocess.DEVNULL)
-        elif self.hci is not None:
-            self.iut_log_file = open(os.path.join(test_case.log_dir, "autopts-iutctl-zephyr.log"), "a")
+        else:
+            self.start_iut_process(test_case.log_dir)
+
+        self.btp_socket.accept()
+
+    def start_iut_process(self, log_dir):
+        """Starts native or QEMU Zephyr process"""
+        self.iut_log_file = open(os.path.join(log_dir, "autopts-iutctl-zephyr.log"), "a")
+
+        if self.hci is not None:
             socat_cmd = ("socat -x -v %%s,rawer,b115200 UNIX-CONNECT:%s &" %
                          self.btp_address)
 
@@ -153,8 +193,7 @@ class ZephyrCtl:
                                                    stdout=self.iut_log_file,
                                                    stderr=self.iut_log_file)
         else:
-            self.iut_log_file = open(os.path.join(test_case.log_dir, "autopts-iutctl-zephyr.log"), "a")
-            qemu_cmd = get_qemu_cmd(self.kernel_image)
+            qemu_cmd = get_qemu_cmd(self.kernel_image, self.btp_address)
 
             log("Starting QEMU zephyr process: %s", qemu_cmd)
 
@@ -164,8 +203,53 @@ class ZephyrCtl:
                                                  stdout=self.iut_log_file,
                                                  stderr=self.iut_log_file)
 
+    def stop_iut_process(self):
+        """Stops native or QEMU Zephyr process"""
+        if self.native_process and self.native_process.poll() is None:
+            self.native_process.terminate()
+            self.native_process.wait()  # do not let zombies take over
+        self.native_process = None
+
+        if self.qemu_process and self.qemu_process.poll() is None:
+            time.sleep(1)
+            self.qemu_process.terminate()
+            self.qemu_process.wait()  # do not let zombies take over
+        self.qemu_process = None
+
+        if self.iut_log_file:
+            self.iut_log_file.close()
+            self.iut_log_file = None
+
+    def restart_iut_process(self):
+        """Starts new native or QEMU Zephyr process, accepted on the kept
+        BTP socket. The IUT ready event is sent at its startup.
+        """
+        self.stop_iut_process()
+        self.btp_socket.disconnect()
+        self.start_iut_process(self.test_case.log_dir)
         self.btp_socket.accept()
 
+    def resume_session(self, test_case):
+        """Continue the persistent IUT session with the next test case
+
+        Returns False if the session is broken and has to be started again.
+        """
+        if (self.socat_process and self.socat_process.poll() is not None) or \
+                not (self.btp_socket and self.btp_socket.is_running()):
+            log('IUT session is broken')
+            return False
+
+        # The board was reset at the end of the previous test case
+        self.test_case = test_case
+        self.btp_socket.reset_rx_queue()
+        self.btp_socket.set_log_dir(test_case.log_dir)
+
+        if not self.board:
+            # The process was stopped at the end of the previous test case
+            self.restart_iut_process()
+
+        return True
+
     def flush_serial(self):
         log("%s.%s", self.__class__, self.flush_serial.__name__)
         # Try to read data or timeout
@@ -214,10 +298,16 @@ class ZephyrCtl:
         stack = get_stack()
 
         if reset:
-            # For HW, the IUT ready event is triggered at board.reset()
-            self.stop()
-            # For QEMU, the IUT ready event is sent at startup of the process.
-            self.start(self.test_case)
+            if self.persistent_iut and self.is_running and self.board:
+                # The IUT ready event comes over the kept transport
+                self.reset_board()
+            elif self.persistent_iut and self.is_running:
+                self.restart_iut_process()
+            else:
+                # For HW, the IUT ready event is triggered at board.reset()
+                self.stop()
+                # For QEMU, the IUT ready event is sent at startup of the process.
+                self.start(self.test_case)
 
         else:
             if not self.gdb:
@@ -245,6 +335,45 @@ class ZephyrCtl:
             if len(stack.core.event_queues[defs.BTP_CORE_EV_IUT_READY]) == 0:
                 self.board.reset()
 
+    def reset_board(self):
+        """Reset the board and wait for the IUT ready event, the event is
+        left in the queue for the next wait_iut_ready_event()
+        """
+        stack = get_stack()
+
+        stack.core.event_queues[defs.BTP_CORE_EV_IUT_READY].clear()
+        self.board.reset()
+
+        ev = stack.core.wait_iut_ready_ev(30, False)
+        if ev:
+            log("IUT ready event received OK")
+        else:
+            log('IUT ready event NOT received!')
+
+    def stop_test_case(self):
+        """Ends the test case, the IUT is stopped unless persistent_iut"""
+        if not self.persistent_iut or not self.is_running or get_global_end():
+            self.stop()
+            return
+
+        log("%s.%s", self.__class__, self.stop_test_case.__name__)
+
+        self.rtt_logger_stop()
+        self.btmon_stop()
+
+        if not self.board:
+            # Started again by the next test case
+            self.stop_iut_process()
+            self.btp_socket.disconnect()
+        elif get_stack().core:
+            # The IUT ready event of this reset is used in the next test case
+            self.reset_board()
+
+        # Close and decode the BTP capture now, the log directory of the
+        # test case may be archived and removed before the next one starts
+        if self.btp_socket:
+            self.btp_socket.set_log_dir(None)
+
     def stop(self):
         """Powers off the Zephyr OS"""
         log("%s.%s", self.__class__, self.stop.__name__)
@@ -258,35 +387,14 @@ class ZephyrCtl:
         stack = get_stack()
         if not self.gdb and self.board and \
                 stack.core and not get_global_end():
-
-            stack.core.event_queues[defs.BTP_CORE_EV_IUT_READY].clear()
-            self.board.reset()
-
             # We have to wait for IUT ready event before we close socket
-            ev = stack.core.wait_iut_ready_ev(30, False)
-            if ev:
-                log("IUT ready event received OK")
-            else:
-                log('IUT ready event NOT received!')
+            self.reset_board()
 
         if self.btp_socket:
             self.btp_socket.close()
             self.btp_socket = None
 
-        if self.native_process and self.native_process.poll() is None:
-            self.native_process.terminate()
-            self.native_process.wait()  # do not let zombies take over
-            self.native_process = None
-
-        if self.qemu_process and self.qemu_process.poll() is None:
-            time.sleep(1)
-            self.qemu_process.terminate()
-            self.qemu_process.wait()  # do not let zombies take over
-            self.qemu_process = None
-
-        if self.iut_log_file:
-            self.iut_log_file.close()
-            self.iut_log_file = None
+        self.stop_iut_process()
 
         if self.socat_process:
             self.socat_process.terminate()
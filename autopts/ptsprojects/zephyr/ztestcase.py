@@ -49,10 +49,11 @@ class ZTestCase(TestCaseLT1):
 
         self.cmds.append(TestFuncCleanUp(self.stack.cleanup))
 
-        # Last command is to stop QEMU or HW.
+        # Last command is to stop QEMU or HW, or only end the test case
+        # if the IUT session is kept between test cases.
         # For HW, this will trigger the HW reset and the IUT ready event.
         # The event will be used in the next test case, to skip double reset.
-        self.cmds.append(TestFuncCleanUp(self.zephyrctl.stop))
+        self.cmds.append(TestFuncCleanUp(self.zephyrctl.stop_test_case))
 
 
 class ZTestCaseSlave(TestCaseLT2):
@@ -448,22 +448,24 @@ def bap_ev_discovery_completed_(bap, data, data_len):
     bap.event_received(defs.BTP_BAP_EV_DISCOVERY_COMPLETED, (addr_type, addr, status))
 
 
-def bap_ev_codec_cap_found_(bap, data, data_len):
-    logging.debug('%s %r', bap_ev_codec_cap_found_.__name__, data)
+_CODEC_CAP_FOUND_EV = struct.Struct('<B6sBBHBIB')
 
-    fmt = '<B6sBBHBIB'
-    if len(data) < struct.calcsize(fmt):
+
+def bap_ev_codec_cap_found_(bap, data, data_len):
+    # Reported once per codec capability of each PAC record, the raw data
+    # is already logged by btp.event_handler
+    if len(data) < _CODEC_CAP_FOUND_EV.size:
         raise BTPError('Invalid data length')
 
     addr_type, addr, pac_dir, coding_format, frequencies, frame_durations,\
-        octets_per_frame, channel_counts = struct.unpack_from(fmt, data)
+        octets_per_frame, channel_counts = _CODEC_CAP_FOUND_EV.unpack_from(data)
 
-    addr = binascii.hexlify(addr[::-1]).lower().decode('utf-8')
+    addr = binascii.hexlify(addr[::-1]).decode('utf-8')
 
-    logging.debug(f'Found codec capabilities: addr {addr} addr_type '
-                  f'{addr_type} pac_dir {pac_dir} coding {coding_format:#x} '
-                  f'freq {frequencies:#b} duration {frame_durations:#b} '
-                  f'frame_len {octets_per_frame:#x} channel_counts {channel_counts:#b}')
+    logging.debug('Found codec capabilities: addr %s addr_type %s pac_dir %s '
+                  'coding %#x freq %#x duration %#x frame_len %#x '
+                  'channel_counts %#x', addr, addr_type, pac_dir, coding_format,
+                  frequencies, frame_durations, octets_per_frame, channel_counts)
 
     bap.event_received(defs.BTP_BAP_EV_CODEC_CAP_FOUND,
                        (addr_type, addr, pac_dir, coding_format, frequencies,
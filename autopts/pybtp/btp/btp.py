@@ -17,13 +17,17 @@
 
 from collections import namedtuple
 from uuid import UUID
+import bisect
 import logging
 import re
 import struct
+import threading
+import time
 
-from autopts.ptsprojects.stack import get_stack
+from autopts.ptsprojects.stack import get_stack, notify_event
 from autopts.ptsprojects.testcase import MMI
 from .. import defs
+from autopts.pybtp.btp_names import get_opcode_name
 from autopts.pybtp.types import BTPError, att_rsp_str
 
 #  get IUT global method from iutctl
@@ -786,6 +790,7 @@ def init(get_iut_method):
     global get_iut
 
     get_iut = get_iut_method
+    build_event_routes()
     set_event_handler(event_handler)
 
 
@@ -820,6 +825,125 @@ from .pbp import PBP_EV
 from autopts.pybtp.iutctl_common import set_event_handler
 
 
+# BTP service ID -> (events of the service, Stack attribute of its layer)
+EVENT_SERVICES = {
+    defs.BTP_SERVICE_ID_MESH: (MESH_EV, 'mesh'),
+    defs.BTP_SERVICE_ID_L2CAP: (L2CAP_EV, 'l2cap'),
+    defs.BTP_SERVICE_ID_GAP: (GAP_EV, 'gap'),
+    defs.BTP_SERVICE_ID_GATT: (GATT_EV, 'gatt'),
+    defs.BTP_SERVICE_ID_GATTC: (GATTC_EV, 'gatt_cl'),
+    defs.BTP_SERVICE_ID_IAS: (IAS_EV, 'ias'),
+    defs.BTP_SERVICE_ID_VCS: (VCS_EV, 'vcs'),
+    defs.BTP_SERVICE_ID_AICS: (AICS_EV, 'aics'),
+    defs.BTP_SERVICE_ID_VOCS: (VOCS_EV, 'vocs'),
+    defs.BTP_SERVICE_ID_PACS: (PACS_EV, 'pacs'),
+    defs.BTP_SERVICE_ID_ASCS: (ASCS_EV, 'ascs'),
+    defs.BTP_SERVICE_ID_BAP: (BAP_EV, 'bap'),
+    defs.BTP_SERVICE_ID_CORE: (CORE_EV, 'core'),
+    defs.BTP_SERVICE_ID_MICP: (MICP_EV, 'micp'),
+    defs.BTP_SERVICE_ID_MICS: (MICS_EV, 'mics'),
+    defs.BTP_SERVICE_ID_CCP: (CCP_EV, 'ccp'),
+    defs.BTP_SERVICE_ID_VCP: (VCP_EV, 'vcp'),
+    defs.BTP_SERVICE_ID_MCP: (MCP_EV, 'mcp'),
+    defs.BTP_SERVICE_ID_GMCS: (GMCS_EV, 'gmcs'),
+    defs.BTP_SERVICE_ID_HAP: (HAP_EV, 'hap'),
+    defs.BTP_SERVICE_ID_CAP: (CAP_EV, 'cap'),
+    defs.BTP_SERVICE_ID_CSIP: (CSIP_EV, 'csip'),
+    defs.BTP_SERVICE_ID_TBS: (TBS_EV, 'tbs'),
+    defs.BTP_SERVICE_ID_TMAP: (TMAP_EV, 'tmap'),
+    defs.BTP_SERVICE_ID_OTS: (OTS_EV, 'ots'),
+    defs.BTP_SERVICE_ID_PBP: (PBP_EV, 'pbp'),
+    # GENERATOR append 3
+}
+
+# Upper bounds in seconds of the event handler latency histogram buckets,
+# the last bucket counts the slower ones
+EVENT_LATENCY_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1)
+
+EventRoute = namedtuple('EventRoute', 'handler layer')
+
+# (svc_id, op) -> EventRoute
+_event_routes = {}
+# (svc_id, op) -> tuple of subscribers, replaced on change so the RX
+# thread iterates over a snapshot
+_event_subscribers = {}
+_subscribers_lock = threading.Lock()
+
+# (svc_id, op) -> [count, total time, max time, histogram] of handler calls
+_event_stats = {}
+_event_stats_lock = threading.Lock()
+
+
+def build_event_routes():
+    """Build the event routing table from the *_EV handler tables
+
+    A route keeps the name of the Stack attribute of the layer, so it is
+    valid for layers created by *_init() and replaced by Stack.cleanup().
+    """
+    routes = {}
+
+    for svc_id, (events, layer) in EVENT_SERVICES.items():
+        for op, handler in events.items():
+            routes[(svc_id, op)] = EventRoute(handler, layer)
+
+    _event_routes.clear()
+    _event_routes.update(routes)
+
+
+def subscribe_event(svc_id, op, callback):
+    """Call callback(hdr, data) for each received event svc_id/op, after
+    it was handled by the stack
+    """
+    key = (svc_id, op)
+
+    with _subscribers_lock:
+        _event_subscribers[key] = _event_subscribers.get(key, ()) + (callback,)
+
+
+def unsubscribe_event(svc_id, op, callback):
+    key = (svc_id, op)
+
+    with _subscribers_lock:
+        subscribers = list(_event_subscribers.get(key, ()))
+        if callback in subscribers:
+            subscribers.remove(callback)
+
+        if subscribers:
+            _event_subscribers[key] = tuple(subscribers)
+        else:
+            _event_subscribers.pop(key, None)
+
+
+def _update_event_stats(key, duration):
+    with _event_stats_lock:
+        stats = _event_stats.get(key)
+        if stats is None:
+            stats = [0, 0, 0, [0] * (len(EVENT_LATENCY_BUCKETS) + 1)]
+            _event_stats[key] = stats
+
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+        stats[3][bisect.bisect_left(EVENT_LATENCY_BUCKETS, duration)] += 1
+
+
+def get_event_stats():
+    """Returns dict of (svc_id, op) to dict with event name, count, mean and
+    max duration in seconds of the handler calls and latency histogram,
+    counts of calls per EVENT_LATENCY_BUCKETS bucket
+    """
+    with _event_stats_lock:
+        return {key: {'name': get_opcode_name(*key, is_event=True),
+                      'count': count, 'mean': total / count, 'max': max_time,
+                      'histogram': list(histogram)}
+                for key, (count, total, max_time, histogram) in _event_stats.items()}
+
+
+def reset_event_stats():
+    with _event_stats_lock:
+        _event_stats.clear()
+
+
 def event_handler(hdr, data):
     logging.debug("%s %r %r", event_handler.__name__, hdr, data)
 
@@ -828,43 +952,24 @@ def event_handler(hdr, data):
         logging.info("Stack not initialized")
         return False
 
-    service_map = {
-        defs.BTP_SERVICE_ID_MESH: (MESH_EV, stack.mesh),
-        defs.BTP_SERVICE_ID_L2CAP: (L2CAP_EV, stack.l2cap),
-        defs.BTP_SERVICE_ID_GAP: (GAP_EV, stack.gap),
-        defs.BTP_SERVICE_ID_GATT: (GATT_EV, stack.gatt),
-        defs.BTP_SERVICE_ID_GATTC: (GATTC_EV, stack.gatt_cl),
-        defs.BTP_SERVICE_ID_IAS: (IAS_EV, stack.ias),
-        defs.BTP_SERVICE_ID_VCS: (VCS_EV, stack.vcs),
-        defs.BTP_SERVICE_ID_AICS: (AICS_EV, stack.aics),
-        defs.BTP_SERVICE_ID_VOCS: (VOCS_EV, stack.vocs),
-        defs.BTP_SERVICE_ID_PACS: (PACS_EV, stack.pacs),
-        defs.BTP_SERVICE_ID_ASCS: (ASCS_EV, stack.ascs),
-        defs.BTP_SERVICE_ID_BAP: (BAP_EV, stack.bap),
-        defs.BTP_SERVICE_ID_CORE: (CORE_EV, stack.core),
-        defs.BTP_SERVICE_ID_MICP: (MICP_EV, stack.micp),
-        defs.BTP_SERVICE_ID_MICS: (MICS_EV, stack.mics),
-        defs.BTP_SERVICE_ID_CCP: (CCP_EV, stack.ccp),
-        defs.BTP_SERVICE_ID_VCP: (VCP_EV, stack.vcp),
-        defs.BTP_SERVICE_ID_MCP: (MCP_EV, stack.mcp),
-        defs.BTP_SERVICE_ID_GMCS: (GMCS_EV, stack.gmcs),
-        defs.BTP_SERVICE_ID_HAP: (HAP_EV, stack.hap),
-        defs.BTP_SERVICE_ID_CAP: (CAP_EV, stack.cap),
-        defs.BTP_SERVICE_ID_CSIP: (CSIP_EV, stack.csip),
-        defs.BTP_SERVICE_ID_TBS: (TBS_EV, stack.tbs),
-        defs.BTP_SERVICE_ID_TMAP: (TMAP_EV, stack.tmap),
-        defs.BTP_SERVICE_ID_OTS: (OTS_EV, stack.ots),
-        defs.BTP_SERVICE_ID_PBP: (PBP_EV, stack.pbp),
-        # GENERATOR append 3
-    }
-
-    if hdr.svc_id in service_map:
-        event_dict, stack_obj = service_map[hdr.svc_id]
-        if hdr.op in event_dict and stack_obj:
-            cb = event_dict[hdr.op]
-            cb(stack_obj, data[0], hdr.data_len)
-            return True
-
-    # TODO: Raise BTP error instead of logging
-    logging.error("Unhandled event! svc_id %s op %s", hdr.svc_id, hdr.op)
-    return False
+    key = (hdr.svc_id, hdr.op)
+    route = _event_routes.get(key)
+    layer = getattr(stack, route.layer) if route else None
+    if not layer:
+        # TODO: Raise BTP error instead of logging
+        logging.error("Unhandled event! svc_id %s op %s", hdr.svc_id, hdr.op)
+        return False
+
+    start = time.perf_counter()
+    route.handler(layer, data[0], hdr.data_len)
+    _update_event_stats(key, time.perf_counter() - start)
+
+    notify_event()
+
+    for callback in _event_subscribers.get(key, ()):
+        try:
+            callback(hdr, data[0])
+        except Exception as e:
+            logging.exception("Event subscriber %r failed: %r", callback, e)
+
+    return True
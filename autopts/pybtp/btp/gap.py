@@ -25,7 +25,7 @@ from autopts.ptsprojects.stack import get_stack, ConnParams
 from autopts.pybtp import defs
 from autopts.pybtp.types import BTPError, gap_settings_btp2txt, addr2btp_ba, Addr, OwnAddrType, AdDuration, AdType
 from autopts.pybtp.btp.btp import pts_addr_get, pts_addr_type_get, lt2_addr_get, lt2_addr_type_get, btp_hdr_check, \
-    CONTROLLER_INDEX, set_pts_addr, set_lt2_addr, LeAdv, get_iut_method as get_iut, lt3_addr_type_get, lt3_addr_get, \
+    CONTROLLER_INDEX, set_pts_addr, set_lt2_addr, get_iut_method as get_iut, lt3_addr_type_get, lt3_addr_get, \
     set_lt3_addr
 
 GAP = {
@@ -145,26 +145,26 @@ def gap_new_settings_ev_(gap, data, data_len):
     __gap_current_settings_update(curr_set)
 
 
-def gap_device_found_ev_(gap, data, data_len):
-    logging.debug("%s %r", gap_device_found_ev_.__name__, data)
+# Headers of the high rate events, the raw data is already logged by
+# btp.event_handler
+_DEVICE_FOUND_HDR = struct.Struct('<B6sBBH')
+
 
-    fmt = '<B6sBBH'
-    if len(data) < struct.calcsize(fmt):
+def gap_device_found_ev_(gap, data, data_len):
+    if len(data) < _DEVICE_FOUND_HDR.size:
         raise BTPError("Invalid data length")
 
-    addr_type, addr, rssi, flags, eir_len = struct.unpack_from(fmt, data)
-    eir = data[struct.calcsize(fmt):]
+    addr_type, addr, rssi, flags, eir_len = _DEVICE_FOUND_HDR.unpack_from(data)
+    eir = data[_DEVICE_FOUND_HDR.size:]
 
     if len(eir) != eir_len:
         raise BTPError("Invalid data length")
 
-    addr = binascii.hexlify(addr[::-1]).lower()
+    addr = binascii.hexlify(addr[::-1])
 
     logging.debug("found %r type %r eir %r", addr, addr_type, eir)
 
-    stack = get_stack()
-    stack.gap.found_devices.data.append(LeAdv(addr_type, addr, rssi, flags,
-                                              eir))
+    gap.found_devices.data.add(addr_type, addr, rssi, flags, eir)
 
 
 def gap_connected_ev_(gap, data, data_len):
@@ -1230,20 +1230,6 @@ def gap_set_extended_advertising_off():
     __gap_current_settings_update(tuple_data)
 
 
-def parse_eir_data(eir):
-    data = {}
-
-    eir_len = len(eir)
-    i = 0
-    while i < eir_len:
-        data_len = eir[i]
-        data_type = eir[i+1]
-        data[data_type] = eir[i+2:i+data_len+1]
-        i += 1 + data_len
-
-    return data
-
-
 def check_discov_results(addr_type=None, addr=None, discovered=True, eir=None, uuids=None, svc_data=None):
     addr = pts_addr_get(addr).encode('utf-8')
     addr_type = pts_addr_type_get(addr_type)
@@ -1254,36 +1240,24 @@ def check_discov_results(addr_type=None, addr=None, discovered=True, eir=None, u
     found = False
 
     stack = get_stack()
-    devices = stack.gap.found_devices.data
+    reports = stack.gap.found_devices.data.get_reports(addr_type, addr)
 
-    for device in devices:
-        logging.debug("matching %r", device)
-        if addr_type != device.addr_type:
-            continue
-        if addr != device.addr:
+    uuids_ba = [bytes.fromhex(uuid.replace("-", ""))[::-1]
+                for uuid in uuids or []]
+
+    for report in reports:
+        logging.debug("matching %r", report.eir)
+        if eir and eir != report.eir:
             continue
-        if eir and eir != device.eir:
+
+        if uuids_ba and report.uuids and \
+                not all(uuid_ba in report.uuids for uuid_ba in uuids_ba):
             continue
 
-        if device.eir:
-            data = parse_eir_data(device.eir)
-            if uuids and ((AdType.uuid16_some in data) or
-                          (AdType.uuid16_all in data)):
-                uuid_list_type = AdType.uuid16_some if \
-                    (AdType.uuid16_some in data) else \
-                    AdType.uuid16_all
-                eir_uuids = [data[uuid_list_type][i:i + 2]
-                             for i in range(0, len(data[uuid_list_type]), 2)]
-
-                for uuid in uuids:
-                    uuid_ba = bytes.fromhex(uuid.replace("-", ""))[::-1]
-                    if uuid_ba not in eir_uuids:
-                        continue
-
-            if svc_data and AdType.uuid16_svc_data in data:
-                eir_svc_data = data[AdType.uuid16_svc_data]
-                if svc_data not in eir_svc_data:
-                    continue
+        if svc_data and AdType.uuid16_svc_data in report.ad:
+            eir_svc_data = report.ad[AdType.uuid16_svc_data]
+            if svc_data not in eir_svc_data:
+                continue
 
         found = True
         break
@@ -1296,7 +1270,7 @@ def check_discov_results(addr_type=None, addr=None, discovered=True, eir=None, u
 
 def check_scan_rep_and_rsp(report, response):
     stack = get_stack()
-    devices = stack.gap.found_devices.data
+    reports = stack.gap.found_devices.data.get_reports()
 
     # remove trailing zeros
     report = report.rstrip('0').upper()
@@ -1306,9 +1280,8 @@ def check_scan_rep_and_rsp(report, response):
     if len(response) % 2 != 0:
         response += '0'
 
-    for device in devices:
-        eir = str(binascii.hexlify(device.eir)).lstrip('b\'').rstrip('\'').upper()
-        if report in eir and response in eir:
+    for adv_report in reports:
+        if report in adv_report.eir_hex and response in adv_report.eir_hex:
             return True
     return False
 
@@ -120,11 +120,7 @@ GATT_EV = {
 }
 
 
-def gatts_add_svc(svc_type, uuid):
-    logging.debug("%s %r %r", gatts_add_svc.__name__, svc_type, uuid)
-
-    iutctl = get_iut()
-
+def _gatts_add_svc_cmd(svc_type, uuid):
     data_ba = bytearray()
     uuid_ba = bytes.fromhex(uuid.replace("-", ""))
 
@@ -132,16 +128,19 @@ def gatts_add_svc(svc_type, uuid):
     data_ba.extend(chr(len(uuid_ba)).encode('utf-8'))
     data_ba.extend(uuid_ba)
 
-    iutctl.btp_socket.send(*GATTS['add_svc'], data=data_ba)
-
-    gatt_command_rsp_succ()
+    return (*GATTS['add_svc'], data_ba)
 
 
-def gatts_add_inc_svc(hdl):
-    logging.debug("%s %r", gatts_add_inc_svc.__name__, hdl)
+def gatts_add_svc(svc_type, uuid):
+    logging.debug("%s %r %r", gatts_add_svc.__name__, svc_type, uuid)
 
     iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_add_svc_cmd(svc_type, uuid))
+
+    gatt_command_rsp_succ()
 
+
+def _gatts_add_inc_svc_cmd(hdl):
     if isinstance(hdl, str):
         hdl = int(hdl, 16)
 
@@ -149,17 +148,19 @@ def gatts_add_inc_svc(hdl):
     hdl_ba = struct.pack('H', hdl)
     data_ba.extend(hdl_ba)
 
-    iutctl.btp_socket.send(*GATTS['add_inc_svc'], data=data_ba)
-
-    gatt_command_rsp_succ()
+    return (*GATTS['add_inc_svc'], data_ba)
 
 
-def gatts_add_char(hdl, prop, perm, uuid):
-    logging.debug("%s %r %r %r %r", gatts_add_char.__name__, hdl, prop, perm,
-                  uuid)
+def gatts_add_inc_svc(hdl):
+    logging.debug("%s %r", gatts_add_inc_svc.__name__, hdl)
 
     iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_add_inc_svc_cmd(hdl))
+
+    gatt_command_rsp_succ()
 
+
+def _gatts_add_char_cmd(hdl, prop, perm, uuid):
     if isinstance(hdl, str):
         hdl = int(hdl, 16)
 
@@ -181,16 +182,20 @@ def gatts_add_char(hdl, prop, perm, uuid):
     data_ba.extend(chr(len(uuid_ba)).encode('utf-8'))
     data_ba.extend(uuid_ba)
 
-    iutctl.btp_socket.send(*GATTS['add_char'], data=data_ba)
-
-    gatt_command_rsp_succ()
+    return (*GATTS['add_char'], data_ba)
 
 
-def gatts_set_val(hdl, val):
-    logging.debug("%s %r %r ", gatts_set_val.__name__, hdl, val)
+def gatts_add_char(hdl, prop, perm, uuid):
+    logging.debug("%s %r %r %r %r", gatts_add_char.__name__, hdl, prop, perm,
+                  uuid)
 
     iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_add_char_cmd(hdl, prop, perm, uuid))
+
+    gatt_command_rsp_succ()
 
+
+def _gatts_set_val_cmd(hdl, val):
     if isinstance(hdl, str):
         hdl = int(hdl, 16)
 
@@ -208,16 +213,19 @@ def gatts_set_val(hdl, val):
     data_ba.extend(val_len_ba)
     data_ba.extend(val_ba)
 
-    iutctl.btp_socket.send(*GATTS['set_val'], data=data_ba)
+    return (*GATTS['set_val'], data_ba)
 
-    gatt_command_rsp_succ()
 
-
-def gatts_add_desc(hdl, perm, uuid):
-    logging.debug("%s %r %r %r", gatts_add_desc.__name__, hdl, perm, uuid)
+def gatts_set_val(hdl, val):
+    logging.debug("%s %r %r ", gatts_set_val.__name__, hdl, val)
 
     iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_set_val_cmd(hdl, val))
+
+    gatt_command_rsp_succ()
 
+
+def _gatts_add_desc_cmd(hdl, perm, uuid):
     if isinstance(hdl, str):
         hdl = int(hdl, 16)
 
@@ -235,7 +243,14 @@ def gatts_add_desc(hdl, perm, uuid):
     data_ba.extend(chr(len(uuid_ba)).encode('utf-8'))
     data_ba.extend(uuid_ba)
 
-    iutctl.btp_socket.send(*GATTS['add_desc'], data=data_ba)
+    return (*GATTS['add_desc'], data_ba)
+
+
+def gatts_add_desc(hdl, perm, uuid):
+    logging.debug("%s %r %r %r", gatts_add_desc.__name__, hdl, perm, uuid)
+
+    iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_add_desc_cmd(hdl, perm, uuid))
 
     gatt_command_rsp_succ()
 
@@ -282,21 +297,20 @@ def gatts_notify_mult(bd_addr_type, bd_addr, cnt, handles):
     gatt_command_rsp_succ()
 
 
+def _gatts_start_server_cmd():
+    return GATTS['start_server']
+
+
 def gatts_start_server():
     logging.debug("%s", gatts_start_server.__name__)
 
     iutctl = get_iut()
-    iutctl.btp_socket.send(*GATTS['start_server'])
+    iutctl.btp_socket.send(*_gatts_start_server_cmd())
 
     gatt_command_rsp_succ()
 
 
-def gatts_set_enc_key_size(hdl, enc_key_size):
-    logging.debug("%s %r %r", gatts_set_enc_key_size.__name__,
-                  hdl, enc_key_size)
-
-    iutctl = get_iut()
-
+def _gatts_set_enc_key_size_cmd(hdl, enc_key_size):
     if isinstance(hdl, str):
         hdl = int(hdl, 16)
 
@@ -306,23 +320,63 @@ def gatts_set_enc_key_size(hdl, enc_key_size):
     data_ba.extend(hdl_ba)
     data_ba.extend(chr(enc_key_size).encode('utf-8'))
 
-    iutctl.btp_socket.send(*GATTS['set_enc_key_size'], data=data_ba)
+    return (*GATTS['set_enc_key_size'], data_ba)
+
+
+def gatts_set_enc_key_size(hdl, enc_key_size):
+    logging.debug("%s %r %r", gatts_set_enc_key_size.__name__,
+                  hdl, enc_key_size)
+
+    iutctl = get_iut()
+    iutctl.btp_socket.send(*_gatts_set_enc_key_size_cmd(hdl, enc_key_size))
 
     gatt_command_rsp_succ()
 
 
+_GATTS_CMD_ENCODERS = {
+    gatts_add_svc: _gatts_add_svc_cmd,
+    gatts_add_inc_svc: _gatts_add_inc_svc_cmd,
+    gatts_add_char: _gatts_add_char_cmd,
+    gatts_set_val: _gatts_set_val_cmd,
+    gatts_add_desc: _gatts_add_desc_cmd,
+    gatts_set_enc_key_size: _gatts_set_enc_key_size_cmd,
+    gatts_start_server: _gatts_start_server_cmd,
+}
+
+
+def gatts_batch(calls):
+    """Build GATT server database with pipelined BTP commands.
+
+    The commands are sent without waiting for the response of the previous
+    one, so the database is built in fewer round trips to the IUT. The
+    order of the commands is kept.
+
+    calls -- list of (gatts_func, *args) tuples, e.g.
+             [(gatts_add_svc, 0, UUID.VND16_1), (gatts_start_server,)]
+    """
+    logging.debug("%s %d commands", gatts_batch.__name__, len(calls))
+
+    commands = [_GATTS_CMD_ENCODERS[func](*args) for func, *args in calls]
+
+    iutctl = get_iut()
+    iutctl.btp_socket.send_wait_rsp_pipelined(commands)
+
+
+_NOTIFICATION_EV_HDR = struct.Struct('<B6sBHH')
+
+
 def gattc_dec_notification_ev_data(frame):
-    fmt = '<B6sBHH'
-    if len(frame) < struct.calcsize(fmt):
+    if len(frame) < _NOTIFICATION_EV_HDR.size:
         raise BTPError("Invalid data length")
 
-    addr_type, addr, notification_type, handle, data_len = struct.unpack_from(fmt, frame)
-    data = frame[struct.calcsize(fmt):]
+    addr_type, addr, notification_type, handle, data_len = \
+        _NOTIFICATION_EV_HDR.unpack_from(frame)
+    data = frame[_NOTIFICATION_EV_HDR.size:]
 
     if len(data) != data_len:
         raise BTPError("Invalid data length")
 
-    addr = binascii.hexlify(addr[::-1]).lower().decode()
+    addr = binascii.hexlify(addr[::-1]).decode()
 
     return addr_type, addr, notification_type, handle, data
 
@@ -252,18 +252,19 @@ def l2cap_disconnected_ev(l2cap, data, data_len):
                   chan_id, psm, bd_addr, bd_addr_type, result_str)
 
 
+# The raw data of this high rate event is already logged by btp.event_handler
+_DATA_RCV_EV_HDR = struct.Struct('<BH')
+
+
 def l2cap_data_rcv_ev(l2cap, data, data_len):
-    logging.debug("%s %r %r", l2cap_data_rcv_ev.__name__, data, data_len)
+    chan_id, data_len = _DATA_RCV_EV_HDR.unpack_from(data)
+    data_rx = data[_DATA_RCV_EV_HDR.size:_DATA_RCV_EV_HDR.size + data_len]
 
-    hdr_fmt = '<BH'
-    hdr_len = struct.calcsize(hdr_fmt)
+    if len(data_rx) != data_len:
+        raise struct.error("Invalid data length")
 
-    chan_id, data_len = struct.unpack_from(hdr_fmt, data)
-    data_rx = struct.unpack_from('%ds' % data_len, data, hdr_len)[0]
     l2cap.rx(chan_id, data_rx)
 
-    logging.debug("id:%r, data:%s", chan_id, binascii.hexlify(data_rx))
-
 
 def l2cap_reconfigured_ev(l2cap, data, data_len):
     logging.debug("%s %r %r", l2cap_reconfigured_ev.__name__, data, data_len)
@@ -19,7 +19,7 @@ import binascii
 import logging
 import struct
 
-from autopts.ptsprojects.stack import get_stack
+from autopts.ptsprojects.stack import get_stack, MESH_PDU_MODEL, MESH_PDU_NET
 from autopts.pybtp import defs
 from autopts.pybtp.types import BTPError
 from autopts.pybtp.btp.btp import CONTROLLER_INDEX, get_iut_method as get_iut
@@ -896,12 +896,16 @@ def mesh_store_net_data():
     stack = get_stack()
 
     stack.mesh.net_recv_ev_store.data = True
+    # The network PDUs are verified from now on
+    stack.mesh.net_data_seq = stack.mesh.pdu_capture.next_seq
 
 
 def mesh_store_model_data():
     stack = get_stack()
 
     stack.mesh.model_recv_ev_store.data = True
+    # wait_for_model_added_op() waits for messages received from now on
+    stack.mesh.model_op_seq = stack.mesh.pdu_capture.next_seq
 
 
 def mesh_iv_test_mode_autoinit():
@@ -910,22 +914,36 @@ def mesh_iv_test_mode_autoinit():
     stack.mesh.iv_test_mode_autoinit = True
 
 
+_NET_RECV_EV_HDR = struct.Struct('<BBHHB')
+_MODEL_RECV_EV_HDR = struct.Struct('<HHB')
+
+
+def _recv_ev_payload(hdr, data):
+    """Unpack header of Net/Model Receive event, returns its fields with
+    the payload appended
+    """
+    fields = hdr.unpack_from(data)
+    payload = data[hdr.size:hdr.size + fields[-1]]
+
+    if len(payload) != fields[-1]:
+        raise BTPError("Invalid data length")
+
+    return fields + (payload,)
+
+
 def mesh_net_rcv_ev(mesh, data, data_len):
-    stack = get_stack()
+    ttl, ctl, src, dst, _, payload = _recv_ev_payload(_NET_RECV_EV_HDR, data)
+
+    mesh.pdu_capture.add(MESH_PDU_NET, src, dst, payload, ttl, ctl)
 
-    if not stack.mesh.net_recv_ev_store.data:
+    if not mesh.net_recv_ev_store.data:
         return
 
     logging.debug("%s %r %r", mesh_net_rcv_ev.__name__, data, data_len)
 
-    hdr_fmt = '<BBHHB'
-    hdr_len = struct.calcsize(hdr_fmt)
-
-    (ttl, ctl, src, dst, payload_len) = struct.unpack_from(hdr_fmt, data, 0)
-    (payload,) = struct.unpack_from('<%ds' % payload_len, data, hdr_len)
     payload = binascii.hexlify(payload)
 
-    stack.mesh.net_recv_ev_data.data = (ttl, ctl, src, dst, payload)
+    mesh.net_recv_ev_data.data = (ttl, ctl, src, dst, payload)
 
 
 def mesh_invalid_bearer_ev(mesh, data, data_len):
@@ -2135,25 +2153,22 @@ def mesh_prov_node_added_ev(mesh, data, data_len):
 
 
 def mesh_model_recv_ev(mesh, data, data_len):
-    logging.debug("%s %r %r", mesh_model_recv_ev.__name__, data, data_len)
+    src, dst, _, payload = _recv_ev_payload(_MODEL_RECV_EV_HDR, data)
 
-    stack = get_stack()
+    mesh.pdu_capture.add(MESH_PDU_MODEL, src, dst, payload)
 
-    if not stack.mesh.model_recv_ev_store.data:
+    if not mesh.model_recv_ev_store.data:
         return
 
-    hdr_fmt = '<HHB'
-    hdr_len = struct.calcsize(hdr_fmt)
+    logging.debug("%s %r %r", mesh_model_recv_ev.__name__, data, data_len)
 
-    (src, dst, payload_len) = struct.unpack_from(hdr_fmt, data, 0)
-    (payload,) = struct.unpack_from('<%ds' % payload_len, data, hdr_len)
     payload = binascii.hexlify(payload)
 
     if payload.startswith(b'66'):
         # do not count OP code and chunk number (1 + 2 = 3 bytes)
-        stack.mesh.blob_rxed_bytes += (len(payload)-6)//2
+        mesh.blob_rxed_bytes += (len(payload)-6)//2
 
-    stack.mesh.model_recv_ev_data.data = (src, dst, payload)
+    mesh.model_recv_ev_data.data = (src, dst, payload)
 
 def mesh_blob_lost_target_ev(mesh, data, data_len):
     logging.debug("%s %r %r", mesh_blob_lost_target_ev.__name__, data, data_len)
@@ -0,0 +1,81 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""BTP service and opcode name lookup tables, built once from defs.py"""
+
+import re
+
+from autopts.pybtp import defs
+
+UNDECODED_NAME = 'BTP Undecoded'
+STATUS_NAME = 'BTP_ERROR'
+
+# Service name, e.g. 'GAP' -> service ID
+SERVICE_IDS = {}
+# Service ID -> service name
+SERVICE_NAMES = {}
+# (svc_id, opcode, is_event) -> name, e.g. 'BTP_GAP_CMD_CONNECT'
+OPCODE_NAMES = {}
+# Name -> (svc_id, opcode, is_event)
+OPCODES = {}
+
+_opcode_name_re = re.compile(r'BTP_(\w+?)_(CMD|EV)_\w+')
+
+
+def _build_tables():
+    for name, value in vars(defs).items():
+        if name.startswith('BTP_SERVICE_ID_') and isinstance(value, int):
+            svc_name = name.replace('BTP_SERVICE_ID_', '')
+            SERVICE_IDS[svc_name] = value
+            SERVICE_NAMES.setdefault(value, svc_name)
+
+    for name, value in vars(defs).items():
+        if not isinstance(value, int):
+            continue
+
+        match = _opcode_name_re.fullmatch(name)
+        if not match or match.group(1) not in SERVICE_IDS:
+            continue
+
+        key = (SERVICE_IDS[match.group(1)], value, match.group(2) == 'EV')
+        # Aliases keep the first name defined
+        OPCODE_NAMES.setdefault(key, name)
+        OPCODES[name] = key
+
+
+_build_tables()
+
+
+def get_service_name(svc_id, default=''):
+    return SERVICE_NAMES.get(svc_id, default)
+
+
+def get_opcode_name(svc_id, op, is_event=None):
+    """Returns name of BTP command or event
+
+    is_event -- if None, deduced from opcode, events are 0x80 and above
+    """
+    if op == defs.BTP_STATUS:
+        return STATUS_NAME
+
+    if is_event is None:
+        is_event = op >= 0x80
+
+    return OPCODE_NAMES.get((svc_id, op, is_event), UNDECODED_NAME)
+
+
+def get_opcode(name):
+    """Returns (svc_id, opcode, is_event) of BTP command or event name"""
+    return OPCODES[name]
@@ -18,8 +18,9 @@ import os
 import queue
 import socket
 import sys
+import struct
 import threading
-import binascii
+import time
 import re
 
 
@@ -29,7 +30,8 @@ from autopts.pybtp import defs
 from autopts.pybtp.defs import *
 from datetime import datetime
 from autopts.pybtp.types import BTPError
-from autopts.pybtp.parser import enc_frame, dec_hdr, repr_hdr, dec_data, HDR_LEN
+from autopts.pybtp.btp_names import SERVICE_IDS, get_opcode_name
+from autopts.pybtp.parser import enc_frame, dec_hdr, dec_data, HDR_LEN
 from autopts.utils import get_global_end, raise_on_global_end
 
 log = logging.debug
@@ -37,6 +39,35 @@ log = logging.debug
 # BTP communication transport: unix domain socket file name
 BTP_ADDRESS = "/tmp/bt-stack-tester"
 
+# Max time a blocked reader sleeps before rechecking the global end flag
+GLOBAL_END_CHECK_INTERVAL = 1.0
+
+# Max number of pipelined commands waiting for response, the IUT has to
+# buffer them
+PIPELINE_WINDOW = 2
+
+# Formats of the BTP log written in the log directory, see BTPFrameCapture:
+# human-readable text log, or binary capture of raw frames, decoded later
+# with tools/btp_capture_decode.py
+BTP_LOG_TEXT = "text"
+BTP_LOG_CAPTURE = "capture"
+BTP_LOG_FORMATS = (BTP_LOG_TEXT, BTP_LOG_CAPTURE)
+BTP_LOG_FILE = "autopts-iutctl.log"
+BTP_CAPTURE_FILE = "autopts-iutctl.btpcap"
+
+CAPTURE_MAGIC = b'BTPCAP\x00\x01'
+# timestamp, direction, frame length
+CAPTURE_RECORD = struct.Struct('<dBI')
+CAPTURE_DIR_RX = 0
+CAPTURE_DIR_TX = 1
+
+BTP_STATUS_NAMES = {
+    1: 'Fail',
+    2: 'Unknown Command',
+    3: 'Not Ready',
+    4: 'Invalid Index'
+}
+
 EVENT_HANDLER = None
 
 
@@ -47,14 +78,125 @@ def set_event_handler(event_handler):
     EVENT_HANDLER = event_handler
 
 
+class BTPFrameCapture:
+    """BTP log of raw frames, written by a background thread
+
+    Frames are only queued by the caller, so RX and TX paths do not format
+    anything. With BTP_LOG_TEXT the frames are appended to the text log as
+    formatted by format_frame(). With BTP_LOG_CAPTURE the file starts with
+    CAPTURE_MAGIC, followed by records of CAPTURE_RECORD header (timestamp,
+    direction, frame length) and the raw frame. The file is flushed
+    whenever the queue is empty.
+    """
+
+    def __init__(self, path, log_format=BTP_LOG_TEXT):
+        self.path = path
+        self.log_format = log_format
+        self._queue = queue.SimpleQueue()
+
+        if log_format == BTP_LOG_CAPTURE:
+            self._file = open(path, 'ab')
+            if self._file.tell() == 0:
+                self._file.write(CAPTURE_MAGIC)
+        else:
+            self._file = open(path, 'a')
+
+        self._writer = threading.Thread(target=self._write_task, daemon=True)
+        self._writer.name = f'BTPFrameCapture{self._writer.name}'
+        self._writer.start()
+
+    def put(self, direction, *frame_parts):
+        """Queue frame for writing, frame may be split into parts"""
+        self._queue.put((time.time(), direction, frame_parts))
+
+    def _write_task(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+
+            timestamp, direction, frame_parts = item
+            if self.log_format == BTP_LOG_CAPTURE:
+                frame_len = sum(len(part) for part in frame_parts)
+                self._file.write(CAPTURE_RECORD.pack(timestamp, direction, frame_len))
+                for part in frame_parts:
+                    self._file.write(part)
+            else:
+                try:
+                    self._file.write(format_frame(timestamp, direction,
+                                                  b''.join(frame_parts)))
+                except Exception as e:
+                    logging.exception(e)
+
+            if self._queue.empty():
+                self._file.flush()
+
+        self._file.close()
+
+    def close(self):
+        """Write pending frames and close the file"""
+        self._queue.put(None)
+        self._writer.join()
+
+
+def read_capture(path):
+    """Yields (timestamp, direction, frame) records of BTP capture file"""
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise BTPError("%s is not a BTP capture file" % path)
+
+        while True:
+            rec = f.read(CAPTURE_RECORD.size)
+            if len(rec) < CAPTURE_RECORD.size:
+                return
+
+            timestamp, direction, frame_len = CAPTURE_RECORD.unpack(rec)
+            frame = f.read(frame_len)
+            if len(frame) < frame_len:
+                # Capture of a crashed session
+                return
+
+            yield timestamp, direction, frame
+
+
+def format_frame(timestamp, direction, frame):
+    """Format captured frame as in the BTP text log"""
+    hdr = dec_hdr(frame[:HDR_LEN])
+    data = frame[HDR_LEN:]
+    current_time = datetime.fromtimestamp(timestamp).strftime('%H:%M:%S:%f')
+    indent = ' ' * 18
+
+    hex_data = frame.hex(' ')
+    if len(hex_data) > 47:
+        # This ensures clean text indentation for longer raw data, with 16 bytes per line
+        hex_data = '\n' + indent + re.sub(r'(.{48})', r'\1\n' + indent, hex_data)
+
+    to_hex = "0x{:02x}".format
+    parsed_data = f'{get_opcode_name(hdr.svc_id, hdr.op)} ' \
+                  f'({to_hex(hdr.svc_id)}|{to_hex(hdr.op)}|{to_hex(hdr.ctrl_index)})' \
+                  f'\n{" " * 17} raw data ({len(data)}):'
+
+    if direction == CAPTURE_DIR_TX:
+        return f'{current_time[:-3]}\t> {parsed_data} {hex_data}\n'
+
+    if hdr.op == defs.BTP_STATUS and data:
+        err_status = BTP_STATUS_NAMES.get(data[0], data[0])
+        return f'{current_time[:-3]}\t<- Response:  {parsed_data} {hex_data} {err_status}\n'
+
+    return f'{current_time[:-3]}\t< {parsed_data} {hex_data}\n'
+
+
 class BTPSocket:
 
-    def __init__(self, log_dir=None):
+    def __init__(self, log_dir=None, log_format=BTP_LOG_TEXT):
         self.conn = None
         self.addr = None
-        self.btp_service_id_dict = None
-        self.log_file = open(os.path.join(log_dir, "autopts-iutctl.log"), "a")
-        self.btp_service_id_dict = self.get_svc_id()
+        self.log_dir = log_dir
+        self.log_format = log_format
+        self.capture = None
+
+        if log_dir:
+            self.capture = self._open_capture(log_dir)
 
     @abstractmethod
     def open(self, address):
@@ -66,43 +208,8 @@ class BTPSocket:
 
     @staticmethod
     def get_svc_id():
-        """Looks for BTP_SVC_ID variables from the defs.py"""
-        btp_service_ids = {}
-
-        for name, value in vars(defs).items():
-            if name.startswith('BTP_SERVICE_ID_') and isinstance(value, int):
-                trimmed_name = name.replace('BTP_SERVICE_ID_', '')
-                btp_service_ids[trimmed_name] = value
-
-        return btp_service_ids
-
-    def write_to_log(self, req, data, hex_data):
-        """Log decoded header and raw data"""
-        current_time = datetime.now().strftime('%H:%M:%S:%f')
-        f = self.log_file
-        indent = ' ' * 18
-
-        if len(hex_data) > 47:
-            # This ensures clean text indentation for longer raw data, with 16 bytes per line
-            hex_data = '\n' + indent + re.sub(r'(.{48})', r'\1\n' + indent, hex_data)
-
-        if req:
-            f.write(f'{current_time[:-3]}\t> {self.parse_data(data)} {hex_data}\n')
-        else:
-            f.write(f'{current_time[:-3]}\t< {self.parse_data(data)} {hex_data}\n')
-
-    def write_err_status(self, data, hex_data, status):
-        """Log command status value for error response"""
-        current_time = datetime.now().strftime('%H:%M:%S:%f')
-        f = self.log_file
-        status_values = {
-            1: 'Fail',
-            2: 'Unknown Command',
-            3: 'Not Ready',
-            4: 'Invalid Index'
-        }
-        err_status = status_values[int(status)]
-        f.write(f'{current_time[:-3]}\t<- Response:  {self.parse_data(data)} {hex_data} {err_status}\n')
+        """Returns service name to BTP service ID dict"""
+        return dict(SERVICE_IDS)
 
     def read(self, timeout=20.0):
         """Read BTP data from socket
@@ -123,11 +230,10 @@ class BTPSocket:
             hdr_memview = hdr_memview[nbytes:]
             toread_hdr_len -= nbytes
 
-        hex_hdr = ' '.join(hdr.hex()[i:i+2] for i in range(0, len(hdr.hex()), 2))
         tuple_hdr = dec_hdr(hdr)
         toread_data_len = tuple_hdr.data_len
 
-        logging.debug("Received: hdr: %s %r", repr_hdr(tuple_hdr), hdr)
+        logging.debug("Received: hdr: %r %r", tuple_hdr, hdr)
 
         data = bytearray(toread_data_len)
         data_memview = memoryview(data)
@@ -141,16 +247,10 @@ class BTPSocket:
             data_memview = data_memview[nbytes:]
             toread_data_len -= nbytes
 
-        data_string = binascii.hexlify(data).decode('utf-8')
-        data_string = ' '.join(f'{data_string[i:i+2]}' for i in range(0, len(data_string), 2))
-        raw_data = hex_hdr if data_string == '' else hex_hdr + ' ' + data_string
+        if self.capture:
+            self.capture.put(CAPTURE_DIR_RX, hdr, data)
 
-        if tuple_hdr.op == 0:
-            self.write_err_status(tuple_hdr, raw_data, data_string)
-        else:
-            # 0 for logging response, 1 for command
-            self.write_to_log(0, tuple_hdr, raw_data)
-        log(f"Received data: { {data_string} }, {data}")
+        log("Received data: %r", data)
 
         self.conn.settimeout(None)
         return tuple_hdr, dec_data(data)
@@ -158,61 +258,53 @@ class BTPSocket:
     def send(self, svc_id, op, ctrl_index, data):
         """Send BTP formated data over socket"""
         logging.debug("%s, %r %r %r %r",
-                      self.send.__name__, svc_id, op, ctrl_index, str(data))
+                      self.send.__name__, svc_id, op, ctrl_index, data)
 
         frame = enc_frame(svc_id, op, ctrl_index, data)
 
-        logging.debug("sending frame %r", frame.hex())
+        logging.debug("sending frame %r", frame)
+
+        if self.capture:
+            self.capture.put(CAPTURE_DIR_TX, frame)
 
-        hex_data = ' '.join(frame.hex()[i:i+2] for i in range(0, len(frame.hex()), 2))
-        tuple_data = (svc_id, op, ctrl_index, len(data) if isinstance(data, (str,  bytearray)) else data)
-        # 0 for logging response, 1 for command
-        self.write_to_log(1, tuple_data, hex_data)
         self.conn.send(frame)
 
-    def parse_data(self, data):
-        def get_btp_cmd_name(prefix, op_code):
-            """Looks for BTP Command variables from the defs.py"""
-            if op_code in ('0x0', '0x00'):
-                return 'BTP_ERROR'
-            for key, value in vars(defs).items():
-                if (key.startswith(f'BTP_{prefix}_CMD_') and value == int(op_code, 16)) or\
-                        (key.startswith(f'BTP_{prefix}_EV_') and value == int(op_code, 16)):
-                    return key
-
-            return 'BTP Undecoded'  # Return if no matching variable is found
-
-        parsed_data = ''
-        svc_name = ''
-        if isinstance(data, str):
-            svc_id = data[:2]
-            opc = data[2:4]
+    def _open_capture(self, log_dir):
+        if self.log_format == BTP_LOG_CAPTURE:
+            path = os.path.join(log_dir, BTP_CAPTURE_FILE)
         else:
-            svc_id, opc, ctrl_idx, data_len = data[0], data[1], data[2], data[3]
-        for name, btp_id in self.btp_service_id_dict.items():
-            if btp_id == int(svc_id):
-                svc_name += name
-                break
+            path = os.path.join(log_dir, BTP_LOG_FILE)
 
-        indent = "\n" + (" " * 17)
-        to_hex = lambda x: "0x{:02x}".format(int(x))
-        btp_command = get_btp_cmd_name(svc_name, to_hex(opc))
-        parsed_data += f'{btp_command} ({to_hex(svc_id)}|{to_hex(opc)}|{to_hex(ctrl_idx)}){indent} ' \
-                       f'raw data ({data_len}):'
+        return BTPFrameCapture(path, self.log_format)
 
-        return parsed_data
+    def set_log_dir(self, log_dir):
+        """Continue the BTP log in another log directory, e.g. of the next
+        test case when the connection is kept between test cases. The log
+        is closed in the old one, None stops logging.
+        """
+        capture = self.capture
+
+        self.log_dir = log_dir
+        self.capture = None
+        if log_dir:
+            self.capture = self._open_capture(log_dir)
+
+        if capture:
+            capture.close()
 
     @abstractmethod
     def close(self):
-        self.log_file.close()
-        self.log_file = None
-        pass
+        if not self.capture:
+            return
+
+        self.capture.close()
+        self.capture = None
 
 
 class BTPSocketSrv(BTPSocket):
 
-    def __init__(self, log_dir=None):
-        super().__init__(log_dir)
+    def __init__(self, log_dir=None, log_format=BTP_LOG_TEXT):
+        super().__init__(log_dir, log_format)
         self.sock = None
 
     def open(self, addres=BTP_ADDRESS):
@@ -240,12 +332,26 @@ class BTPSocketSrv(BTPSocket):
         self.conn, self.addr = self.sock.accept()
         self.sock.settimeout(None)
 
-    def close(self):
-        super().close()
+    def close_conn(self):
+        """Close the connection of the IUT, the listening socket is kept
+        for the next accept()
+        """
+        # The closed connection is kept, so a reader gets socket.error
+        if self.conn is None or self.conn.fileno() == -1:
+            return
+
         try:
             self.conn.shutdown(socket.SHUT_RDWR)
             self.conn.close()
-            self.sock.close()
+        except OSError as e:
+            logging.exception(e)
+
+    def close(self):
+        super().close()
+        self.close_conn()
+        try:
+            if self.sock:
+                self.sock.close()
         except BaseException as e:
             logging.exception(e)
         self.sock = None
@@ -270,6 +376,7 @@ class BTPSocketCli(BTPSocket):
         except OSError as e:
             logging.exception(e)
         finally:
+            super().close()
             self.conn = None
             self.addr = None
 
@@ -281,6 +388,8 @@ class BTPWorker:
         self._socket = sock
         self._rx_queue = queue.Queue()
         self._running = threading.Event()
+        # Cleared while the IUT is restarted, see disconnect()
+        self._connected = threading.Event()
         self._lock = threading.Lock()
 
         self._rx_worker = threading.Thread(target=self._rx_task)
@@ -292,6 +401,9 @@ class BTPWorker:
         log(f'{threading.current_thread().name} started')
         socket_ok = True
         while self._running.is_set() and not get_global_end():
+            if not self._connected.wait(timeout=GLOBAL_END_CHECK_INTERVAL):
+                continue
+
             try:
                 data = self._socket.read(timeout=1.0)
 
@@ -316,34 +428,33 @@ class BTPWorker:
 
         log(f'{threading.current_thread().name} finishing...')
 
-    @staticmethod
-    def _read_timeout(flag):
-        flag.clear()
-
     def read(self, timeout=20.0):
-        logging.debug("%s", self.read.__name__)
+        """Block until a frame is available on the RX queue
 
-        flag = threading.Event()
-        flag.set()
+        timeout - read timeout in seconds"""
+        logging.debug("%s", self.read.__name__)
 
-        t = threading.Timer(timeout, self._read_timeout, [flag])
-        t.start()
+        deadline = time.monotonic() + timeout
 
-        while flag.is_set():
+        while True:
             raise_on_global_end()
 
-            if self._rx_queue.empty():
-                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout
 
-            t.cancel()
+            try:
+                # Wake up periodically so Ctrl+C is not blocked until the
+                # deadline expires.
+                data = self._rx_queue.get(
+                    timeout=min(remaining, GLOBAL_END_CHECK_INTERVAL))
+            except queue.Empty:
+                continue
 
-            data = self._rx_queue.get()
             self._rx_queue.task_done()
 
             return data
 
-        raise socket.timeout
-
     def send(self, svc_id, op, ctrl_index, data):
         self._lock.acquire()
         try:
@@ -351,30 +462,75 @@ class BTPWorker:
         finally:
             self._lock.release()
 
+    @staticmethod
+    def _get_rsp_error(tuple_hdr, svc_id, op):
+        """Returns error message if the response does not match the command"""
+        if tuple_hdr.svc_id != svc_id:
+            return "Incorrect service ID %s in the response, expected %s!" % \
+                (tuple_hdr.svc_id, svc_id)
+
+        if tuple_hdr.op == defs.BTP_STATUS:
+            return "Error opcode in response!"
+
+        if op != tuple_hdr.op:
+            return "Invalid opcode 0x%.2x in the response, expected 0x%.2x!" % \
+                (tuple_hdr.op, op)
+
+        return None
+
     def send_wait_rsp(self, svc_id, op, ctrl_index, data):
         self._lock.acquire()
         try:
             self._socket.send(svc_id, op, ctrl_index, data)
             tuple_hdr, tuple_data = self.read()
 
-            if tuple_hdr.svc_id != svc_id:
-                raise BTPError(
-                    "Incorrect service ID %s in the response, expected %s!" %
-                    (tuple_hdr.svc_id, svc_id))
-
-            if tuple_hdr.op == defs.BTP_STATUS:
-                raise BTPError("Error opcode in response!")
-
-            if op != tuple_hdr.op:
-                raise BTPError(
-                    "Invalid opcode 0x%.2x in the response, expected 0x%.2x!" %
-                    (tuple_hdr.op, op))
+            error = self._get_rsp_error(tuple_hdr, svc_id, op)
+            if error:
+                raise BTPError(error)
 
             return tuple_data
         finally:
             self._lock.release()
 
-    def _reset_rx_queue(self):
+    def send_wait_rsp_pipelined(self, commands, window=PIPELINE_WINDOW):
+        """Send commands that do not depend on each other without waiting
+        for the response of the previous one
+
+        The IUT handles the commands in order, so the responses are matched
+        to the commands in order by service ID and opcode.
+
+        commands -- list of (svc_id, op, ctrl_index, data) tuples
+        window -- max number of commands waiting for response
+
+        Returns list of response data. If any of the commands failed,
+        BTPError is raised once all responses are received.
+        """
+        responses = []
+        errors = []
+        sent = 0
+
+        with self._lock:
+            while len(responses) < len(commands):
+                while sent < len(commands) and sent - len(responses) < window:
+                    self._socket.send(*commands[sent])
+                    sent += 1
+
+                tuple_hdr, tuple_data = self.read()
+
+                svc_id, op = commands[len(responses)][:2]
+                error = self._get_rsp_error(tuple_hdr, svc_id, op)
+                if error:
+                    errors.append(f'Command {len(responses)}: {error}')
+
+                responses.append(tuple_data)
+
+        if errors:
+            raise BTPError(' '.join(errors))
+
+        return responses
+
+    def reset_rx_queue(self):
+        """Drop frames not read yet"""
         while not self._rx_queue.empty():
             try:
                 self._rx_queue.get_nowait()
@@ -387,9 +543,22 @@ class BTPWorker:
         logging.debug("%s", self.accept.__name__)
 
         self._socket.accept(timeout)
+        self._connected.set()
 
-        self._running.set()
-        self._rx_worker.start()
+        if not self._running.is_set():
+            self._running.set()
+            self._rx_worker.start()
+
+    def disconnect(self):
+        """Close the connection of the IUT before it is restarted, the
+        listening socket, RX worker and capture are kept for accept()
+        """
+        self._connected.clear()
+
+        with self._lock:
+            self._socket.close_conn()
+
+        self.reset_rx_queue()
 
     def close(self):
         if self._running.is_set():
@@ -401,9 +570,16 @@ class BTPWorker:
                 log('Waiting for _rx_worker to finish ...')
                 self._rx_worker.join(timeout=1)
 
-        self._reset_rx_queue()
+        self.reset_rx_queue()
 
         self._socket.close()
 
+    def is_running(self):
+        """Returns True if the connection is accepted and RX worker runs"""
+        return self._running.is_set() and self._rx_worker.is_alive()
+
+    def set_log_dir(self, log_dir):
+        self._socket.set_log_dir(log_dir)
+
     def register_event_handler(self, event_handler):
         self.event_handler_cb = event_handler
@@ -18,6 +18,8 @@ from collections import namedtuple
 
 HDR_LEN = 5
 
+Header = namedtuple('Header', 'svc_id op ctrl_index data_len')
+
 
 def dec_hdr(frame):
     """Decode BTP frame header
@@ -29,8 +31,6 @@ def dec_hdr(frame):
     +------------+--------+------------------+-------------+
 
     """
-    Header = namedtuple('Header', 'svc_id op ctrl_index data_len')
-
     return Header._make(struct.unpack("<BBBH", frame))
 
 
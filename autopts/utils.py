@@ -161,6 +161,64 @@ class CounterWithFlag(ResultWithFlag):
         self.wait(timeout=timeout, predicate=predicate)
 
 
+class PrefixTrie:
+    """Character trie of prefixes, finds the prefixes of a string in a
+    single walk over its characters, whatever the number of prefixes
+
+    Each prefix keeps the value it was first inserted with.
+    """
+
+    def __init__(self, prefixes=()):
+        self._root = {}
+        self._empty = True
+
+        for prefix in prefixes:
+            self.insert(prefix)
+
+    def __bool__(self):
+        return not self._empty
+
+    def insert(self, prefix, value=True):
+        node = self._root
+        for char in prefix:
+            node = node.setdefault(char, {})
+
+        # The value is kept under None key, which is never a character
+        node.setdefault(None, value)
+        self._empty = False
+
+    def matches(self, string):
+        """Returns values of the prefixes of the string, shortest first"""
+        node = self._root
+        values = [node[None]] if None in node else []
+
+        for char in string:
+            node = node.get(char)
+            if node is None:
+                break
+
+            if None in node:
+                values.append(node[None])
+
+        return values
+
+    def has_prefix_of(self, string):
+        """Returns True if any of the prefixes is a prefix of the string"""
+        node = self._root
+        if None in node:
+            return True
+
+        for char in string:
+            node = node.get(char)
+            if node is None:
+                return False
+
+            if None in node:
+                return True
+
+        return False
+
+
 class InterruptableThread(threading.Thread):
     def __init__(self, group=None, target=None, name=None, args=(),
                  kwargs=None, *, daemon=None, queue=None, final_fun=None):
@@ -14,7 +14,8 @@
 #
 from typing import NamedTuple
 
-from .wid import generic_wid_hdl
+from .wid import generic_wid_hdl, wid_hdl, get_implemented_wids, list_implemented_wids, \
+    get_wid_dispatch_stats
 from .l2cap import l2cap_wid_hdl
 from .mesh import mesh_wid_hdl, mesh_wid_hdl_rpr_2ptses
 from .mesh import mesh_wid_hdl, mesh_wid_hdl_rpr_2ptses,\
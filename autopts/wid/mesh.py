@@ -19,12 +19,17 @@ import time
 
 from autopts.pybtp import btp
 from autopts.pybtp.types import Perm, MeshVals, WIDParams, UUID
-from autopts.ptsprojects.stack import get_stack
+from autopts.ptsprojects.stack import get_stack, MESH_PDU_NET
 from autopts.wid import generic_wid_hdl
 
 # Mesh ATS ver. 1.0
 log = logging.debug
 
+# Max time to wait for the network packet to be verified, if not received yet
+MESH_PDU_WAIT_TIMEOUT = 5
+# Unsegmented Friend Subscription List Confirm control message opcode
+FRIEND_SUB_LIST_CONFIRM = b'\x09'
+
 
 def mesh_wid_hdl(wid, description, test_case_name):
     log(f'{mesh_wid_hdl.__name__}, {wid}, {description}, {test_case_name}')
@@ -240,10 +245,6 @@ def hdl_wid_18(params: WIDParams):
 
     stack.mesh.net_recv_ev_store.data = False
 
-    if stack.mesh.net_recv_ev_data.data is None:
-        logging.error("Network Packet not received!")
-        return False
-
     # This pattern is matching Time to Live (TTL) value, Control (CTL),
     # Source (SRC) Destination (DST) and Payload of the network packet
     # to be received
@@ -255,20 +256,23 @@ def hdl_wid_18(params: WIDParams):
         return False
 
     params = dict(params)
-    pdu = hex(int(params['TransportPDU'], 16))
+    pdu = int(params['TransportPDU'], 16)
     ttl = int(params.get('TTL'), 16)
     ctl = int(params.get('CTL'), 16)
     src = int(params.get('SRC'), 16)
     dst = int(params.get('DST'), 16)
 
-    (recv_ttl, recv_ctl, recv_src, recv_dst, recv_pdu) = \
-        stack.mesh.net_recv_ev_data.data
-    recv_pdu = hex(int(recv_pdu, 16))
+    # Any of the packets received since WID 17 may match, not only the
+    # last one
+    recv = stack.mesh.pdu_capture.wait(
+        MESH_PDU_WAIT_TIMEOUT, since=stack.mesh.net_data_seq, kind=MESH_PDU_NET,
+        ttl=ttl, ctl=ctl, src=src, dst=dst,
+        predicate=lambda recv_pdu: int.from_bytes(recv_pdu.payload, 'big') == pdu)
+    if recv is None:
+        logging.error("Network Packet not received!")
+        return False
 
-    if pdu == recv_pdu and ttl == recv_ttl and ctl == recv_ctl \
-            and src == recv_src and dst == recv_dst:
-        return True
-    return False
+    return True
 
 
 def hdl_wid_19(params: WIDParams):
@@ -499,9 +503,6 @@ def hdl_wid_35(params: WIDParams):
 
     # FIXME: stack.mesh.net_recv_ev_store.data = False
 
-    if stack.mesh.net_recv_ev_data.data is None:
-        return False
-
     # This pattern is matching Time to Live (TTL) value, Control (CTL),
     # Source (SRC) and Destination (DST)
     pattern = re.compile(r'(TTL|CTL|SRC|DST):\s+\[([0][xX][0-9a-fA-F]+)]')
@@ -518,13 +519,10 @@ def hdl_wid_35(params: WIDParams):
     src = int(params.get('SRC'), 16)
     dst = int(params.get('DST'), 16)
 
-    (recv_ttl, recv_ctl, recv_src, recv_dst, recv_pdu) = \
-        stack.mesh.net_recv_ev_data.data
+    recv = stack.mesh.pdu_capture.wait(MESH_PDU_WAIT_TIMEOUT, since=stack.mesh.net_data_seq,
+                                       kind=MESH_PDU_NET, ttl=ttl, ctl=ctl, src=src, dst=dst)
 
-    if ttl == recv_ttl and ctl == recv_ctl and src == recv_src \
-            and dst == recv_dst:
-        return True
-    return False
+    return recv is not None
 
 
 def hdl_wid_36(params: WIDParams):
@@ -590,15 +588,10 @@ def hdl_wid_39(params: WIDParams):
 
     params = dict(params)
 
-    if not stack.mesh.net_recv_ev_data.data:
-        logging.error("No data received")
-        return False
-
-    (recv_ttl, recv_ctl, recv_src, recv_dst, recv_pdu) = \
-        stack.mesh.net_recv_ev_data.data
-
-    if int(params.get('address'), 16) != recv_dst:
-        logging.error("Destination address does not match")
+    recv = stack.mesh.pdu_capture.wait(MESH_PDU_WAIT_TIMEOUT, since=stack.mesh.net_data_seq,
+                                       kind=MESH_PDU_NET, dst=int(params.get('address'), 16))
+    if recv is None:
+        logging.error("No data received with the destination address")
         return False
 
     stack.mesh.net_recv_ev_data.data = None
@@ -704,15 +697,10 @@ def hdl_wid_51(params: WIDParams):
 
     params = dict(params)
 
-    if not stack.mesh.net_recv_ev_data.data:
-        logging.error("No data received")
-        return False
-
-    (recv_ttl, recv_ctl, recv_src, recv_dst, recv_pdu) = \
-        stack.mesh.net_recv_ev_data.data
-
-    if int(params.get('address'), 16) != recv_dst:
-        logging.error("Destination address does not match")
+    recv = stack.mesh.pdu_capture.wait(MESH_PDU_WAIT_TIMEOUT, since=stack.mesh.net_data_seq,
+                                       kind=MESH_PDU_NET, dst=int(params.get('address'), 16))
+    if recv is None:
+        logging.error("No data received with the destination address")
         return False
     return True
 
@@ -1856,9 +1844,13 @@ def hdl_wid_347(_: WIDParams):
 
     # Subscribe if not
     if group_address not in stack.mesh.lpn_subscriptions:
+        since = stack.mesh.pdu_capture.next_seq
         btp.mesh_lpn_subscribe(group_address)
         stack.mesh.lpn_subscriptions.append(group_address)
-        time.sleep(10)  # Give some time to subscribe
+        # Give some time to subscribe, until the Friend confirms it
+        stack.mesh.pdu_capture.wait(10, since=since, kind=MESH_PDU_NET, ctl=1,
+                                    predicate=lambda pdu: pdu.payload[:1] ==
+                                    FRIEND_SUB_LIST_CONFIRM)
 
     btp.mesh_lpn_unsubscribe(group_address)
     stack.mesh.lpn_subscriptions.remove(group_address)
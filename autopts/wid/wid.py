@@ -1,25 +1,159 @@
 import importlib
 import logging
+import pkgutil
+import re
+import threading
+import time
 
 from ..pybtp.types import WIDParams, MissingWIDError
 
 log = logging.debug
 
+_wid_hdl_name_re = re.compile(r'hdl_wid_(\d+)')
 
-def _generic_wid_hdl(wid, description, test_case_name, module_names):
-    wid_hdl = None
-    wid_str = f'hdl_wid_{wid}'
+# Module name -> {wid: handler} of handlers registered with @wid_hdl()
+_registered_hdls = {}
+# Module name -> {wid: handler}
+_module_tables = {}
+# Tuple of module names of the fallback chain -> {wid: handler}
+_chain_tables = {}
+# Reentrant, modules imported while building the tables may register handlers
+_tables_lock = threading.RLock()
+
+# (handler module name, wid) -> [count, total time, max time] of dispatches
+_dispatch_stats = {}
+_stats_lock = threading.Lock()
+
+
+def wid_hdl(*wids):
+    """Decorator registering a function as the handler of the WIDs in its
+    module, e.g. if one function handles several WIDs. Functions named
+    hdl_wid_<wid> are found without it.
+    """
+    def register(func):
+        module_hdls = _registered_hdls.setdefault(func.__module__, {})
+        for wid in wids:
+            module_hdls[int(wid)] = func
+
+        with _tables_lock:
+            _module_tables.pop(func.__module__, None)
+            _chain_tables.clear()
+
+        return func
+
+    return register
+
+
+def _build_module_table(module_name):
+    module = importlib.import_module(module_name)
+    table = {}
+
+    for name, value in vars(module).items():
+        match = _wid_hdl_name_re.fullmatch(name)
+        if match and callable(value):
+            table[int(match.group(1))] = value
+
+    table.update(_registered_hdls.get(module_name, {}))
+
+    return table
+
+
+def _get_chain_table(module_names):
+    chain = tuple(module_names)
+    table = _chain_tables.get(chain)
+    if table is not None:
+        return table
+
+    with _tables_lock:
+        table = {}
+        # The first module of the chain that handles a WID wins
+        for module_name in reversed(chain):
+            if module_name not in _module_tables:
+                _module_tables[module_name] = _build_module_table(module_name)
+            table.update(_module_tables[module_name])
+
+        _chain_tables[chain] = table
+
+    return table
+
+
+def reset_wid_tables():
+    """Drop the dispatch tables, e.g. after handlers were replaced"""
+    with _tables_lock:
+        _module_tables.clear()
+        _chain_tables.clear()
 
-    for module_name in module_names:
-        module = importlib.import_module(module_name)
-        if hasattr(module, wid_str):
-            wid_hdl = getattr(module, wid_str)
-            break
+
+def get_wid_hdl(wid, module_names):
+    """Returns handler of the WID from the first module of module_names
+    that implements it
+    """
+    wid_hdl = _get_chain_table(module_names).get(int(wid))
 
     if wid_hdl is None:
-        raise MissingWIDError(f'No {wid_str} found!')
+        raise MissingWIDError(f'No hdl_wid_{wid} found!')
+
+    return wid_hdl
+
+
+def get_implemented_wids(module_names):
+    """Returns sorted list of WIDs handled by the fallback chain"""
+    return sorted(_get_chain_table(module_names))
+
+
+def list_implemented_wids(package_name='autopts.wid'):
+    """Returns dict of profile module name to sorted list of WIDs it
+    implements, for all modules of the package
+    """
+    package = importlib.import_module(package_name)
+    wids = {}
+
+    for module_info in pkgutil.iter_modules(package.__path__):
+        if module_info.name == 'wid':
+            continue
+
+        module_name = f'{package_name}.{module_info.name}'
+        wids[module_info.name] = get_implemented_wids([module_name])
+
+    return wids
+
+
+def _update_dispatch_stats(key, duration):
+    with _stats_lock:
+        stats = _dispatch_stats.get(key)
+        if stats is None:
+            _dispatch_stats[key] = [1, duration, duration]
+            return
+
+        stats[0] += 1
+        stats[1] += duration
+        stats[2] = max(stats[2], duration)
+
+
+def get_wid_dispatch_stats():
+    """Returns dict of (handler module name, wid) to dict with count, mean
+    and max duration in seconds of the WID handler calls
+    """
+    with _stats_lock:
+        return {key: {'count': count, 'mean': total / count, 'max': max_time}
+                for key, (count, total, max_time) in _dispatch_stats.items()}
+
+
+def reset_wid_dispatch_stats():
+    with _stats_lock:
+        _dispatch_stats.clear()
+
+
+def _generic_wid_hdl(wid, description, test_case_name, module_names):
+    wid_hdl = get_wid_hdl(wid, module_names)
 
-    return wid_hdl(WIDParams(wid, description, test_case_name))
+    start = time.perf_counter()
+    try:
+        return wid_hdl(WIDParams(wid, description, test_case_name))
+    finally:
+        duration = time.perf_counter() - start
+        _update_dispatch_stats((wid_hdl.__module__, wid), duration)
+        log(f'{wid_hdl.__module__}.{wid_hdl.__name__} took {duration * 1000:.3f} ms')
 
 
 def generic_wid_hdl(wid, description, test_case_name, module_names):
@@ -36,11 +36,13 @@ import platform
 import shutil
 import subprocess
 import sys
+import tempfile
 import threading
 import time
 import traceback
 import xmlrpc.client
 import xmlrpc.server
+import zipfile
 
 from functools import partial
 from os.path import dirname, abspath
@@ -519,6 +521,10 @@ class Server(threading.Thread):
         self.server.register_function(self.list_workspace_tree, 'list_workspace_tree')
         self.server.register_function(self.copy_file, 'copy_file')
         self.server.register_function(self.delete_file, 'delete_file')
+        self.server.register_function(self.archive_workspace_tree, 'archive_workspace_tree')
+        self.server.register_function(self.delete_archived_workspace_tree,
+                                      'delete_archived_workspace_tree')
+        self.server.register_function(self.read_file_chunk, 'read_file_chunk')
         self.server.register_function(self.get_system_model, 'get_system_model')
         self.server.register_function(self.get_system_version, 'get_system_version')
         self.server.register_function(self.shutdown_pts_bpv, 'shutdown_pts_bpv')
@@ -602,6 +608,71 @@ class Server(threading.Thread):
                 file_bin = xmlrpc.client.Binary(handle.read())
         return file_bin
 
+    def _get_logs_root(self, workspace_dir):
+        if Path(workspace_dir).is_absolute():
+            return workspace_dir
+
+        return get_workspace(workspace_dir)
+
+    def archive_workspace_tree(self, workspace_dir):
+        """Packs the workspace tree into a zip archive
+
+        Returns path to the archive, that can be pulled with
+        read_file_chunk(). Once pulled, the archive and the packed files
+        are removed with delete_archived_workspace_tree(), or only the
+        archive with delete_file() if the pull failed.
+        """
+        self._update_request_time()
+        logs_root = self._get_logs_root(workspace_dir)
+
+        fd, archive_path = tempfile.mkstemp(prefix='autopts_logs_', suffix='.zip')
+        os.close(fd)
+
+        try:
+            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for root, dirs, files in os.walk(logs_root):
+                    for name in files:
+                        file_path = os.path.join(root, name)
+                        archive.write(file_path, os.path.relpath(file_path, logs_root))
+        except BaseException:
+            os.remove(archive_path)
+            raise
+
+        return archive_path
+
+    def delete_archived_workspace_tree(self, archive_path, workspace_dir, keep_ext):
+        """Removes the archive and the files packed into it, except the
+        ones with keep_ext extensions in the workspace root
+        """
+        self._update_request_time()
+        logs_root = self._get_logs_root(workspace_dir)
+
+        with zipfile.ZipFile(archive_path) as archive:
+            names = archive.namelist()
+
+        for name in names:
+            # Archive names use '/' separators
+            if '/' not in name and name.endswith(tuple(keep_ext)):
+                continue
+
+            file_path = os.path.join(logs_root, name)
+
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+
+        for root, dirs, files in os.walk(logs_root, topdown=False):
+            if root != logs_root and not os.listdir(root):
+                os.rmdir(root)
+
+        os.remove(archive_path)
+
+    def read_file_chunk(self, file_path, offset, size):
+        """Returns up to size bytes of the file from offset, empty at EOF"""
+        self._update_request_time()
+        with open(file_path, 'rb') as handle:
+            handle.seek(offset)
+            return xmlrpc.client.Binary(handle.read(size))
+
     def delete_file(self, file_path):
         self._update_request_time()
         if os.path.isfile(file_path):
@@ -23,6 +23,7 @@ from distutils.spawn import find_executable
 from autopts.config import SERVER_PORT, CLIENT_PORT, MAX_SERVER_RESTART_TIME
 from autopts.ptsprojects.boards import tty_exists, com_to_tty, get_debugger_snr
 from autopts.ptsprojects.testcase_db import DATABASE_FILE
+from autopts.pybtp.iutctl_common import BTP_LOG_FORMATS, BTP_LOG_TEXT
 from autopts.utils import ykush_replug_usb, raise_on_global_end, active_hub_server_replug_usb
 
 log = logging.debug
@@ -60,6 +61,16 @@ class CliParser(argparse.ArgumentParser):
         self.add_argument("--test_case_limit", nargs='?', type=int, default=0,
                           help="Limit of test cases to run")
 
+        self.add_argument("--schedule", action='store_true', default=False,
+                          help="Use test case history from the database (--store) "
+                               "to run likely failures first and fit as many "
+                               "test cases as possible in --test_case_limit or "
+                               "--time_budget")
+
+        self.add_argument("--time_budget", default=0, metavar='MINUTES', type=float,
+                          help="With --schedule, run only test cases expected "
+                               "to finish within the given time")
+
         self.add_argument("-r", "--retry", type=int, default=0,
                           help="Repeat test if failed. Parameter specifies "
                                "maximum repeat count per test")
@@ -93,6 +104,12 @@ class CliParser(argparse.ArgumentParser):
         self.add_argument("--pylink_reset", action='store_true', default=False,
                           help="Use pylink reset.")
 
+        self.add_argument("--btp_log", choices=BTP_LOG_FORMATS, default=BTP_LOG_TEXT,
+                          help="Format of the BTP log of test cases: text log "
+                               "written as the frames come, or binary capture "
+                               "of raw frames with less overhead, decoded with "
+                               "tools/btp_capture_decode.py")
+
         # Hidden option to save test cases data in TestCase.db
         self.add_argument("-s", "--store", action="store_true",
                           default=False, help=argparse.SUPPRESS)
@@ -141,6 +158,13 @@ class CliParser(argparse.ArgumentParser):
                                    "each test case. If board is not specified DUT "
                                    "will not be reset.")
 
+            self.add_argument("--persistent_iut", action='store_true', default=False,
+                              help="Keep the BTP connection to the board between "
+                                   "test cases and only reset the board. Requires "
+                                   "-b with a board that can be reset. QEMU and "
+                                   "native IUTs keep the BTP socket, but their "
+                                   "process is still restarted for each test case.")
+
             self.add_argument("--btmon",
                               help="Capture iut btsnoop logs from device over RTT"
                               "and catch them with btmon. Requires rtt support"
@@ -268,6 +292,7 @@ class CliParser(argparse.ArgumentParser):
         args = self.parse_args(None, arg_ns)
 
         args.superguard = 60 * args.superguard
+        args.time_budget = 60 * args.time_budget
         errmsg = ''
 
         if not args.ip_addr:
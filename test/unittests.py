@@ -1,17 +1,38 @@
+import json
 import os
 import shutil
+import socket
 import sys
+import tempfile
+import threading
 import unittest
+import zipfile
 from os.path import dirname, abspath
+from argparse import Namespace
 from pathlib import Path
 from unittest.mock import patch
 
-from autopts.client import FakeProxy, TestCaseRunStats
+from autopts.client import FakeProxy, PtsServerProxy, TestCaseRunStats, get_test_cases, run_or_not, \
+    schedule_test_cases, shard_test_cases
 from autopts.config import FILE_PATHS
 from autopts.ptsprojects.testcase_db import TestCaseTable
+from autopts.ptsprojects.workspace_index import load_test_case_index, load_workspace_index, \
+    parse_workspace
+from autopts.ptsprojects.stack import init_stack, cleanup_stack, get_stack
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
+from autopts.ptsprojects.stack.layers.mesh import MeshPduCapture, MESH_PDU_MODEL, MESH_PDU_NET
+from autopts.ptsprojects.zephyr.iutctl import ZephyrCtl
+from autopts.pybtp import btp, defs
+from autopts.pybtp.iutctl_common import BTPSocketSrv, BTPWorker, BTP_CAPTURE_FILE, BTP_LOG_FILE, \
+    BTP_LOG_CAPTURE, BTP_LOG_TEXT, read_capture
+from autopts.pybtp.parser import Header, HDR_LEN, dec_hdr, enc_frame
+from autopts.pybtp.types import BTPError, MissingWIDError
+from autopts.wid.wid import get_wid_hdl, get_implemented_wids
 from autoptsclient_bot import import_bot_projects, import_bot_module
 from test.mocks.mocked_test_cases import mock_workspace_test_cases, test_case_list_generation_samples
+from autopts.bot.common import distribute_test_cases
 from autopts.bot.common_features import report
+from autopts.bot.common_features.log_archiver import LogArchiver
 
 
 DATABASE_FILE = 'test/mocks/zephyr_database.db'
@@ -231,6 +252,13 @@ class MyTestCase(unittest.TestCase):
         Path(pts_logs).mkdir(parents=True, exist_ok=True)
         Path(xmls).mkdir(parents=True, exist_ok=True)
 
+        xml_name = report.get_xml_case_name(test_cases[0]) + '_2023_08_30_08_51_01.xml'
+        open(os.path.join(xmls, xml_name), 'w').close()
+        model = report.ReportModel(results, regressions, progresses, descriptions, xmls)
+        assert model.find_xml(test_cases[0]) == xml_name
+        assert model.find_xml(test_cases[1]) == ''
+        assert model.status_count == summary
+
         report.make_report_xlsx(FILE_PATHS['REPORT_XLSX_FILE'], results, summary,
                                 regressions, progresses, descriptions, xmls, errata)
         assert os.path.exists(FILE_PATHS['REPORT_XLSX_FILE'])
@@ -243,6 +271,497 @@ class MyTestCase(unittest.TestCase):
                                 results, regressions, progresses, new_cases)
         assert os.path.exists(FILE_PATHS['REPORT_DIFF_TXT_FILE'])
 
+    def test_schedule_test_cases(self):
+        """Check that likely failures run first and the time budget is kept"""
+
+        test_case_db = TestCaseTable('schedule', DATABASE_FILE)
+        test_case_db.update_statistics_bulk([('GAP/TC-1', 10, 'PASS'),
+                                             ('GAP/TC-2', 30, 'FAIL'),
+                                             ('GAP/TC-3', 20, 'PASS'),
+                                             ('GAP/TC-4', 5, 'PASS')])
+
+        test_cases = ['GAP/TC-1', 'GAP/TC-2', 'GAP/TC-3', 'GAP/TC-4', 'GAP/TC-5']
+
+        scheduled = schedule_test_cases(test_cases, test_case_db, 1)
+        assert scheduled == ['GAP/TC-2', 'GAP/TC-5', 'GAP/TC-4', 'GAP/TC-1', 'GAP/TC-3']
+
+        # GAP/TC-5 has no history, expected to take the mean of 16.25 s
+        scheduled = schedule_test_cases(test_cases, test_case_db, 1, time_budget=60)
+        assert scheduled == ['GAP/TC-2', 'GAP/TC-5', 'GAP/TC-4']
+
+        assert schedule_test_cases(test_cases, test_case_db, 1, limit=2) == ['GAP/TC-2', 'GAP/TC-5']
+        test_case_db.close()
+
+    def test_shard_test_cases(self):
+        """Check that test cases are split into shards of similar duration"""
+
+        durations = {'GAP/TC-1': 10, 'GAP/TC-2': 30, 'GAP/TC-3': 20, 'GAP/TC-4': 5}
+        test_cases = ['GAP/TC-1', 'GAP/TC-2', 'GAP/TC-3', 'GAP/TC-4', 'GAP/TC-5']
+
+        shards = shard_test_cases(test_cases, 2, durations)
+        assert shards == [['GAP/TC-2', 'GAP/TC-4'], ['GAP/TC-1', 'GAP/TC-3', 'GAP/TC-5']]
+
+        shards = shard_test_cases(test_cases, 3)
+        assert shards == [['GAP/TC-1', 'GAP/TC-4'], ['GAP/TC-2', 'GAP/TC-5'], ['GAP/TC-3']]
+
+        test_case_db = TestCaseTable('shard', DATABASE_FILE)
+        test_case_db.set_statistics({'GAP/TC-1': (10, 2, 'PASS')})
+        test_case_db.set_statistics({'GAP/TC-1': (12, 3, 'FAIL')})
+        assert test_case_db.get_statistics(test_cases) == {'GAP/TC-1': (12, 3, 'FAIL')}
+        test_case_db.close()
+
+    def test_wid_dispatch(self):
+        """Check that WID handlers are taken from the first module of the chain"""
+
+        chain = ['autopts.ptsprojects.zephyr.gap_wid', 'autopts.wid.gap']
+
+        assert get_wid_hdl(104, chain).__module__ == chain[0]
+        assert get_wid_hdl(77, chain).__module__ == chain[1]
+        assert 104 in get_implemented_wids(chain)
+        self.assertRaises(MissingWIDError, get_wid_hdl, 1, chain)
+
+    def test_pixit_queue(self):
+        """Check that PIXITs are sent in bulk only when flushed or before
+        a test case run
+        """
+        proxy = PtsServerProxy('127.0.0.1', 65000)
+        calls = []
+        proxy._ServerProxy__request = lambda method, params: calls.append((method, params))
+
+        proxy.set_pixit('GAP', 'TSPX_iut_device_name_in_adv_packet_for_random_address', 'Tester')
+        proxy.update_pixit_param('GAP', 'TSPX_bd_addr_iut', '000000000000')
+        assert hasattr(proxy, 'get_version')
+        assert not calls
+
+        proxy.run_test_case('GAP', 'GAP/BROB/BCST/BV-01-C')
+        assert [method for method, _ in calls] == ['set_pixits_bulk', 'update_pixit_params_bulk',
+                                                   'run_test_case']
+
+    def test_event_queue_wait(self):
+        """Check that waiters are woken up by matching events only"""
+
+        event_queue = EventQueue(key=lambda addr_type, addr, *_: (addr_type, addr))
+
+        def produce():
+            event_queue.append((0, 'aabbccddeeff', 1))
+            event_queue.append((1, '112233445566', 2))
+
+        timer = threading.Timer(0.1, produce)
+        timer.start()
+
+        ev = wait_for_queue_event(event_queue, lambda _addr_type, _addr, val: val == 2,
+                                  5, True, key=(1, '112233445566'))
+        timer.join()
+
+        assert ev == (1, '112233445566', 2)
+        assert event_queue == [(0, 'aabbccddeeff', 1)]
+        assert event_queue.get_by_key((1, '112233445566')) == []
+        assert wait_for_queue_event(event_queue, lambda *_: False, 0.1, True) is None
+
+        event_queue.maxlen = 2
+        for val in range(3, 6):
+            event_queue.append((0, 'aabbccddeeff', val))
+
+        assert event_queue.dropped == 2
+        assert event_queue.get_by_key((0, 'aabbccddeeff')) == [(0, 'aabbccddeeff', 4),
+                                                               (0, 'aabbccddeeff', 5)]
+
+        event_queue = EventQueue()
+        timer = threading.Timer(0.1, event_queue.extend, ([1, 2, 3],))
+        timer.start()
+        assert wait_for_queue_event(event_queue, lambda val: val == 3, 5, True) == 3
+        timer.join()
+
+        timer = threading.Timer(0.1, event_queue.insert, (0, 4))
+        timer.start()
+        assert wait_for_queue_event(event_queue, lambda val: val == 4, 5, True) == 4
+        timer.join()
+
+        event_queue[0] = 5
+        assert event_queue.pop(0) == 5
+        assert event_queue == [2]
+
+    def test_stats_journal_replay(self):
+        """Check that results are restored from the journal of a broken run"""
+
+        test_cases = ['GAP/BROB/BCST/BV-01-C', 'GAP/BROB/BCST/BV-02-C']
+        stats = TestCaseRunStats(['GAP'], test_cases, 0,
+                                 xml_results_file=FILE_PATHS['TC_STATS_RESULTS_XML_FILE'])
+        stats.update(test_cases[0], 10, 'PASS')
+        stats.update(test_cases[1], 10, 'FAIL')
+        stats.update(test_cases[1], 12, 'PASS')
+        stats.save_to_backup(FILE_PATHS['TC_STATS_JSON_FILE'])
+
+        restored = TestCaseRunStats.load_from_backup(FILE_PATHS['TC_STATS_JSON_FILE'])
+        assert restored.get_results() == stats.get_results()
+        assert restored.get_results()[test_cases[1]] == ('PASS', '2')
+
+        all_stats = TestCaseRunStats([], [], 0, xml_results_file=FILE_PATHS['ALL_STATS_RESULTS_XML_FILE'])
+        all_stats.merge(restored)
+        all_stats.write_xml()
+
+        reloaded = TestCaseRunStats([], [], 0, xml_results_file=FILE_PATHS['ALL_STATS_RESULTS_XML_FILE'])
+        assert reloaded.get_results() == stats.get_results()
+        assert reloaded.get_status_count() == {'PASS': 2}
+
+    def test_btp_pipelined_send(self):
+        """Check that pipelined commands keep the window and the responses
+        are matched to the commands in order
+        """
+
+        class FakeIUT:
+            def __init__(self, worker, failing_op=None):
+                self.worker = worker
+                self.failing_op = failing_op
+                self.max_in_flight = 0
+                self.sent = []
+
+            def send(self, svc_id, op, ctrl_index, data):
+                self.sent.append(op)
+                if op == self.failing_op:
+                    op = defs.BTP_STATUS
+                self.worker._rx_queue.put((Header(svc_id, op, ctrl_index, 0), b''))
+                # Responses not read yet
+                self.max_in_flight = max(self.max_in_flight, self.worker._rx_queue.qsize())
+
+        commands = [(defs.BTP_SERVICE_ID_GATT, op, 0, b'')
+                    for op in (defs.BTP_GATT_CMD_ADD_SERVICE, defs.BTP_GATT_CMD_ADD_CHARACTERISTIC,
+                               defs.BTP_GATT_CMD_SET_VALUE, defs.BTP_GATT_CMD_START_SERVER)]
+
+        worker = BTPWorker(None)
+        worker._socket = iut = FakeIUT(worker)
+
+        assert worker.send_wait_rsp_pipelined(commands, window=2) == [b''] * 4
+        assert iut.sent == [cmd[1] for cmd in commands]
+        assert iut.max_in_flight == 2
+
+        worker._socket = iut = FakeIUT(worker, defs.BTP_GATT_CMD_SET_VALUE)
+        with self.assertRaises(BTPError):
+            worker.send_wait_rsp_pipelined(commands)
+        # All responses are read, also the ones after the failing command
+        assert worker._rx_queue.empty()
+        assert iut.sent == [cmd[1] for cmd in commands]
+
+    def test_log_archiver(self):
+        """Check that test case logs are archived in background"""
+
+        session_log_dir = os.path.join(FILE_PATHS['IUT_LOGS_DIR'], 'cli_port_65001', '2024_01_01_00_00_00')
+        log_dirs = [os.path.join(session_log_dir, f'GAP_BROB_BCST_BV_0{i}_C_2024_01_01_00_00_0{i}')
+                    for i in range(1, 4)]
+        for log_dir in log_dirs:
+            os.makedirs(os.path.join(log_dir, 'btmon'))
+            with open(os.path.join(log_dir, 'btmon', 'btmon.log'), 'w') as f:
+                f.write('log' * 1000)
+
+        archiver = LogArchiver('deflate', 9)
+        for log_dir in log_dirs + log_dirs[:1]:
+            archiver.submit(log_dir)
+        archives = archiver.wait()
+        archiver.shutdown()
+
+        assert archives == [log_dir + '.zip' for log_dir in map(os.path.abspath, log_dirs)]
+        for log_dir, archive in zip(log_dirs, archives):
+            assert not os.path.exists(log_dir)
+            with zipfile.ZipFile(archive) as zf:
+                name = f'{os.path.basename(log_dir)}/btmon/btmon.log'
+                assert zf.read(name) == b'log' * 1000
+                assert zf.getinfo(name).compress_type == zipfile.ZIP_DEFLATED
+
+    def test_mesh_pdu_capture(self):
+        """Check filtering of and waiting for captured mesh PDUs"""
+
+        capture = MeshPduCapture(maxlen=4)
+        capture.add(MESH_PDU_NET, 0x0001, 0x0003, b'\x09\x01', ttl=5, ctl=1)
+        capture.add(MESH_PDU_MODEL, 0x0001, 0x0003, b'\xb7\x2b')
+        capture.add(MESH_PDU_NET, 0x0002, 0x0003, b'', ttl=0, ctl=0)
+
+        pdus = capture.find(kind=MESH_PDU_NET, dst=0x0003)
+        assert [(pdu.seq, pdu.src, pdu.payload) for pdu in pdus] == \
+            [(0, 0x0001, b'\x09\x01'), (2, 0x0002, b'')]
+        assert capture.find(predicate=lambda pdu: pdu.payload[:2] == b'\xb7\x2b')[0].kind == MESH_PDU_MODEL
+        assert capture.wait(0.01, since=1, ctl=1) is None
+
+        since = capture.next_seq
+        timer = threading.Timer(0.2, capture.add, (MESH_PDU_NET, 0x0001, 0x0004, b'\x0a', 3, 1))
+        timer.start()
+        pdu = capture.wait(5, since=since, ctl=1)
+        timer.join()
+        assert (pdu.seq, pdu.dst, pdu.ttl, pdu.payload) == (3, 0x0004, 3, b'\x0a')
+
+        # The oldest half is dropped when full, seq keeps counting
+        capture.add(MESH_PDU_MODEL, 0x0001, 0x0003, b'\x82\x04')
+        assert len(capture) == 3
+        assert [pdu.seq for pdu in capture.find()] == [2, 3, 4]
+        assert capture.find(kind=MESH_PDU_MODEL)[0].payload == b'\x82\x04'
+
+    def test_btp_event_routing(self):
+        """Check routing of events to stack layers and subscribers"""
+
+        data = bytes.fromhex('01' 'ffeeddccbbaa' 'c8' '04' '0000')
+        hdr = Header(defs.BTP_SERVICE_ID_GAP, defs.BTP_GAP_EV_DEVICE_FOUND, 0, len(data))
+        received = []
+
+        def subscriber(*args):
+            received.append(args)
+
+        btp.build_event_routes()
+        btp.reset_event_stats()
+        init_stack()
+        try:
+            # Layer not initialized
+            assert not btp.event_handler(hdr, (data,))
+
+            get_stack().gap_init()
+            btp.subscribe_event(hdr.svc_id, hdr.op, subscriber)
+            assert btp.event_handler(hdr, (data,))
+            assert get_stack().gap.found_devices.data.get(1, b'aabbccddeeff')
+            assert received == [(hdr, data)]
+
+            stats = btp.get_event_stats()[(hdr.svc_id, hdr.op)]
+            assert stats['name'] == 'BTP_GAP_EV_DEVICE_FOUND'
+            assert stats['count'] == 1 and sum(stats['histogram']) == 1
+
+            btp.unsubscribe_event(hdr.svc_id, hdr.op, subscriber)
+            assert btp.event_handler(hdr, (data,))
+            assert len(received) == 1
+        finally:
+            cleanup_stack()
+
+    def test_workspace_index(self):
+        workspace = parse_workspace('autopts/workspaces/zephyr/zephyr-master/zephyr-master.pqw6')
+        assert workspace['name'] == 'zephyr-master'
+        assert 'GAP' in workspace['projects']
+        assert len(workspace['projects']) == len(set(workspace['projects']))
+
+        project = parse_workspace('autopts/workspaces/bluez/bluez.pts')
+        assert 'GAP' in project['projects']
+
+        test_cases_file = 'test/mocks/workspace_test_cases.json'
+        with open(test_cases_file, 'w') as f:
+            json.dump({'GAP': ['GAP/BROB/BCST/BV-01-C', 'GAP/CONN/DCON/BV-01-C'],
+                       'FOO': ['FOO/BAR/BV-01-C']}, f)
+
+        try:
+            index = load_workspace_index('zephyr-master', test_cases_file)
+            assert index is load_workspace_index('zephyr-master', test_cases_file)
+            assert 'GAP' in index.get_project_list()
+            assert 'FOO' in index.get_project_list()
+
+            test_cases = get_test_cases(index, ['GAP/', 'FOO'], ['GAP/CONN'])
+            assert test_cases == ['GAP/BROB/BCST/BV-01-C', 'FOO/BAR/BV-01-C']
+
+            # Changed test case list is indexed again
+            with open(test_cases_file, 'w') as f:
+                json.dump({'GAP': ['GAP/CONN/DCON/BV-01-C', 'GAP/CONN/DCON/BV-02-C']}, f)
+            index = load_workspace_index('zephyr-master', test_cases_file)
+            assert index.get_test_case_list('GAP') == ('GAP/CONN/DCON/BV-01-C',
+                                                       'GAP/CONN/DCON/BV-02-C')
+
+            # Workspace of the remote PTS machine, only the test case list
+            index = load_test_case_index('remote-workspace', test_cases_file)
+            assert index.get_project_list() == ('GAP',)
+        finally:
+            delete_file(test_cases_file)
+
+    def test_test_case_selection(self):
+        assert run_or_not('GAP/SEC/AUT/BV-01-C', [], [])
+        assert run_or_not('GAP/SEC/AUT/BV-01-C', ['GATT', 'GAP/SEC'], ['GAP/SEC/SEM'])
+        assert not run_or_not('GAP/SEC/SEM/BV-01-C', ['GATT', 'GAP/SEC'], ['GAP/SEC/SEM'])
+        assert not run_or_not('GAP/ADV/BV-01-C', ['GATT', 'GAP/SEC'], [])
+        assert not run_or_not('MESH/NODE/TNPT/BV-01-C_LT2', [], [])
+
+        test_cases = ['GAP/ADV/BV-01-C', 'GATT/CL/GAC/BV-01-C', 'GAP/SEC/AUT/BV-01-C',
+                      'L2CAP/LE/CFC/BV-01-C', 'GAP/SEC/AUT/BV-02-C']
+        selected, remaining = distribute_test_cases(test_cases, {
+            'overlay1.conf': ['GAP/SEC', 'GATT', 'GAP/SEC/AUT/BV-01-C'],
+            'overlay2.conf': ['GAP', 'GATT'],
+            'prj.conf': [],
+        })
+        assert selected == {
+            'overlay1.conf': ['GAP/SEC/AUT/BV-01-C', 'GAP/SEC/AUT/BV-02-C', 'GATT/CL/GAC/BV-01-C'],
+            'overlay2.conf': ['GAP/ADV/BV-01-C'],
+            'prj.conf': [],
+        }
+        assert remaining == ['L2CAP/LE/CFC/BV-01-C']
+
+    def test_persistent_iut_session(self):
+        """Check that persistent IUT session is kept over board resets and
+        the BTP capture is closed at the end of each test case
+        """
+        session_log_dir = os.path.join(FILE_PATHS['IUT_LOGS_DIR'], 'persistent_iut')
+        log_dirs = [os.path.join(session_log_dir, f'GAP_TC_{i}') for i in range(2)]
+        for log_dir in log_dirs:
+            os.makedirs(log_dir, exist_ok=True)
+
+        btp_address = os.path.join(tempfile.gettempdir(), f'bt-stack-tester-{os.getpid()}')
+        iut_conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        resets = []
+
+        def fake_iut():
+            # Responds with success to every command
+            with iut_conn:
+                while True:
+                    hdr_data = iut_conn.recv(HDR_LEN, socket.MSG_WAITALL)
+                    if len(hdr_data) < HDR_LEN:
+                        return
+                    hdr = dec_hdr(hdr_data)
+                    if hdr.data_len:
+                        iut_conn.recv(hdr.data_len, socket.MSG_WAITALL)
+                    iut_conn.sendall(enc_frame(hdr.svc_id, hdr.op, hdr.ctrl_index, b''))
+
+        class FakeBoard:
+            def reset(self):
+                resets.append(True)
+                iut_conn.sendall(enc_frame(defs.BTP_SERVICE_ID_CORE,
+                                           defs.BTP_CORE_EV_IUT_READY,
+                                           defs.BTP_INDEX_NONE, b''))
+
+        class FakeTestCase:
+            def __init__(self, log_dir):
+                self.log_dir = log_dir
+                self.name = 'GAP/TC'
+
+        args = Namespace(pylink_reset=False, device_core=None, debugger_snr=None,
+                         kernel_image=None, tty_file=None, board_name=None, hci=None,
+                         gdb=False, persistent_iut=True, rtt_log=False, btmon=False,
+                         btp_log=BTP_LOG_TEXT)
+        zephyrctl = ZephyrCtl(args)
+        # The debugger has to keep the IUT process
+        assert not ZephyrCtl(Namespace(**{**vars(args), 'gdb': True})).persistent_iut
+
+        zephyrctl.board = FakeBoard()
+        zephyrctl.persistent_iut = True
+        zephyrctl.btp_address = btp_address
+
+        # Session as started by the first test case, with fake IUT board
+        zephyrctl.test_case = FakeTestCase(log_dirs[0])
+        zephyrctl.socket_srv = BTPSocketSrv(log_dirs[0])
+        zephyrctl.socket_srv.open(btp_address)
+        zephyrctl.btp_socket = BTPWorker(zephyrctl.socket_srv)
+        iut_conn.connect(btp_address)
+        iut = threading.Thread(target=fake_iut, daemon=True)
+        iut.start()
+        zephyrctl.btp_socket.accept()
+        zephyrctl.is_running = True
+
+        btp.init(lambda: zephyrctl)
+        init_stack()
+        try:
+            get_stack().core_init()
+            btp_socket = zephyrctl.btp_socket
+
+            zephyrctl.stop_test_case()
+            assert zephyrctl.is_running
+            assert resets == [True]
+            # The BTP log is closed before the test case logs are archived
+            with open(os.path.join(log_dirs[0], BTP_LOG_FILE)) as f:
+                assert 'IUT_READY' in f.read()
+            delete_file(log_dirs[0])
+
+            zephyrctl.start(FakeTestCase(log_dirs[1]))
+            assert zephyrctl.btp_socket is btp_socket
+            assert get_stack().core.wait_iut_ready_ev(1)
+            assert os.path.exists(os.path.join(log_dirs[1], BTP_LOG_FILE))
+        finally:
+            zephyrctl.stop()
+            cleanup_stack()
+            iut.join(timeout=5)
+            delete_file(session_log_dir)
+
+        assert not zephyrctl.is_running
+        assert not iut.is_alive()
+
+    def test_persistent_iut_process_restart(self):
+        """Check that QEMU or native IUT process is restarted over the kept
+        BTP socket between test cases
+        """
+        session_log_dir = os.path.join(FILE_PATHS['IUT_LOGS_DIR'], 'persistent_iut_process')
+        log_dirs = [os.path.join(session_log_dir, f'GAP_TC_{i}') for i in range(2)]
+        for log_dir in log_dirs:
+            os.makedirs(log_dir, exist_ok=True)
+
+        btp_address = os.path.join(tempfile.gettempdir(), f'bt-stack-tester-{os.getpid()}')
+        iut_processes = []
+
+        def fake_iut(iut_conn):
+            # Sends IUT ready event at startup, responds with success to
+            # every command
+            with iut_conn:
+                iut_conn.sendall(enc_frame(defs.BTP_SERVICE_ID_CORE,
+                                           defs.BTP_CORE_EV_IUT_READY,
+                                           defs.BTP_INDEX_NONE, b''))
+                while True:
+                    hdr_data = iut_conn.recv(HDR_LEN, socket.MSG_WAITALL)
+                    if len(hdr_data) < HDR_LEN:
+                        return
+                    hdr = dec_hdr(hdr_data)
+                    if hdr.data_len:
+                        iut_conn.recv(hdr.data_len, socket.MSG_WAITALL)
+                    iut_conn.sendall(enc_frame(hdr.svc_id, hdr.op, hdr.ctrl_index, b''))
+
+        def start_iut_process(zephyrctl, log_dir):
+            iut_conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            iut_conn.connect(zephyrctl.btp_address)
+            iut = threading.Thread(target=fake_iut, args=(iut_conn,), daemon=True)
+            iut.start()
+            iut_processes.append((iut_conn, iut))
+
+        def stop_iut_process(zephyrctl):
+            for iut_conn, iut in iut_processes:
+                if iut.is_alive():
+                    iut_conn.shutdown(socket.SHUT_RDWR)
+                    iut.join(timeout=5)
+
+        class FakeTestCase:
+            def __init__(self, log_dir):
+                self.log_dir = log_dir
+                self.name = 'GAP/TC'
+
+        args = Namespace(pylink_reset=False, device_core=None, debugger_snr=None,
+                         kernel_image=None, tty_file=None, board_name=None, hci=None,
+                         gdb=False, persistent_iut=True, rtt_log=False, btmon=False,
+                         btp_log=BTP_LOG_CAPTURE)
+
+        with patch.object(ZephyrCtl, 'start_iut_process', start_iut_process), \
+                patch.object(ZephyrCtl, 'stop_iut_process', stop_iut_process):
+            zephyrctl = ZephyrCtl(args)
+            assert zephyrctl.persistent_iut
+            zephyrctl.btp_address = btp_address
+
+            btp.init(lambda: zephyrctl)
+            init_stack()
+            try:
+                get_stack().core_init()
+                zephyrctl.start(FakeTestCase(log_dirs[0]))
+                assert get_stack().core.wait_iut_ready_ev(1)
+                btp_socket = zephyrctl.btp_socket
+
+                zephyrctl.stop_test_case()
+                assert zephyrctl.is_running
+                assert not iut_processes[0][1].is_alive()
+                delete_file(log_dirs[0])
+
+                zephyrctl.start(FakeTestCase(log_dirs[1]))
+                assert zephyrctl.btp_socket is btp_socket
+                assert len(iut_processes) == 2
+                assert get_stack().core.wait_iut_ready_ev(1)
+                btp.core_reg_svc_gap()
+                zephyrctl.stop_test_case()
+                # Raw frames only, decoded offline
+                assert not os.path.exists(os.path.join(log_dirs[1], BTP_LOG_FILE))
+                frames = [dec_hdr(frame[:HDR_LEN]) for _, _, frame in
+                          read_capture(os.path.join(log_dirs[1], BTP_CAPTURE_FILE))]
+                assert [(hdr.svc_id, hdr.op) for hdr in frames[:2]] == \
+                    [(defs.BTP_SERVICE_ID_CORE, defs.BTP_CORE_EV_IUT_READY),
+                     (defs.BTP_SERVICE_ID_CORE, defs.BTP_CORE_CMD_REGISTER_SERVICE)]
+            finally:
+                zephyrctl.stop()
+                cleanup_stack()
+                delete_file(session_log_dir)
+
+        assert not zephyrctl.is_running
+        assert not any(iut.is_alive() for _, iut in iut_processes)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,158 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Throughput benchmark of BTP event decoding
+
+Dispatches a synthetic trace of the high rate events (GAP Device Found,
+GATT Notification, Mesh Net/Model Receive, BAP Codec Capabilities Found,
+L2CAP Data Received) to the event handlers of autopts.pybtp.btp, with
+the stack layers initialized, as the RX thread does. Debug logging is
+disabled. Reports events/s of the whole trace, and per event both through
+btp.event_handler and of the event's handler alone, which is the decoding
+and the stack update without the dispatch.
+
+Usage:
+$ python3 tools/benchmarks/btp_codec.py [-n EVENTS] [-r ROUNDS]
+"""
+import argparse
+import logging
+import os
+import random
+import struct
+import sys
+import time
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.ptsprojects.stack import init_stack, cleanup_stack, get_stack
+from autopts.pybtp import btp, defs
+from autopts.pybtp.btp.btp import _event_routes
+from autopts.pybtp.parser import Header
+
+L2CAP_CHAN_ID = 0
+
+
+def with_tail(fixed, tail_len):
+    return fixed + os.urandom(tail_len)
+
+
+# (svc_id, opcode) -> (name, synthetic event data generator)
+EVENTS = {
+    (defs.BTP_SERVICE_ID_GAP, defs.BTP_GAP_EV_DEVICE_FOUND): (
+        'GAP Device Found',
+        lambda n: with_tail(struct.pack('<B6sBBH', 0, os.urandom(6), 200, 4, n), n)),
+    (defs.BTP_SERVICE_ID_GATT, defs.BTP_GATT_EV_NOTIFICATION): (
+        'GATT Notification',
+        lambda n: with_tail(struct.pack('<B6sBHH', 0, os.urandom(6), 1, 0x20, n), n)),
+    (defs.BTP_SERVICE_ID_MESH, defs.BTP_MESH_EV_NET_RECV): (
+        'Mesh Net Receive',
+        lambda n: with_tail(struct.pack('<BBHHB', 7, 0, 1, 2, n), n)),
+    (defs.BTP_SERVICE_ID_MESH, defs.BTP_MESH_EV_MODEL_RECV): (
+        'Mesh Model Receive',
+        lambda n: with_tail(struct.pack('<HHB', 1, 2, n), n)),
+    (defs.BTP_SERVICE_ID_BAP, defs.BTP_BAP_EV_CODEC_CAP_FOUND): (
+        'BAP Codec Cap Found',
+        lambda n: struct.pack('<B6sBBHBIB', 0, os.urandom(6), 1, 6, 0xff, 3, 40, 1)),
+    (defs.BTP_SERVICE_ID_L2CAP, defs.BTP_L2CAP_EV_DATA_RECEIVED): (
+        'L2CAP Data Received',
+        lambda n: with_tail(struct.pack('<BH', L2CAP_CHAN_ID, n), n)),
+}
+
+
+def init_layers():
+    cleanup_stack()
+    init_stack()
+    stack = get_stack()
+    stack.gap_init()
+    stack.gatt_init()
+    stack.mesh_init('00' * 16)
+    stack.bap_init()
+    stack.l2cap_init(0x0080, 64)
+    stack.l2cap.connected(L2CAP_CHAN_ID, 0x0080, 64, 64, 64, 64, 0, '000000000000')
+
+
+def generate_trace(count, keys):
+    # Few distinct payloads, the decoding cost does not depend on content
+    samples = {key: [EVENTS[key][1](random.randint(0, 31)) for _ in range(64)]
+               for key in keys}
+
+    trace = []
+    for _ in range(count):
+        key = random.choice(keys)
+        data = random.choice(samples[key])
+        trace.append((Header(key[0], key[1], 0, len(data)), (data,)))
+
+    return trace
+
+
+def measure(trace, rounds):
+    """Returns best events/s of the rounds, with fresh layers each round"""
+    best = 0
+    for _ in range(rounds):
+        init_layers()
+        start = time.perf_counter()
+        for hdr, data in trace:
+            btp.event_handler(hdr, data)
+
+        best = max(best, len(trace) / (time.perf_counter() - start))
+
+    return best
+
+
+def measure_handler(trace, rounds):
+    """Like measure(), but calls the handler of the event directly"""
+    hdr = trace[0][0]
+    route = _event_routes[(hdr.svc_id, hdr.op)]
+    frames = [(data[0], hdr.data_len) for hdr, data in trace]
+
+    best = 0
+    for _ in range(rounds):
+        init_layers()
+        handler = route.handler
+        layer = getattr(get_stack(), route.layer)
+        start = time.perf_counter()
+        for data, data_len in frames:
+            handler(layer, data, data_len)
+
+        best = max(best, len(frames) / (time.perf_counter() - start))
+
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BTP event decoding benchmark')
+    parser.add_argument('-n', '--events', type=int, default=1000000,
+                        help='Number of events of the synthetic trace')
+    parser.add_argument('-r', '--rounds', type=int, default=3,
+                        help='Rounds, the best one is reported')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    random.seed(0)
+    btp.init(lambda: None)
+
+    print(f'events:                   {args.events}')
+    print(f'all, events/s:            '
+          f'{measure(generate_trace(args.events, list(EVENTS)), args.rounds):,.0f}')
+
+    print(f'{"":<26}{"dispatched":>12}{"handler":>12}')
+    for key, (name, _) in EVENTS.items():
+        trace = generate_trace(args.events // len(EVENTS), [key])
+        print(f'{name + ",":<26}{measure(trace, args.rounds):>12,.0f}'
+              f'{measure_handler(trace, args.rounds):>12,.0f}')
+
+    cleanup_stack()
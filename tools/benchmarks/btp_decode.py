@@ -0,0 +1,121 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Micro-benchmark of BTP frame decoding for the BTP log
+
+Compares the per-frame cost of resolving command/event names by scanning
+defs.py, as BTPSocket did for every logged frame, with the lookup tables
+of autopts.pybtp.btp_names. Frames come from a recorded BTP capture
+(autopts-iutctl.btpcap), or from a generated trace if none is given.
+
+Usage:
+$ python3 tools/benchmarks/btp_decode.py [-c CAPTURE_FILE] [-n FRAMES]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.pybtp import defs
+from autopts.pybtp.btp_names import OPCODES, SERVICE_IDS, get_opcode_name
+from autopts.pybtp.iutctl_common import BTPFrameCapture, read_capture, format_frame, \
+    BTP_LOG_CAPTURE, CAPTURE_DIR_RX, CAPTURE_DIR_TX
+from autopts.pybtp.parser import enc_frame, dec_hdr, HDR_LEN
+
+
+def get_name_by_scan(svc_id, op):
+    """Name resolution as done per frame before the lookup tables"""
+    if op == 0:
+        return 'BTP_ERROR'
+
+    svc_name = ''
+    for name, btp_id in SERVICE_IDS.items():
+        if btp_id == svc_id:
+            svc_name = name
+            break
+
+    for key, value in vars(defs).items():
+        if (key.startswith(f'BTP_{svc_name}_CMD_') and value == op) or \
+                (key.startswith(f'BTP_{svc_name}_EV_') and value == op):
+            return key
+
+    return 'BTP Undecoded'
+
+
+def record_trace(path, frames):
+    capture = BTPFrameCapture(path, BTP_LOG_CAPTURE)
+    opcodes = list(OPCODES.values())
+
+    for _ in range(frames):
+        svc_id, op, is_event = random.choice(opcodes)
+        data = os.urandom(random.randint(0, 64))
+        direction = CAPTURE_DIR_RX if is_event else CAPTURE_DIR_TX
+        capture.put(direction, enc_frame(svc_id, op, 0, data))
+
+    capture.close()
+
+
+def measure(records, decode):
+    start = time.perf_counter()
+    for record in records:
+        decode(*record)
+
+    return (time.perf_counter() - start) / len(records)
+
+
+def decode_by_scan(timestamp, direction, frame):
+    hdr = dec_hdr(frame[:HDR_LEN])
+    hex_data = ' '.join(frame.hex()[i:i + 2] for i in range(0, len(frame.hex()), 2))
+    return get_name_by_scan(hdr.svc_id, hdr.op), hex_data
+
+
+def decode_by_table(timestamp, direction, frame):
+    hdr = dec_hdr(frame[:HDR_LEN])
+    return get_opcode_name(hdr.svc_id, hdr.op), frame.hex(' ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BTP frame decoding benchmark')
+    parser.add_argument('-c', '--capture', default=None,
+                        help='Recorded BTP capture file')
+    parser.add_argument('-n', '--frames', type=int, default=20000,
+                        help='Number of frames of the generated trace')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        capture_file = args.capture
+        if not capture_file:
+            capture_file = os.path.join(tmp_dir, 'trace.btpcap')
+            record_trace(capture_file, args.frames)
+
+        records = list(read_capture(capture_file))
+
+    if not records:
+        sys.exit('No frames in the capture')
+
+    scan = measure(records, decode_by_scan)
+    table = measure(records, decode_by_table)
+    full = measure(records, format_frame)
+
+    print(f'frames:                        {len(records)}')
+    print(f'scan defs, us per frame:       {scan * 1e6:.2f}')
+    print(f'lookup table, us per frame:    {table * 1e6:.2f}')
+    print(f'format_frame, us per frame:    {full * 1e6:.2f}')
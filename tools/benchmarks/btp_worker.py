@@ -0,0 +1,111 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Micro-benchmark of BTPWorker.send_wait_rsp round-trips
+
+A thread connected to the BTP Unix socket plays the role of the IUT and
+answers every command with an empty response of the same opcode.
+
+Usage:
+$ python3 tools/benchmarks/btp_worker.py [-n ROUND_TRIPS]
+"""
+import argparse
+import os
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.pybtp import defs
+from autopts.pybtp.iutctl_common import BTPSocketSrv, BTPWorker
+from autopts.pybtp.parser import HDR_LEN
+
+
+def recv_exact(conn, length):
+    buf = bytearray()
+    while len(buf) < length:
+        chunk = conn.recv(length - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return bytes(buf)
+
+
+def iut_stand_in(address):
+    """Echo an empty response for every received BTP command"""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(address)
+
+    while True:
+        hdr = recv_exact(conn, HDR_LEN)
+        if hdr is None:
+            break
+
+        svc_id, op, ctrl_index, data_len = struct.unpack('<BBBH', hdr)
+        if data_len and recv_exact(conn, data_len) is None:
+            break
+
+        conn.sendall(struct.pack('<BBBH', svc_id, op, ctrl_index, 0))
+
+    conn.close()
+
+
+def run(round_trips):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        address = os.path.join(tmp_dir, 'bt-stack-tester')
+
+        socket_srv = BTPSocketSrv(tmp_dir)
+        socket_srv.open(address)
+        worker = BTPWorker(socket_srv)
+
+        iut = threading.Thread(target=iut_stand_in, args=(address,), daemon=True)
+        iut.start()
+        worker.accept()
+
+        start_cpu = time.process_time()
+        start_wall = time.perf_counter()
+
+        for _ in range(round_trips):
+            worker.send_wait_rsp(defs.BTP_SERVICE_ID_CORE,
+                                 defs.BTP_CORE_CMD_READ_SUPPORTED_COMMANDS,
+                                 defs.BTP_INDEX_NONE, '')
+
+        cpu = time.process_time() - start_cpu
+        wall = time.perf_counter() - start_wall
+
+        worker.close()
+        iut.join(timeout=5)
+
+    return cpu, wall
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BTPWorker round-trip benchmark')
+    parser.add_argument('-n', '--round-trips', type=int, default=1000,
+                        help='Number of send_wait_rsp round-trips')
+    args = parser.parse_args()
+
+    cpu, wall = run(args.round_trips)
+    scale = 1000 / args.round_trips
+
+    print(f'round-trips:            {args.round_trips}')
+    print(f'CPU seconds per 1000:   {cpu * scale:.4f}')
+    print(f'wall seconds per 1000:  {wall * scale:.4f}')
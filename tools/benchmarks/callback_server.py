@@ -0,0 +1,227 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Load benchmark of the client callback server
+
+Replays a stream of PTS callbacks of 3 lower testers, each to its own
+callback server as in a multi-LT test case: a flood of log callbacks from
+several PTS threads and the on_implicit_send WIDs. Reports p50/p99 of the
+WID response latency with the single-threaded server used before, and
+with ClientCallbackServer.
+
+The stream can be read from a JSON lines file, one callback per line:
+{"lt": 0, "method": "log", "params": [...]}
+{"lt": 0, "method": "on_implicit_send", "params": [...]}
+
+Usage:
+$ python3 tools/benchmarks/callback_server.py [-r STREAM_FILE] [-w WIDS] [-l LOGS_PER_WID]
+    [--log_rate LOGS_PER_SECOND]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import xmlrpc.client
+from os.path import dirname, abspath
+from xmlrpc.server import SimpleXMLRPCServer
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts import client
+from autopts.client import ClientCallback, ClientCallbackServer
+from autopts.ptsprojects import ptstypes
+
+LT_COUNT = 3
+LOG_THREADS = 4
+BASE_PORT = 65301
+TEST_CASE_NAME = 'GAP/BENCH/BV-01-C'
+
+
+class LegacyClientCallback(ClientCallback):
+    """Callbacks writing every log right away"""
+
+    def log(self, log_type, logtype_string, log_time, log_message,
+            test_case_name):
+        logger = logging.getLogger("{}.{}".format(self.__class__.__name__,
+                                                  self.log.__name__))
+        logger.info("%s %s %s %s %s", ptstypes.PTS_LOGTYPE_STRING[log_type],
+                    logtype_string, log_time, test_case_name,
+                    log_message)
+
+
+class LegacyClientCallbackServer(ClientCallbackServer):
+    """Single-threaded callback server"""
+
+    def __init__(self, port, name):
+        super().__init__(port, name)
+        self.callback = LegacyClientCallback()
+
+    def run(self):
+        self.server = SimpleXMLRPCServer(("", self.port),
+                                         allow_none=True, logRequests=False)
+        self.server.register_instance(self.callback)
+        self.server.timeout = 0.1
+
+        try:
+            while not self.end:
+                self.server.handle_request()
+        finally:
+            self.server.server_close()
+
+
+class FakeTestCase:
+    def on_implicit_send(self, *args):
+        pass
+
+
+def generate_stream(wids, logs_per_wid):
+    stream = []
+    message = 'x' * 200
+
+    for lt in range(LT_COUNT):
+        for wid in range(wids):
+            for i in range(logs_per_wid):
+                stream.append({'lt': lt, 'method': 'log',
+                               'params': [4, 'GENERAL_TEXT', '12:00:00', message,
+                                          TEST_CASE_NAME]})
+            stream.append({'lt': lt, 'method': 'on_implicit_send',
+                           'params': ['GAP', wid, TEST_CASE_NAME, 'Description',
+                                      ptstypes.MMI_Style_Ok]})
+
+    return stream
+
+
+def send_logs(lt, calls, interval):
+    proxy = xmlrpc.client.ServerProxy(f'http://127.0.0.1:{BASE_PORT + lt}/', allow_none=True)
+    next_time = time.perf_counter()
+    for call in calls:
+        proxy.log(*call['params'])
+        if interval:
+            next_time += interval
+            time.sleep(max(0.0, next_time - time.perf_counter()))
+
+
+def send_wids(lt, calls, latencies):
+    proxy = xmlrpc.client.ServerProxy(f'http://127.0.0.1:{BASE_PORT + lt}/', allow_none=True)
+    for call in calls:
+        start = time.perf_counter()
+        proxy.on_implicit_send(*call['params'])
+        latencies.append(time.perf_counter() - start)
+        # PTS waits for the response before the next WID
+        time.sleep(0.01)
+
+
+def run_lt(lt, stream, log_rate, results):
+    """Sends callbacks of one lower tester, like a remote PTS would"""
+    logs = [call for call in stream if call['lt'] == lt and call['method'] == 'log']
+    wids = [call for call in stream if call['lt'] == lt and call['method'] == 'on_implicit_send']
+    latencies = []
+
+    interval = LOG_THREADS / log_rate if log_rate else 0
+    threads = [threading.Thread(target=send_logs, args=(lt, logs[i::LOG_THREADS], interval))
+               for i in range(LOG_THREADS)]
+    threads.append(threading.Thread(target=send_wids, args=(lt, wids, latencies)))
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    results.put(latencies)
+
+
+def replay(server_class, stream, log_rate):
+    servers = []
+    for lt in range(LT_COUNT):
+        server = server_class(BASE_PORT + lt, f'LT{lt + 1}-callback')
+        server.start()
+        servers.append(server)
+
+    # Wait until the servers listen
+    time.sleep(0.5)
+
+    # The callbacks are sent from other processes, so the clients do not
+    # compete with the servers for the GIL
+    results = multiprocessing.Queue()
+    senders = [multiprocessing.Process(target=run_lt, args=(lt, stream, log_rate, results))
+               for lt in range(LT_COUNT)]
+
+    start = time.perf_counter()
+    for sender in senders:
+        sender.start()
+
+    latencies = []
+    for _ in senders:
+        latencies.extend(results.get())
+
+    for sender in senders:
+        sender.join()
+    duration = time.perf_counter() - start
+
+    for server in servers:
+        server.stop()
+    for server in servers:
+        server.join()
+
+    return latencies, duration
+
+
+def report(name, latencies, duration):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f'{name}:')
+    print(f'  WIDs:              {len(latencies)}')
+    print(f'  stream replay, s:  {duration:.2f}')
+    print(f'  p50 latency, ms:   {quantiles[49] * 1e3:.2f}')
+    print(f'  p99 latency, ms:   {quantiles[98] * 1e3:.2f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Client callback server load benchmark')
+    parser.add_argument('-r', '--stream', default=None,
+                        help='Recorded callback stream, JSON lines')
+    parser.add_argument('-w', '--wids', type=int, default=100,
+                        help='WIDs per lower tester of the generated stream')
+    parser.add_argument('-l', '--logs_per_wid', type=int, default=50,
+                        help='Log callbacks per WID of the generated stream')
+    parser.add_argument('--log_rate', type=float, default=0,
+                        help='Log callbacks per second of each lower tester, '
+                             'as fast as possible if 0')
+    args = parser.parse_args()
+
+    if args.stream:
+        with open(args.stream) as f:
+            stream = [json.loads(line) for line in f if line.strip()]
+    else:
+        stream = generate_stream(args.wids, args.logs_per_wid)
+
+    client.RUNNING_TEST_CASE[TEST_CASE_NAME] = FakeTestCase()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        logging.basicConfig(filename=os.path.join(tmp_dir, 'bench.log'),
+                            level=logging.DEBUG, force=True)
+
+        for name, server_class in (('single-threaded server', LegacyClientCallbackServer),
+                                   ('ClientCallbackServer', ClientCallbackServer)):
+            latencies, duration = replay(server_class, stream, args.log_rate)
+            report(name, latencies, duration)
+
+        logging.shutdown()
@@ -0,0 +1,200 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Benchmark of test case selection of the bot
+
+Filters a synthetic workspace with -c/-e prefixes and distributes the test
+cases among .conf files, with the startswith() loops and list copies used
+before, and with the prefix tries of client.TestCaseFilter and
+bot.common.distribute_test_cases(). The results of both are first checked
+to be identical on the iut_config samples of test/mocks and on the
+synthetic workspace.
+
+Usage:
+$ python3 tools/benchmarks/test_case_selection.py [-n TEST_CASES] [-p EXPLICIT_TEST_CASES]
+    [-r ROUNDS]
+"""
+import argparse
+import copy
+import random
+import sys
+import time
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.bot.common import distribute_test_cases
+from autopts.client import TestCaseFilter, test_case_blacklist
+from test.mocks.mocked_test_cases import mock_workspace_test_cases, test_case_list_generation_samples
+
+PROFILES = ['GAP', 'GATT', 'L2CAP', 'SM', 'MESH', 'BAP', 'CAP', 'CSIP', 'VCP',
+            'MICP', 'HAP', 'TMAP', 'PBP', 'GMCS', 'MCP', 'CCP', 'TBS', 'ASCS',
+            'PACS', 'BASS', 'IAS', 'HRS', 'DIS', 'BAS', 'HOGP', 'SCPP', 'OTS',
+            'GTBS', 'GMAP', 'PXP']
+CONFIG_DEFAULT = 'prj.conf'
+
+
+def legacy_run_or_not(test_case_name, test_cases, excluded):
+    for entry in test_case_blacklist:
+        if entry in test_case_name:
+            return False
+
+    if excluded:
+        for n in excluded:
+            if test_case_name.startswith(n):
+                return False
+
+    if test_cases:
+        for n in test_cases:
+            if test_case_name.startswith(n):
+                return True
+
+        return False
+
+    return True
+
+
+def legacy_distribute(filtered_test_cases, iut_config, distribution_order):
+    selected = {}
+    remaining_test_cases = copy.deepcopy(filtered_test_cases)
+    for config in distribution_order:
+        value = iut_config[config]
+        if 'test_cases' not in value:
+            continue
+
+        selected[config] = []
+
+        for prefix in value['test_cases']:
+            for tc in filtered_test_cases:
+                if tc.startswith(prefix):
+                    selected[config].append(tc)
+                    remaining_test_cases.remove(tc)
+
+            filtered_test_cases = copy.deepcopy(remaining_test_cases)
+
+    return selected, filtered_test_cases
+
+
+def trie_distribute(filtered_test_cases, iut_config, distribution_order):
+    return distribute_test_cases(filtered_test_cases,
+                                 {config: iut_config[config]['test_cases']
+                                  for config in distribution_order
+                                  if 'test_cases' in iut_config[config]})
+
+
+def legacy_select(workspace, included, excluded, iut_config, distribution_order):
+    test_cases = [tc for tcs in workspace.values() for tc in tcs
+                  if legacy_run_or_not(tc, included, excluded)]
+
+    return legacy_distribute(test_cases, iut_config, distribution_order)
+
+
+def trie_select(workspace, included, excluded, iut_config, distribution_order):
+    test_case_filter = TestCaseFilter(included, excluded)
+    test_cases = [tc for tcs in workspace.values() for tc in tcs
+                  if test_case_filter(tc)]
+
+    return trie_distribute(test_cases, iut_config, distribution_order)
+
+
+def get_distribution_order(iut_config):
+    distribution_order = list(iut_config)
+    if CONFIG_DEFAULT in distribution_order:
+        distribution_order.remove(CONFIG_DEFAULT)
+        distribution_order.append(CONFIG_DEFAULT)
+
+    return distribution_order
+
+
+def generate_workspace(count):
+    workspace = {profile: [] for profile in PROFILES}
+    groups = {profile: [f'{profile}/{role}/{random.choice("ABCDEFGHIJ")}{i:02d}'
+                        for role in ('CL', 'SR') for i in range(12)]
+              for profile in PROFILES}
+
+    for i in range(count):
+        profile = random.choice(PROFILES)
+        workspace[profile].append(f'{random.choice(groups[profile])}/'
+                                  f'{random.choice(("BV", "BI"))}-{i:05d}-C')
+
+    return workspace
+
+
+def generate_iut_config(workspace, explicit):
+    """Overlays with profile and group prefixes, overlapping, and one with
+    explicit test case names like bot configs of the nightly runs have
+    """
+    all_test_cases = [tc for tcs in workspace.values() for tc in tcs]
+    groups = sorted({tc.rsplit('/', 1)[0] for tc in all_test_cases})
+
+    iut_config = {CONFIG_DEFAULT: {}}
+    for i in range(8):
+        prefixes = random.sample(PROFILES, 3) + random.sample(groups, 20)
+        iut_config[f'overlay{i}.conf'] = {'test_cases': prefixes}
+
+    iut_config['explicit.conf'] = {'test_cases': random.sample(all_test_cases, explicit)}
+
+    return iut_config
+
+
+def measure(select, rounds, *args):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        select(*args)
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+
+    return best
+
+
+def check_fixtures():
+    for i, (iut_config, _) in enumerate(test_case_list_generation_samples, 1):
+        args = (mock_workspace_test_cases, [], [], iut_config, get_distribution_order(iut_config))
+        if legacy_select(*args) != trie_select(*args):
+            sys.exit(f'mock_iut_config_{i}: results differ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Test case selection benchmark')
+    parser.add_argument('-n', '--test_cases', type=int, default=10000,
+                        help='Test cases of the synthetic workspace')
+    parser.add_argument('-p', '--explicit', type=int, default=1000,
+                        help='Explicit test case names in the iut_config')
+    parser.add_argument('-r', '--rounds', type=int, default=3,
+                        help='Rounds, the best one is reported')
+    args = parser.parse_args()
+
+    random.seed(0)
+    check_fixtures()
+
+    workspace = generate_workspace(args.test_cases)
+    iut_config = generate_iut_config(workspace, args.explicit)
+    included = random.sample(PROFILES, 20)
+    excluded = [f'{profile}/SR/' for profile in random.sample(included, 5)]
+    select_args = (workspace, included, excluded, iut_config,
+                   get_distribution_order(iut_config))
+
+    if legacy_select(*select_args) != trie_select(*select_args):
+        sys.exit('Synthetic workspace: results differ')
+
+    legacy = measure(legacy_select, args.rounds, *select_args)
+    trie = measure(trie_select, args.rounds, *select_args)
+
+    print(f'test cases:         {args.test_cases}')
+    print(f'prefixes:           {sum(len(v.get("test_cases", [])) for v in iut_config.values())}')
+    print(f'startswith, ms:     {legacy * 1e3:.1f}')
+    print(f'trie, ms:           {trie * 1e3:.1f}')
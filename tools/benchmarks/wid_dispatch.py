@@ -0,0 +1,112 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Benchmark of WID handler lookup
+
+Measures the time to build the dispatch tables of all the fallback chains
+of a project's *_wid modules, and the per-WID lookup latency of the tables
+compared with the importlib/hasattr scan of the fallback chain, as done by
+_generic_wid_hdl before the tables. Handlers are looked up, not called.
+
+Usage:
+$ python3 tools/benchmarks/wid_dispatch.py [-p zephyr] [-n ROUNDS]
+"""
+import argparse
+import importlib
+import importlib.util
+import pkgutil
+import sys
+import time
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.wid import wid
+
+
+def get_hdl_by_scan(wid_num, module_names):
+    """Handler lookup as done per WID before the dispatch tables"""
+    wid_str = f'hdl_wid_{wid_num}'
+
+    for module_name in module_names:
+        module = importlib.import_module(module_name)
+        if hasattr(module, wid_str):
+            return getattr(module, wid_str)
+
+    return None
+
+
+def get_chains(project):
+    """Returns fallback chains of the project *_wid modules, the project
+    module followed by the generic profile module, if it exists
+    """
+    package_name = f'autopts.ptsprojects.{project}'
+    package = importlib.import_module(package_name)
+    chains = []
+
+    for module_info in pkgutil.iter_modules(package.__path__):
+        if not module_info.name.endswith('_wid'):
+            continue
+
+        chain = [f'{package_name}.{module_info.name}']
+        profile = module_info.name[:-len('_wid')]
+        if importlib.util.find_spec(f'autopts.wid.{profile}'):
+            chain.append(f'autopts.wid.{profile}')
+
+        for module_name in chain:
+            importlib.import_module(module_name)
+
+        chains.append(chain)
+
+    return chains
+
+
+def measure(lookups, lookup, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for wid_num, chain in lookups:
+            lookup(wid_num, chain)
+
+    return (time.perf_counter() - start) / (rounds * len(lookups))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='WID dispatch benchmark')
+    parser.add_argument('-p', '--project', default='zephyr',
+                        help='Project with the *_wid modules')
+    parser.add_argument('-n', '--rounds', type=int, default=20,
+                        help='Number of lookups of every implemented WID')
+    args = parser.parse_args()
+
+    chains = get_chains(args.project)
+
+    start = time.perf_counter()
+    lookups = []
+    for chain in chains:
+        lookups.extend((wid_num, chain) for wid_num in wid.get_implemented_wids(chain))
+    startup = time.perf_counter() - start
+
+    if not lookups:
+        sys.exit('No WID handlers found')
+
+    scan = measure(lookups, get_hdl_by_scan, args.rounds)
+    table = measure(lookups, wid.get_wid_hdl, args.rounds)
+
+    print(f'chains:                        {len(chains)}')
+    print(f'implemented WIDs:              {len(lookups)}')
+    print(f'tables build, ms:              {startup * 1e3:.2f}')
+    print(f'importlib scan, us per WID:    {scan * 1e6:.2f}')
+    print(f'dispatch table, us per WID:    {table * 1e6:.2f}')
@@ -0,0 +1,45 @@
+#
+# auto-pts - The Bluetooth PTS Automation Framework
+#
+# Copyright (c) 2024, Codecoup.
+#
+# This program is free software; you can redistribute it and/or modify it
+# under the terms and conditions of the GNU General Public License,
+# version 2, as published by the Free Software Foundation.
+#
+# This program is distributed in the hope it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or
+# FITNESS FOR A PARTICULAR PURPOSE.  See the GNU General Public License for
+# more details.
+#
+
+"""Decode BTP capture file (autopts-iutctl.btpcap) into readable BTP log
+
+Usage:
+$ python3 tools/btp_capture_decode.py path/to/autopts-iutctl.btpcap [-o autopts-iutctl.log]
+"""
+import argparse
+import sys
+from os.path import dirname, abspath
+
+AUTOPTS_REPO = dirname(dirname(abspath(__file__)))
+sys.path.insert(0, AUTOPTS_REPO)
+
+from autopts.pybtp.iutctl_common import read_capture, format_frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BTP capture decoder')
+    parser.add_argument('capture_file', help='BTP capture file')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Output log file, stdout by default')
+    args = parser.parse_args()
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+
+    try:
+        for record in read_capture(args.capture_file):
+            out.write(format_frame(*record))
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -31,6 +31,7 @@ from distutils.spawn import find_executable
 
 from autopts.pybtp import btp
 from autopts.pybtp import defs
+from autopts.pybtp.btp_names import SERVICE_IDS, get_opcode_name
 from autopts.pybtp.iutctl_common import BTPSocket
 from autopts.ptsprojects.zephyr.iutctl import get_qemu_cmd, BTP_ADDRESS
 from autopts.ptsprojects.testcase import AbstractMethodException
@@ -557,8 +558,8 @@ def parse_service_id(svc_id):
     """Parse service ID specified as string.
 
     Return -- integer service ID"""
-    service_ids = {item: getattr(defs, item) for item in dir(defs)
-                   if item.startswith("BTP_SERVICE_ID")}
+    service_ids = {f'BTP_SERVICE_ID_{name}': svc_id
+                   for name, svc_id in SERVICE_IDS.items()}
     try:
         int_svc_id = int(svc_id)
     except ValueError:
@@ -701,9 +702,9 @@ def receive(exp_svc_id=None, exp_op=None):
 
     # default __repr__ of namedtuple does not print hex
     print(
-        "Received header(svc_id=%d, op=0x%.2x, ctrl_index=%d, data_len=%d)" %
+        "Received header(svc_id=%d, op=0x%.2x, ctrl_index=%d, data_len=%d) %s" %
         (tuple_hdr.svc_id, tuple_hdr.op, tuple_hdr.ctrl_index,
-         tuple_hdr.data_len))
+         tuple_hdr.data_len, get_opcode_name(tuple_hdr.svc_id, tuple_hdr.op)))
 
     hex_str = binascii.hexlify(tuple_data[0])
     hex_str_byte = " ".join(hex_str[i:i + 2]
@@ -16,9 +16,10 @@ import os
 import sys
 import logging
 from datetime import timedelta
-from tools.cron.common import parse_yaml, catch_exceptions, load_config
-from autopts.client import run_or_not
+from tools.cron.common import catch_exceptions, load_config
+from autopts.client import get_test_cases
 from autopts.ptsprojects.testcase_db import TestCaseTable
+from autopts.ptsprojects.workspace_index import load_test_case_index
 from tools.cron.remote_terminal import RemoteTerminalClientProxy
 
 log = logging.info
@@ -77,21 +78,22 @@ def update_cached_test_cases_job(cfg, **kwargs):
     log(f'The {update_cached_test_cases_job.__name__} Job finished')
 
 
-def estimate_test_cases(config, included, excluded):
-    profiles = parse_yaml(config['cron']['test_case_estimation']['cache_file_path'])
-    test_cases = []
+def get_workspace_index(config):
+    estimation_config = config['cron']['test_case_estimation']
+
+    return load_test_case_index(config['auto_pts'].get('workspace'),
+                                estimation_config['cache_file_path'],
+                                estimation_config.get('index_file_path'))
 
-    for profile in profiles:
-        for tc in profiles[profile]:
-            if run_or_not(tc, included, excluded):
-                test_cases.append(tc)
 
-    return test_cases
+def estimate_test_cases(config, included, excluded):
+    return get_test_cases(get_workspace_index(config), included, excluded)
 
 
 def estimate_test_cases_duration(database_file, table_name, test_cases, max_count):
     database = TestCaseTable(table_name, database_file)
     est_duration = database.estimate_session_duration(test_cases, max_count)
+    database.close()
     return est_duration
 
 
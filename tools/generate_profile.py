@@ -238,14 +238,14 @@ def {profile_name_lower}_ev_dummy_completed({profile_name_lower}, data, data_len
     # START of autopts/ptsprojects/stack/layers/profile.py
     f'{AUTOPTS_REPO}/autopts/ptsprojects/stack/layers/{profile_name_lower}.py':
 f"""{license_text}
-from autopts.ptsprojects.stack.common import wait_for_queue_event
+from autopts.ptsprojects.stack.common import EventQueue, wait_for_queue_event
 from autopts.pybtp import defs
 
 
 class {profile_name_upper}:
     def __init__(self):
         self.event_queues = {'{'}
-            defs.BTP_{profile_name_upper}_EV_DUMMY_COMPLETED: [],
+            defs.BTP_{profile_name_upper}_EV_DUMMY_COMPLETED: EventQueue(),
         {'}'}
 
     def event_received(self, event_type, event_data):
@@ -322,7 +322,7 @@ changes_to_prepend = {
 
 """,
         2: f"from .{profile_name_lower} import {profile_name_upper}_EV\n",
-        3: f"        defs.BTP_SERVICE_ID_{profile_name_upper}: ({profile_name_upper}_EV, stack.{profile_name_lower}),\n",
+        3: f"    defs.BTP_SERVICE_ID_{profile_name_upper}: ({profile_name_upper}_EV, '{profile_name_lower}'),\n",
         4: f"    \"{profile_name_lower}_reg\": (defs.BTP_SERVICE_ID_CORE, defs.BTP_CORE_CMD_REGISTER_SERVICE,\n"
            f"                defs.BTP_INDEX_NONE, defs.BTP_SERVICE_ID_{profile_name_upper}),\n",
     },